@@ -0,0 +1,330 @@
+"""Adaptive admission control and load shedding.
+
+Requests are sorted into priority classes by method and route template.
+Every route has its own concurrency limit, and all limited requests also
+share one global limit. Both adapt to latency with a gradient rule: each
+finished request reports how much slower it ran than its route's unloaded
+baseline, and while that inflation stays within ``tolerance`` a limit grows
+by about its square root per window of samples; beyond it, the limit shrinks
+in proportion (at most halving). The baseline only learns from requests that
+ran while the server was lightly loaded, so sustained overload cannot pass
+itself off as normal.
+
+A request that finds no free slot waits in one queue, ordered by class and
+then arrival, for at most its class's ``max_wait``. When the queue is full a
+request displaces the newest waiter of a lower class, or is turned away
+itself. Turned-away requests get an immediate 503 with ``Retry-After``
+instead of piling up behind the database connection pool.
+"""
+import asyncio
+import bisect
+import itertools
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class PriorityClass:
+    name: str
+    # Lower ranks are served first and shed last
+    rank: int
+    # Seconds a request may queue for a slot before it is shed
+    max_wait: float
+    # Unlimited classes bypass admission entirely
+    limited: bool = True
+
+
+PRIORITY_CLASSES = {
+    # Cheap in-memory answers that must stay fast under any load
+    "critical": PriorityClass("critical", 0, 0.0, limited=False),
+    "catalog": PriorityClass("catalog", 1, 1.0),
+    "write": PriorityClass("write", 2, 0.25),
+    # Long-running transfers never queue
+    "bulk": PriorityClass("bulk", 3, 0.0),
+}
+
+# (method, route template, class); "*" matches any method and the first match wins.
+# Other GETs are catalog reads, other methods writes.
+ROUTE_CLASSES: Sequence[Tuple[str, str, str]] = (
+    ("GET", "/api/", "critical"),
+    ("GET", "/api/categories", "critical"),
+    ("POST", "/api/products/bulk", "bulk"),
+    ("GET", "/api/products/export", "bulk"),
+    ("POST", "/api/products/batch", "catalog"),
+    ("*", "/api/status", "write"),
+)
+
+# Fixed ceilings for routes whose requests hold a slot for a long time
+ROUTE_LIMITS = {
+    "POST /api/products/bulk": 2,
+    "GET /api/products/export": 4,
+}
+
+OVERLOADED_BODY = b'{"detail":"Server is overloaded, retry later"}'
+
+
+class Overloaded(Exception):
+    """The request was shed; ``reason`` is one of no_slot, queue_full, displaced or timeout."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class GradientLimit:
+    """A concurrency limit driven by latency inflation.
+
+    Inflation samples are averaged over ``window`` requests; the limit is
+    adjusted once per window and left alone while less than half of it is in
+    use, since latency then says nothing about how much more it could take.
+    """
+
+    def __init__(self, initial: float, min_limit: float = 1, max_limit: float = 1000,
+                 tolerance: float = 2.0, smoothing: float = 0.2, window: int = 20):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.window = window
+        self.in_flight = 0
+        self._inflation = 0.0
+        self._samples = 0
+
+    @property
+    def available(self) -> bool:
+        return self.in_flight < max(1, int(self.limit))
+
+    def observe(self, inflation: float) -> bool:
+        """Record one request's inflation; return whether the limit was adjusted."""
+        self._inflation += inflation
+        self._samples += 1
+        if self._samples < self.window:
+            return False
+        inflation = self._inflation / self._samples
+        self._inflation, self._samples = 0.0, 0
+        if self.in_flight * 2 < self.limit:
+            return False
+        gradient = max(0.5, min(1.0, self.tolerance / inflation))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        limit = (1 - self.smoothing) * self.limit + self.smoothing * target
+        self.limit = min(self.max_limit, max(self.min_limit, limit))
+        return True
+
+
+class _Route:
+    __slots__ = ("limit", "baseline", "samples")
+
+    def __init__(self, limit: GradientLimit):
+        self.limit = limit
+        # Unloaded latency, in seconds
+        self.baseline: Optional[float] = None
+        self.samples = 0
+
+
+class _Waiter:
+    __slots__ = ("key", "route", "priority", "future")
+
+    def __init__(self, key: Tuple[int, int], route: _Route, priority: PriorityClass):
+        self.key = key
+        self.route = route
+        self.priority = priority
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class Ticket:
+    """An admitted request's slot; hand it back to ``AdmissionController.release``."""
+    __slots__ = ("route", "started")
+
+    def __init__(self, route: _Route):
+        self.route = route
+        self.started = time.perf_counter()
+
+
+class AdmissionController:
+    # Baselines learn from this many first samples regardless of load
+    WARMUP_SAMPLES = 20
+    # Weight of each quiet-time sample in a route's baseline
+    BASELINE_ALPHA = 0.02
+
+    def __init__(self, initial_limit: int = 64, min_limit: int = 4, max_limit: int = 512,
+                 max_queue: int = 256, tolerance: float = 2.0,
+                 route_limits: Optional[Dict[str, int]] = None,
+                 classes: Optional[Dict[str, PriorityClass]] = None,
+                 rules: Iterable[Tuple[str, str, str]] = ROUTE_CLASSES):
+        self.initial_limit = initial_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.tolerance = tolerance
+        self.route_limits = {**ROUTE_LIMITS, **(route_limits or {})}
+        self.classes = classes or PRIORITY_CLASSES
+        self.rules = tuple(rules)
+        self.limit = GradientLimit(initial_limit, min_limit, max_limit, tolerance)
+        self._routes: Dict[str, _Route] = {}
+        self._queue: List[_Waiter] = []
+        self._sequence = itertools.count()
+        # Mean service time, for Retry-After
+        self._latency = 0.0
+        self.outcomes: Counter = Counter()
+
+    def classify(self, method: str, route: str) -> PriorityClass:
+        for rule_method, rule_route, name in self.rules:
+            if rule_route == route and rule_method in ("*", method):
+                return self.classes[name]
+        return self.classes["catalog" if method in ("GET", "HEAD") else "write"]
+
+    def _route(self, key: str) -> _Route:
+        route = self._routes.get(key)
+        if route is None:
+            ceiling = self.route_limits.get(key, self.max_limit)
+            route = self._routes[key] = _Route(GradientLimit(
+                min(self.initial_limit, ceiling), 1, ceiling, self.tolerance))
+        return route
+
+    def _retry_after(self) -> int:
+        slots = max(1.0, self.limit.limit)
+        return max(1, math.ceil(len(self._queue) * self._latency / slots))
+
+    def _take(self, route: _Route) -> Ticket:
+        self.limit.in_flight += 1
+        route.limit.in_flight += 1
+        return Ticket(route)
+
+    def _shed(self, priority: PriorityClass, reason: str) -> Overloaded:
+        self.outcomes[priority.name, f"shed_{reason}"] += 1
+        return Overloaded(reason, self._retry_after())
+
+    async def acquire(self, route_key: str, priority: PriorityClass) -> Ticket:
+        """Wait for a slot on ``route_key``; raise ``Overloaded`` if the request is shed."""
+        route = self._route(route_key)
+        if (self.limit.available and route.limit.available
+                and not any(waiter.route is route for waiter in self._queue)):
+            self.outcomes[priority.name, "admitted"] += 1
+            return self._take(route)
+        if priority.max_wait <= 0:
+            raise self._shed(priority, "no_slot")
+        if len(self._queue) >= self.max_queue:
+            last = self._queue[-1]
+            if last.priority.rank <= priority.rank:
+                raise self._shed(priority, "queue_full")
+            self._queue.pop()
+            self.outcomes[last.priority.name, "shed_displaced"] += 1
+            last.future.set_result(False)
+
+        waiter = _Waiter((priority.rank, next(self._sequence)), route, priority)
+        bisect.insort(self._queue, waiter, key=lambda queued: queued.key)
+        try:
+            await asyncio.wait((waiter.future,), timeout=priority.max_wait)
+        except asyncio.CancelledError:
+            if waiter.future.done():
+                if waiter.future.result():
+                    self.release(Ticket(route), observe=False)
+            else:
+                waiter.future.cancel()
+                self._queue.remove(waiter)
+            raise
+        if not waiter.future.done():
+            waiter.future.cancel()
+            self._queue.remove(waiter)
+            raise self._shed(priority, "timeout")
+        if not waiter.future.result():
+            raise Overloaded("displaced", self._retry_after())
+        self.outcomes[priority.name, "queued"] += 1
+        return Ticket(route)
+
+    def release(self, ticket: Ticket, observe: bool = True):
+        route = ticket.route
+        self.limit.in_flight -= 1
+        route.limit.in_flight -= 1
+        if observe:
+            self._observe(route, time.perf_counter() - ticket.started)
+        self._dispatch()
+
+    def _observe(self, route: _Route, latency: float):
+        self._latency += (latency - self._latency) * 0.05
+        # Requests running alongside few others show what the route costs unloaded
+        quiet = (self.limit.in_flight * 2 < self.limit.limit
+                 and route.limit.in_flight * 2 < route.limit.limit)
+        if route.baseline is None:
+            route.baseline = latency
+        elif route.samples < self.WARMUP_SAMPLES:
+            route.baseline += (latency - route.baseline) / (route.samples + 1)
+        elif quiet:
+            route.baseline += (latency - route.baseline) * self.BASELINE_ALPHA
+        route.samples += 1
+        inflation = latency / max(route.baseline, 1e-4)
+        route.limit.observe(inflation)
+        self.limit.observe(inflation)
+
+    def _dispatch(self):
+        """Hand free slots to queued requests in priority order."""
+        for waiter in list(self._queue):
+            if not self.limit.available:
+                return
+            if not waiter.route.limit.available:
+                continue
+            self._queue.remove(waiter)
+            self._take(waiter.route)
+            waiter.future.set_result(True)
+
+    def stats(self) -> dict:
+        queued = Counter(waiter.priority.name for waiter in self._queue)
+        return {
+            "limit": round(self.limit.limit, 1),
+            "in_flight": self.limit.in_flight,
+            "queued": dict(queued),
+            "routes": {
+                key: {"limit": round(route.limit.limit, 1), "in_flight": route.limit.in_flight,
+                      "baseline_ms": round(route.baseline * 1000, 3) if route.baseline is not None else None}
+                for key, route in sorted(self._routes.items())
+            },
+            "outcomes": {f"{name}:{outcome}": count for (name, outcome), count in sorted(self.outcomes.items())},
+        }
+
+
+class AdmissionMiddleware:
+    """Admit, queue or shed each HTTP request through ``controller``.
+
+    ``route`` maps an ASGI scope to its route template.
+    """
+
+    def __init__(self, app, controller: AdmissionController, route: Callable[[dict], str],
+                 exclude: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.controller = controller
+        self.route = route
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = self.route(scope)
+        priority = self.controller.classify(method, route)
+        if not priority.limited:
+            await self.app(scope, receive, send)
+            return
+        try:
+            ticket = await self.controller.acquire(f"{method} {route}", priority)
+        except Overloaded as exc:
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(OVERLOADED_BODY)).encode()),
+                    (b"retry-after", str(exc.retry_after).encode()),
+                    (b"cache-control", b"no-store"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": OVERLOADED_BODY})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(ticket)
@@ -0,0 +1,88 @@
+"""In-process cache for product catalog reads."""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from catalog_events import CatalogChange
+
+
+class CatalogCache:
+    """Size-bounded LRU cache whose entries also expire after ``ttl`` seconds.
+
+    Every catalog write bumps ``generation`` and drops all entries. Readers
+    capture the generation before querying MongoDB and pass it back to
+    ``set`` so a result loaded across an invalidation is never stored.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        if not self.enabled:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self):
+        self.generation += 1
+        self.invalidations += 1
+        self._entries.clear()
+
+    async def on_catalog_change(self, change: CatalogChange):
+        self.invalidate()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+def product_list_key(category: Optional[str], featured: Optional[bool],
+                     search: Optional[str], limit: int) -> tuple:
+    """Normalize a product listing filter into a cache key."""
+    # The search filter is case-insensitive, so case never changes the result
+    return ("products", category, featured, search.casefold() if search else None, limit)
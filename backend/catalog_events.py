@@ -0,0 +1,79 @@
+"""Product catalog change notifications.
+
+Product writes made by this process are published directly. The optional
+change-stream watcher republishes writes made by other uvicorn workers (or by
+anything else touching the collection) so every in-process view of the
+catalog stays consistent.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Raised by servers that cannot open change streams (standalone mongod)
+CHANGE_STREAM_UNSUPPORTED = {40573}
+
+
+@dataclass
+class CatalogChange:
+    """A batch of product writes.
+
+    ``reset`` means the exact change is unknown (a delete seen through the
+    change stream, a dropped collection, a resumed stream), so listeners
+    should rebuild whatever they derive from the catalog. ``local`` is false
+    for writes made elsewhere and only observed by this process.
+    """
+    upserted: List[dict] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    reset: bool = False
+    local: bool = True
+
+
+CatalogListener = Callable[[CatalogChange], Awaitable[None]]
+
+
+class CatalogEvents:
+    def __init__(self):
+        self._listeners: List[CatalogListener] = []
+
+    def subscribe(self, listener: CatalogListener) -> CatalogListener:
+        self._listeners.append(listener)
+        return listener
+
+    async def publish(self, change: CatalogChange):
+        for listener in self._listeners:
+            try:
+                await listener(change)
+            except Exception:
+                logger.exception("Catalog listener %r failed", listener)
+
+    async def watch(self, collection, retry_delay: float = 5.0):
+        """Republish change-stream events from ``collection`` until cancelled."""
+        while True:
+            try:
+                async with collection.watch(full_document="updateLookup") as stream:
+                    logger.info("Watching %s for catalog changes", collection.full_name)
+                    async for event in stream:
+                        await self.publish(self._to_change(event))
+            except OperationFailure as exc:
+                if exc.code in CHANGE_STREAM_UNSUPPORTED:
+                    logger.warning("Change streams unavailable, catalog watcher disabled: %s", exc)
+                    return
+                logger.warning("Catalog change stream failed: %s", exc)
+            except PyMongoError as exc:
+                logger.warning("Catalog change stream failed: %s", exc)
+            # Anything written while the stream was down has been missed
+            await self.publish(CatalogChange(reset=True, local=False))
+            await asyncio.sleep(retry_delay)
+
+    @staticmethod
+    def _to_change(event: dict) -> CatalogChange:
+        operation = event.get("operationType")
+        document = event.get("fullDocument")
+        if operation in ("insert", "update", "replace") and document:
+            return CatalogChange(upserted=[document], local=False)
+        return CatalogChange(reset=True, local=False)
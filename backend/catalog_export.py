@@ -0,0 +1,150 @@
+"""Streaming product catalog export as NDJSON, CSV or Parquet.
+
+Each encoder reads the Motor cursor one batch at a time and yields the encoded
+batch before fetching the next, so memory use depends on the batch size and
+not on the size of the catalog.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, List
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is unavailable without pyarrow
+    pa = pq = None
+
+from product_ingest import LIST_COLUMNS, LIST_SEPARATOR
+
+EXPORT_FIELDS = [
+    "id", "name", "description", "price", "category", "image_url",
+    "spiritual_benefits", "materials", "origin", "featured", "in_stock",
+    "created_at", "updated_at",
+]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+async def iter_batches(cursor, batch_size: int) -> AsyncIterator[List[dict]]:
+    batch = []
+    async for document in cursor.batch_size(batch_size):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+async def iter_ndjson(cursor, batch_size: int) -> AsyncIterator[bytes]:
+    async for batch in iter_batches(cursor, batch_size):
+        yield "".join(
+            json.dumps({name: document.get(name) for name in EXPORT_FIELDS}, default=_json_default) + "\n"
+            for document in batch
+        ).encode()
+
+
+def _csv_cell(name: str, value):
+    if value is None:
+        return ""
+    if name in LIST_COLUMNS:
+        return LIST_SEPARATOR.join(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def iter_csv(cursor, batch_size: int) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    async for batch in iter_batches(cursor, batch_size):
+        for document in batch:
+            writer.writerow([_csv_cell(name, document.get(name)) for name in EXPORT_FIELDS])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the caller in chunks."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _parquet_schema():
+    return pa.schema([
+        ("id", pa.string()),
+        ("name", pa.string()),
+        ("description", pa.string()),
+        ("price", pa.float64()),
+        ("category", pa.string()),
+        ("image_url", pa.string()),
+        ("spiritual_benefits", pa.list_(pa.string())),
+        ("materials", pa.list_(pa.string())),
+        ("origin", pa.string()),
+        ("featured", pa.bool_()),
+        ("in_stock", pa.bool_()),
+        ("created_at", pa.timestamp("ms")),
+        ("updated_at", pa.timestamp("ms")),
+    ])
+
+
+async def iter_parquet(cursor, batch_size: int) -> AsyncIterator[bytes]:
+    """Write one Parquet row group per batch, yielding bytes as they are produced."""
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        async for batch in iter_batches(cursor, batch_size):
+            columns = {name: [document.get(name) for document in batch] for name in EXPORT_FIELDS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {
+    "ndjson": iter_ndjson,
+    "csv": iter_csv,
+    "parquet": iter_parquet,
+}
@@ -0,0 +1,436 @@
+"""Memory-mapped, read-only snapshot of the product catalog.
+
+A snapshot file holds every product pre-rendered as JSON in listing order
+(``created_at``, ``id``), plus fixed-width arrays for lookups by id and for
+the category, featured, stock and price filters. Each ordering (created_at,
+price, name) is stored once per category and featured state, so a filtered
+page bisects to its start instead of scanning the catalog. Files are written
+once per catalog version and never modified, so every worker maps the same
+file and the kernel shares its pages between them.
+
+``SnapshotStore`` keeps the current snapshot for one worker. It polls the
+catalog version (and wakes early on catalog events), builds a new file in a
+thread when the version moves, and swaps it in with a single assignment.
+Only one worker builds a given version; the others wait on a file lock and
+map the result.
+"""
+import array
+import asyncio
+import bisect
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Sequence, Set, Tuple
+
+import orjson
+from pymongo.errors import PyMongoError
+
+from catalog_events import CatalogChange
+from fast_json import PRODUCT_PROJECTION, render
+from indexes import LISTING_ORDER
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the layout changes, so old files are rebuilt rather than misread
+FILE_FORMAT = 3
+MAGIC = b"CATSNAP%d" % FILE_FORMAT
+# Footer: header length, then MAGIC; the JSON header sits right before it
+TRAILER = struct.Struct("<Q8s")
+EPOCH = datetime(1970, 1, 1)
+SORTS = ("created_at", "price", "name")
+# Search hit sets this many times smaller than an ordering are sorted directly
+SPARSE_WITHIN = 8
+
+SortKey = Tuple[object, str]
+
+
+def _ordering_section(sort: str, category_code: Optional[int], featured: Optional[bool]) -> str:
+    category = "*" if category_code is None else category_code
+    return f"order:{sort}:{category}:{'*' if featured is None else int(featured)}"
+
+
+def _micros(value: datetime) -> int:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+class _Strings(Sequence):
+    """Strings stored back to back, decoded on access."""
+
+    def __init__(self, blob: memoryview, offsets: memoryview):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return bytes(self._blob[self._offsets[index]:self._offsets[index + 1]]).decode()
+
+
+class _Sorted(Sequence):
+    """``values`` in the order given by ``positions``, for bisecting."""
+
+    def __init__(self, values: Sequence, positions: Sequence[int]):
+        self._values = values
+        self._positions = positions
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, index: int):
+        return self._values[self._positions[index]]
+
+
+def write_snapshot(path: Path, products: Iterable[dict], version: int, updated_at: datetime) -> int:
+    """Write ``products`` (in listing order) to a new snapshot file at ``path``."""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    built_at = time.time()
+    body_offsets = array.array("Q", [0])
+    created_at = array.array("q")
+    ids: List[str] = []
+    categories: List[str] = []
+    names: List[str] = []
+    prices = array.array("d")
+    category_codes = array.array("B")
+    featured_flags = array.array("B")
+    in_stock_flags = array.array("B")
+    sections = {}
+    with open(tmp_path, "wb") as out:
+        out.write(MAGIC)
+        start = out.tell()
+        for product in products:
+            body = render(product)
+            out.write(body)
+            body_offsets.append(body_offsets[-1] + len(body))
+            created_at.append(_micros(product["created_at"]))
+            ids.append(product["id"])
+            names.append(product["name"])
+            prices.append(product.get("price", 0.0))
+            in_stock_flags.append(1 if product.get("in_stock", True) else 0)
+            if product["category"] not in categories:
+                categories.append(product["category"])
+            category_codes.append(categories.index(product["category"]))
+            featured_flags.append(1 if product.get("featured") else 0)
+        sections["bodies"] = [start, body_offsets[-1], "B"]
+
+        def add_section(name: str, data: bytes, typecode: str):
+            out.write(b"\0" * (-out.tell() % 8))
+            sections[name] = [out.tell(), len(data), typecode]
+            out.write(data)
+
+        def add_strings(name: str, values: List[str]):
+            encoded = [value.encode() for value in values]
+            offsets = array.array("Q", [0])
+            for item in encoded:
+                offsets.append(offsets[-1] + len(item))
+            add_section(name, b"".join(encoded), "B")
+            add_section(f"{name}_offsets", offsets.tobytes(), "Q")
+
+        count = len(ids)
+        add_section("body_offsets", body_offsets.tobytes(), "Q")
+        add_section("created_at", created_at.tobytes(), "q")
+        add_strings("ids", ids)
+        add_strings("names", names)
+        add_section("by_id", array.array("I", sorted(range(count), key=ids.__getitem__)).tobytes(), "I")
+        add_section("prices", prices.tobytes(), "d")
+        add_section("category_codes", category_codes.tobytes(), "B")
+        add_section("featured_flags", featured_flags.tobytes(), "B")
+        add_section("in_stock_flags", in_stock_flags.tobytes(), "B")
+        orderings = {
+            "created_at": range(count),
+            "price": sorted(range(count), key=lambda p: (prices[p], ids[p])),
+            "name": sorted(range(count), key=lambda p: (names[p], ids[p])),
+        }
+        for sort, ordering in orderings.items():
+            for code in (None, *range(len(categories))):
+                in_category = ordering if code is None else [p for p in ordering if category_codes[p] == code]
+                for featured in (None, True, False):
+                    subset = in_category if featured is None else [
+                        p for p in in_category if featured_flags[p] == featured]
+                    add_section(_ordering_section(sort, code, featured), array.array("I", subset).tobytes(), "I")
+
+        header = json.dumps({
+            "version": version,
+            "updated_at": updated_at.isoformat(),
+            "built_at": built_at,
+            "count": count,
+            "categories": categories,
+            "sections": sections,
+        }).encode()
+        out.write(header)
+        out.write(TRAILER.pack(len(header), MAGIC))
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+class CatalogSnapshot:
+    """A mapped snapshot file. Reads never block and never touch MongoDB."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_length, magic = TRAILER.unpack(self._mmap[-TRAILER.size:])
+        if magic != MAGIC or self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{self.path} is not a catalog snapshot")
+        header_end = len(self._mmap) - TRAILER.size
+        header = json.loads(self._mmap[header_end - header_length:header_end])
+        self.version: int = header["version"]
+        updated_at = datetime.fromisoformat(header["updated_at"])
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        self.updated_at = updated_at.replace(microsecond=0)
+        self.built_at: float = header["built_at"]
+        self.count: int = header["count"]
+        self.categories: List[str] = header["categories"]
+        self._buffer = memoryview(self._mmap)
+        self._views: List[memoryview] = [self._buffer]
+        sections = {name: self._section(*spec) for name, spec in header["sections"].items()}
+        self._bodies = sections["bodies"]
+        self._body_offsets = sections["body_offsets"]
+        self._created_at = sections["created_at"]
+        self._ids = _Strings(sections["ids"], sections["ids_offsets"])
+        self._names = _Strings(sections["names"], sections["names_offsets"])
+        self._prices = sections["prices"]
+        self._ids_sorted = _Sorted(self._ids, sections["by_id"])
+        self._by_id = sections["by_id"]
+        self._category_codes = sections["category_codes"]
+        self._featured_flags = sections["featured_flags"]
+        self._in_stock_flags = sections["in_stock_flags"]
+        # (sort, category, featured) -> positions in that order
+        self._orderings = {
+            (sort, category, featured): sections[_ordering_section(sort, code, featured)]
+            for sort in SORTS
+            for code, category in ((None, None), *enumerate(self.categories))
+            for featured in (None, True, False)
+        }
+
+    def _section(self, offset: int, length: int, typecode: str) -> memoryview:
+        view = self._buffer[offset:offset + length].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def __len__(self):
+        return self.count
+
+    def position(self, product_id: str) -> Optional[int]:
+        index = bisect.bisect_left(self._ids_sorted, product_id)
+        if index < self.count and self._ids_sorted[index] == product_id:
+            return self._by_id[index]
+        return None
+
+    def body(self, position: int) -> bytes:
+        return bytes(self._bodies[self._body_offsets[position]:self._body_offsets[position + 1]])
+
+    def get(self, product_id: str) -> Optional[bytes]:
+        position = self.position(product_id)
+        return None if position is None else self.body(position)
+
+    def product(self, position: int) -> dict:
+        return orjson.loads(self.body(position))
+
+    def product_id(self, position: int) -> str:
+        return self._ids[position]
+
+    def created_at(self, position: int) -> datetime:
+        return EPOCH + timedelta(microseconds=self._created_at[position])
+
+    def sort_value(self, position: int, field: str):
+        if field == "created_at":
+            return self.created_at(position)
+        return self._prices[position] if field == "price" else self._names[position]
+
+    def _sort_key(self, field: str) -> Callable[[int], tuple]:
+        values = {"created_at": self._created_at, "price": self._prices, "name": self._names}[field]
+        return lambda position: (values[position], self._ids[position])
+
+    def matches(self, position: int, category: Optional[str] = None, featured: Optional[bool] = None,
+                in_stock: Optional[bool] = None, min_price: Optional[float] = None,
+                max_price: Optional[float] = None) -> bool:
+        if category is not None and self.categories[self._category_codes[position]] != category:
+            return False
+        if featured is not None and bool(self._featured_flags[position]) != featured:
+            return False
+        if in_stock is not None and bool(self._in_stock_flags[position]) != in_stock:
+            return False
+        price = self._prices[position]
+        return (min_price is None or price >= min_price) and (max_price is None or price <= max_price)
+
+    def positions(self, category: Optional[str] = None, featured: Optional[bool] = None) -> Sequence[int]:
+        """Products matching the filters, in listing order."""
+        return self._orderings.get(("created_at", category, featured), ())
+
+    def page(self, after: Optional[SortKey], limit: int, sort: str = "created_at",
+             descending: bool = False, within: Optional[Set[int]] = None,
+             category: Optional[str] = None, featured: Optional[bool] = None,
+             in_stock: Optional[bool] = None, min_price: Optional[float] = None,
+             max_price: Optional[float] = None) -> List[int]:
+        """Up to ``limit`` matching positions after the ``(sort value, id)`` key ``after``.
+
+        ``within`` restricts the page to a set of positions, such as search hits.
+        """
+        filters = {"in_stock": in_stock, "min_price": min_price, "max_price": max_price}
+        candidates = self._orderings.get((sort, category, featured), ())
+        start, end = 0, len(candidates)
+        if sort == "price":
+            price = self._prices.__getitem__
+            if min_price is not None:
+                start = bisect.bisect_left(candidates, min_price, key=price)
+            if max_price is not None:
+                end = bisect.bisect_right(candidates, max_price, start, end, key=price)
+        key = self._sort_key(sort)
+        if within is not None and len(within) * SPARSE_WITHIN <= end - start:
+            candidates = sorted((position for position in within if position is not None
+                                 and self.matches(position, category, featured, **filters)), key=key)
+            start, end, within = 0, len(candidates), None
+        if after is not None:
+            value = _micros(after[0]) if sort == "created_at" else after[0]
+            bisect_after = bisect.bisect_left if descending else bisect.bisect_right
+            boundary = bisect_after(candidates, (value, after[1]), start, end, key=key)
+        else:
+            boundary = end if descending else start
+        indexes = range(boundary - 1, start - 1, -1) if descending else range(boundary, end)
+        page = []
+        for index in indexes:
+            position = candidates[index]
+            if within is not None and position not in within:
+                continue
+            if self.matches(position, **filters):
+                page.append(position)
+                if len(page) == limit:
+                    break
+        return page
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Something still holds a view; the map is freed with it
+            pass
+
+
+class SnapshotStore:
+    """The current catalog snapshot for this worker, refreshed in the background."""
+
+    def __init__(self, products, meta, directory: Path, key: str = "products",
+                 interval: float = 5.0, debounce: float = 0.5, keep: int = 3):
+        self.products = products
+        self.meta = meta
+        self.directory = Path(directory)
+        self.key = key
+        self.interval = interval
+        self.debounce = debounce
+        self.keep = keep
+        self.current: Optional[CatalogSnapshot] = None
+        # When the current snapshot was last known to match the catalog version
+        self.confirmed_at: Optional[float] = None
+        self.builds = 0
+        self.last_refresh_seconds = 0.0
+        self.failures = 0
+        self._wake = asyncio.Event()
+        self._listeners: List[Callable[[CatalogSnapshot], None]] = []
+
+    def on_swap(self, listener: Callable[[CatalogSnapshot], None]):
+        self._listeners.append(listener)
+        return listener
+
+    async def on_catalog_change(self, change: CatalogChange):
+        self._wake.set()
+
+    def staleness(self) -> Optional[float]:
+        """Upper bound, in seconds, on how far the snapshot may lag the catalog."""
+        if self.confirmed_at is None:
+            return None
+        return max(0.0, time.time() - self.confirmed_at)
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except PyMongoError as exc:
+                self.failures += 1
+                logger.warning("Catalog snapshot refresh failed: %s", exc)
+            except Exception:
+                self.failures += 1
+                logger.exception("Catalog snapshot refresh failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+                # Let a burst of writes settle into one rebuild
+                await asyncio.sleep(self.debounce)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def refresh(self) -> bool:
+        """Swap in a snapshot of the current catalog version; return whether one was swapped."""
+        checked_at = time.time()
+        document = await self.meta.find_one({"_id": self.key}) or {}
+        version = document.get("version", 0)
+        if self.current is not None and self.current.version == version:
+            self.confirmed_at = checked_at
+            return False
+        updated_at = document.get("updated_at") or datetime.utcnow()
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        path = await loop.run_in_executor(None, self._build, version, updated_at)
+        snapshot = CatalogSnapshot(path)
+        previous, self.current = self.current, snapshot
+        self.confirmed_at = checked_at
+        self.last_refresh_seconds = time.perf_counter() - started
+        for listener in self._listeners:
+            listener(snapshot)
+        if previous is not None:
+            previous.close()
+        logger.info("Catalog snapshot %d loaded with %d products", snapshot.version, len(snapshot))
+        return True
+
+    def _build(self, version: int, updated_at: datetime) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"catalog-{version}.f{FILE_FORMAT}.snap"
+        with open(self.directory / "build.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not path.exists():
+                cursor = self.products.delegate.find({}, PRODUCT_PROJECTION).sort(list(LISTING_ORDER))
+                count = write_snapshot(path, cursor, version, updated_at)
+                self.builds += 1
+                logger.info("Wrote catalog snapshot %s (%d products)", path, count)
+                self._prune()
+        return path
+
+    def _prune(self):
+        snapshots = sorted(self.directory.glob("catalog-*.snap"), key=lambda p: p.stat().st_mtime)
+        for stale in snapshots[:-self.keep]:
+            # Workers still mapping it keep their pages until they swap
+            stale.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        snapshot = self.current
+        return {
+            "loaded": snapshot is not None,
+            "version": snapshot.version if snapshot is not None else None,
+            "products": len(snapshot) if snapshot is not None else 0,
+            "file_bytes": snapshot.path.stat().st_size if snapshot is not None and snapshot.path.exists() else None,
+            "staleness_seconds": self.staleness(),
+            "builds": self.builds,
+            "last_refresh_seconds": self.last_refresh_seconds,
+            "failures": self.failures,
+        }
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
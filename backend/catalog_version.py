@@ -0,0 +1,179 @@
+"""Catalog version tracking and HTTP conditional requests.
+
+The version lives in a single ``catalog_meta`` document and is incremented by
+every product write, so all workers agree on it. Each worker keeps the latest
+value in memory, which lets it answer ``If-None-Match`` and
+``If-Modified-Since`` with a 304 without touching MongoDB.
+
+A worker also tracks the version up to which it has seen every write. When
+the shared version moves past it (another worker wrote), the products stamped
+since the last check are re-read through the ``updated_at`` index and
+published as upserts, so in-process views update incrementally instead of
+being rebuilt.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from starlette.requests import Request
+from starlette.responses import Response
+
+from catalog_events import CatalogChange, CatalogEvents
+from fast_json import PRODUCT_PROJECTION
+
+logger = logging.getLogger(__name__)
+
+
+def catalog_etag(version: int) -> str:
+    return f'"catalog-{version}"'
+
+
+class CatalogVersion:
+    # Slack for differences between the clocks of workers stamping updated_at
+    CLOCK_SKEW = timedelta(seconds=5)
+
+    def __init__(self, collection, products, events: CatalogEvents, key: str = "products",
+                 max_changes: int = 10000):
+        self.collection = collection
+        self.products = products
+        self.events = events
+        self.key = key
+        # More remote writes than this at once are published as a rebuild
+        self.max_changes = max_changes
+        self.version = 0
+        self.updated_at = datetime.now(timezone.utc).replace(microsecond=0)
+        # Every write up to this version has been published in this process
+        self._synced = 0
+        self._scanned_to = datetime.utcnow()
+        self._wake = asyncio.Event()
+
+    def _apply(self, document: Optional[dict]):
+        if not document:
+            return
+        self.version = document["version"]
+        updated_at = document["updated_at"]
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        self.updated_at = updated_at.replace(microsecond=0)
+
+    async def load(self):
+        document = await self.collection.find_one_and_update(
+            {"_id": self.key},
+            {"$setOnInsert": {"version": 1, "updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._apply(document)
+        self._synced = self.version
+        self._scanned_to = datetime.utcnow()
+
+    async def bump(self):
+        document = await self.collection.find_one_and_update(
+            {"_id": self.key},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._apply(document)
+        if document["version"] == self._synced + 1:
+            self._synced = document["version"]
+        else:
+            # Another worker wrote in between; catch up on its writes
+            self._wake.set()
+
+    async def on_catalog_change(self, change: CatalogChange):
+        if change.local:
+            await self.bump()
+        else:
+            await self._apply_latest()
+
+    async def _apply_latest(self) -> bool:
+        """Re-read the shared version; return whether it moved."""
+        previous = self.version
+        self._apply(await self.collection.find_one({"_id": self.key}))
+        return self.version != previous
+
+    async def catch_up(self):
+        """Publish the products written elsewhere since this process last synced."""
+        document = await self.collection.find_one({"_id": self.key})
+        if not document or document["version"] <= self._synced:
+            return
+        scanned_to = datetime.utcnow()
+        changed = await self.products.find(
+            {"updated_at": {"$gt": self._scanned_to - self.CLOCK_SKEW}}, PRODUCT_PROJECTION
+        ).to_list(self.max_changes + 1)
+        self._scanned_to = scanned_to
+        self._apply(document)
+        self._synced = max(self._synced, document["version"])
+        if len(changed) > self.max_changes:
+            await self.events.publish(CatalogChange(reset=True, local=False))
+        else:
+            await self.events.publish(CatalogChange(upserted=changed, local=False))
+
+    async def poll(self, interval: float):
+        """Pick up writes from other workers when no change stream is watched.
+
+        Checks every ``interval`` seconds (0 for never) and whenever a local
+        write shows that another worker wrote first.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval or None)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.catch_up()
+            except PyMongoError as exc:
+                logger.warning("Catalog version poll failed: %s", exc)
+
+    @property
+    def etag(self) -> str:
+        return catalog_etag(self.version)
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value, usegmt=True)
+
+
+def conditional_headers(etag: str, last_modified: datetime, cache_control: str) -> dict:
+    return {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": cache_control,
+    }
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison (RFC 9110 8.8.3.2): a ``W/`` prefix on either side is ignored."""
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since (RFC 9110 13.2.2)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified <= since
+    return False
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,324 @@
+"""Brotli and gzip response compression with a store of precompressed bodies.
+
+Cacheable responses (those carrying an ETag and no ``no-store``/``private``
+Cache-Control) are compressed once per encoding and kept in a byte-bounded
+LRU keyed by a hash of the uncompressed body. A miss is compressed at the fast
+level; only a body that is requested again is recompressed at the high level,
+in the background, so one-off pages and cursors never pay for maximum
+compression. A body that changes under the same URL and ETag gets a new key,
+so it is never answered with another body's bytes, and bodies no longer
+served simply age out. Other responses are compressed on the fly at the fast
+level when they are at least ``min_size`` bytes.
+Compression always runs in the default executor, never on the event loop.
+
+Encoded responses carry a weak ETag; a 304 answering a weak ``If-None-Match``
+echoes the weak form so caches can match it to the body they hold.
+
+Only single-message bodies are compressed; streamed responses such as the
+catalog export pass through untouched.
+"""
+import asyncio
+import gzip
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from metrics import registry
+
+try:
+    import brotli
+except ImportError:  # Only gzip is offered without the brotli package
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+# (level for reused cached bodies, level for everything else) per encoding
+LEVELS = {"br": (11, 4), "gzip": (9, 6)}
+
+compression_bytes_saved = registry.counter(
+    "http_compression_bytes_saved_total", "Response bytes saved by compression",
+    ("encoding", "source"))
+compression_cpu = registry.counter(
+    "http_compression_cpu_seconds_total", "CPU time spent compressing response bodies",
+    ("encoding", "source"))
+compression_responses = registry.counter(
+    "http_compressed_responses_total", "Compressed responses by encoding and body source",
+    ("encoding", "source"))
+
+
+def available_encodings() -> Tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def body_digest(body: bytes) -> bytes:
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+def negotiate(accept_encoding: str, encodings: Iterable[str]) -> Optional[str]:
+    """The first of ``encodings`` the client accepts with a non-zero q-value."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressedBodyCache:
+    """Compressed bodies kept within ``max_bytes``, least recently used evicted first.
+
+    Concurrent misses for one key share a single compression. The first hit on
+    an entry runs ``refine`` once in the background and replaces the entry
+    with its result.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._bodies: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._pending: Dict[tuple, asyncio.Future] = {}
+        # Entries still holding their first, fast compression
+        self._unrefined: set = set()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refinements = 0
+
+    def __len__(self):
+        return len(self._bodies)
+
+    async def get(self, key: tuple, produce: Callable[[], Awaitable[bytes]],
+                  refine: Optional[Callable[[], Awaitable[bytes]]] = None) -> bytes:
+        body = self._bodies.get(key)
+        if body is not None:
+            self._bodies.move_to_end(key)
+            self.hits += 1
+            if key in self._unrefined:
+                self._unrefined.discard(key)
+                if refine is not None:
+                    refined = asyncio.ensure_future(refine())
+                    refined.add_done_callback(lambda future: self._refined(key, body, future))
+            return body
+        self.misses += 1
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(produce())
+            self._pending[key] = pending
+            pending.add_done_callback(lambda future: self._store(key, future))
+        # A disconnecting client must not cancel the compression others wait on
+        return await asyncio.shield(pending)
+
+    def _store(self, key: tuple, future: asyncio.Future):
+        self._pending.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        if self._put(key, future.result()):
+            self._unrefined.add(key)
+
+    def _refined(self, key: tuple, original: bytes, future: asyncio.Future):
+        # Keep the fast body if the entry was evicted or the refinement is no smaller
+        if future.cancelled() or future.exception() is not None or self._bodies.get(key) is not original:
+            return
+        body = future.result()
+        if len(body) < len(original):
+            self.refinements += 1
+            self._put(key, body)
+
+    def _put(self, key: tuple, body: bytes) -> bool:
+        if len(body) > self.max_bytes:
+            return False
+        previous = self._bodies.pop(key, None)
+        if previous is not None:
+            self.bytes -= len(previous)
+        self._bodies[key] = body
+        self.bytes += len(body)
+        while self.bytes > self.max_bytes:
+            evicted_key, evicted = self._bodies.popitem(last=False)
+            self._unrefined.discard(evicted_key)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+        return key in self._bodies
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._bodies),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "refinements": self.refinements,
+        }
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _cacheable(headers: List[Tuple[bytes, bytes]]) -> bool:
+    if _header(headers, b"etag") is None:
+        return False
+    cache_control = (_header(headers, b"cache-control") or "").lower()
+    return "no-store" not in cache_control and "private" not in cache_control
+
+
+def weak_etag(etag: str) -> str:
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+def _compressible(headers: List[Tuple[bytes, bytes]]) -> bool:
+    return (_header(headers, b"content-type") or "").lower().startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Negotiate ``br``/``gzip`` and compress eligible response bodies."""
+
+    def __init__(self, app, cache: Optional[CompressedBodyCache] = None, min_size: int = 1024,
+                 encodings: Optional[Iterable[str]] = None):
+        self.app = app
+        self.cache = cache if cache is not None else CompressedBodyCache()
+        self.min_size = min_size
+        self.encodings = tuple(encodings) if encodings is not None else available_encodings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = negotiate(accept_encoding, self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, self._vary_only(send))
+            return
+        start: Optional[dict] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                if message["status"] == 304:
+                    passthrough = True
+                    await send(self._not_modified(scope, message))
+                    return
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            if message.get("more_body", False) or not self._eligible(start, message.get("body", b"")):
+                passthrough = True
+                await send(self._with_vary(start))
+                await send(message)
+                return
+            await self._send_compressed(start, message["body"], encoding, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _vary_only(self, send):
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = self._with_vary(message)
+            await send(message)
+        return send_wrapper
+
+    @staticmethod
+    def _not_modified(scope, start: dict) -> dict:
+        """Answer a weak If-None-Match with the weak ETag the encoded body was sent with."""
+        headers = start.get("headers", [])
+        etag = _header(headers, b"etag")
+        if etag is None or etag.startswith("W/"):
+            return start
+        if_none_match = ""
+        for key, value in scope["headers"]:
+            if key == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+        if weak_etag(etag) not in {tag.strip() for tag in if_none_match.split(",")}:
+            return start
+        headers = [(key, value) for key, value in headers if key.lower() != b"etag"]
+        headers.append((b"etag", weak_etag(etag).encode("latin-1")))
+        return {**start, "headers": headers}
+
+    def _eligible(self, start: dict, body: bytes) -> bool:
+        headers = start.get("headers", [])
+        if start["status"] != 200 or _header(headers, b"content-encoding") is not None:
+            return False
+        return _compressible(headers) and len(body) >= self.min_size
+
+    @staticmethod
+    def _with_vary(start: dict) -> dict:
+        """Mark responses whose encoding depends on Accept-Encoding; images never do."""
+        headers = list(start.get("headers", []))
+        if not _compressible(headers):
+            return start
+        vary = _header(headers, b"vary")
+        if vary is None:
+            headers.append((b"vary", b"Accept-Encoding"))
+        elif "accept-encoding" not in vary.lower():
+            headers = [(key, value) for key, value in headers if key.lower() != b"vary"]
+            headers.append((b"vary", f"{vary}, Accept-Encoding".encode("latin-1")))
+        return {**start, "headers": headers}
+
+    async def _send_compressed(self, start: dict, body: bytes, encoding: str, send):
+        headers = start.get("headers", [])
+        loop = asyncio.get_running_loop()
+        cacheable = _cacheable(headers)
+        source = "precompressed" if cacheable else "on_the_fly"
+        best, fast = LEVELS[encoding]
+
+        def run(level: int) -> bytes:
+            started = time.thread_time()
+            data = compress(body, encoding, level)
+            compression_cpu.inc(time.thread_time() - started, encoding, source)
+            return data
+
+        async def produce(level: int = fast) -> bytes:
+            return await loop.run_in_executor(None, run, level)
+
+        if cacheable:
+            key = (body_digest(body), encoding)
+            compressed = await self.cache.get(key, produce, refine=lambda: produce(best))
+        else:
+            compressed = await produce()
+        if len(compressed) >= len(body):
+            await send(self._with_vary(start))
+            await send({"type": "http.response.body", "body": body})
+            return
+        compression_responses.inc(1, encoding, source)
+        compression_bytes_saved.inc(len(body) - len(compressed), encoding, source)
+
+        headers = [(key, value) for key, value in headers
+                   if key.lower() not in (b"content-length", b"etag")]
+        etag = _header(start.get("headers", []), b"etag")
+        if etag is not None:
+            # The encoded body is a different representation of the same resource
+            headers.append((b"etag", weak_etag(etag).encode("latin-1")))
+        headers.append((b"content-encoding", encoding.encode()))
+        headers.append((b"content-length", str(len(compressed)).encode()))
+        await send(self._with_vary({**start, "headers": headers}))
+        await send({"type": "http.response.body", "body": compressed})
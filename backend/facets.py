@@ -0,0 +1,172 @@
+"""Product facet counts for the catalog sidebar.
+
+``FacetSummary`` keeps the unfiltered counts in memory and adjusts them on
+every product write, so the default sidebar is served without a query, and
+counts over a set of search hits are summed from the same per-product keys.
+Other filtered views run ``facet_pipeline`` as one ``$facet`` aggregation.
+"""
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from catalog_events import CatalogChange
+
+# Lower bounds of the price buckets; the last bucket is open-ended
+PRICE_BOUNDARIES = [0, 25, 50, 100, 200]
+
+# Facets with free-form values only report their most common values
+MAX_FACET_VALUES = 50
+
+FACET_FIELDS = ("category", "materials", "origin", "price", "in_stock")
+
+
+def price_bucket(price: float) -> Optional[int]:
+    """Index of the bucket ``price`` falls in, or None below the first bound."""
+    bucket = None
+    for index, lower in enumerate(PRICE_BOUNDARIES):
+        if price >= lower:
+            bucket = index
+    return bucket
+
+
+def price_bucket_bounds(index: int) -> Tuple[float, Optional[float]]:
+    upper = PRICE_BOUNDARIES[index + 1] if index + 1 < len(PRICE_BOUNDARIES) else None
+    return PRICE_BOUNDARIES[index], upper
+
+
+def _value_counts(counts: Counter, limit: Optional[int] = None) -> List[dict]:
+    ordered = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+    return [{"value": value, "count": count} for value, count in ordered[:limit] if count > 0]
+
+
+def _price_counts(counts: Dict[int, int]) -> List[dict]:
+    buckets = []
+    for index in range(len(PRICE_BOUNDARIES)):
+        lower, upper = price_bucket_bounds(index)
+        buckets.append({"min": lower, "max": upper, "count": counts.get(index, 0)})
+    return buckets
+
+
+class FacetSummary:
+    """Incrementally maintained facet counts over the whole catalog."""
+
+    def __init__(self):
+        self.ready = False
+        self.total = 0
+        self._counts: Dict[str, Counter] = {name: Counter() for name in FACET_FIELDS}
+        self._doc_keys: Dict[str, Dict[str, tuple]] = {}
+
+    @staticmethod
+    def _keys(product: dict) -> Dict[str, tuple]:
+        origin = product.get("origin")
+        bucket = price_bucket(product.get("price", 0))
+        return {
+            "category": (product["category"],),
+            "materials": tuple(product.get("materials") or ()),
+            "origin": (origin,) if origin else (),
+            "price": (bucket,) if bucket is not None else (),
+            "in_stock": (bool(product.get("in_stock", True)),),
+        }
+
+    def add(self, product: dict):
+        self.remove(product["id"])
+        keys = self._keys(product)
+        for name, values in keys.items():
+            self._counts[name].update(values)
+        self._doc_keys[product["id"]] = keys
+        self.total += 1
+
+    def remove(self, product_id: str):
+        keys = self._doc_keys.pop(product_id, None)
+        if keys is None:
+            return
+        for name, values in keys.items():
+            counts = self._counts[name]
+            counts.subtract(values)
+            for value in values:
+                if counts[value] <= 0:
+                    del counts[value]
+        self.total -= 1
+
+    def clear(self):
+        self.total = 0
+        self._doc_keys.clear()
+        for counts in self._counts.values():
+            counts.clear()
+
+    async def on_catalog_change(self, change: CatalogChange):
+        for product_id in change.deleted:
+            self.remove(product_id)
+        for product in change.upserted:
+            self.add(product)
+
+    def subset(self, product_ids: Iterable[str]) -> "FacetSummary":
+        """Counts over just ``product_ids``, such as the hits of a search."""
+        subset = FacetSummary()
+        for product_id in product_ids:
+            keys = self._doc_keys.get(product_id)
+            if keys is None:
+                continue
+            for name, values in keys.items():
+                subset._counts[name].update(values)
+            subset.total += 1
+        return subset
+
+    def snapshot(self) -> dict:
+        return {
+            "total": self.total,
+            "category": _value_counts(self._counts["category"]),
+            "materials": _value_counts(self._counts["materials"], MAX_FACET_VALUES),
+            "origin": _value_counts(self._counts["origin"], MAX_FACET_VALUES),
+            "price": _price_counts(self._counts["price"]),
+            "in_stock": _value_counts(self._counts["in_stock"]),
+        }
+
+
+def facet_pipeline(filter_dict: dict) -> List[dict]:
+    """One aggregation computing every facet over the products matching ``filter_dict``."""
+    by_count = [{"$sort": {"count": -1, "_id": 1}}]
+    return [
+        {"$match": filter_dict},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "category": [{"$group": {"_id": "$category", "count": {"$sum": 1}}}, *by_count],
+            "materials": [
+                {"$unwind": "$materials"},
+                {"$group": {"_id": "$materials", "count": {"$sum": 1}}},
+                *by_count,
+                {"$limit": MAX_FACET_VALUES},
+            ],
+            "origin": [
+                {"$match": {"origin": {"$nin": [None, ""]}}},
+                {"$group": {"_id": "$origin", "count": {"$sum": 1}}},
+                *by_count,
+                {"$limit": MAX_FACET_VALUES},
+            ],
+            "price": [{"$bucket": {
+                "groupBy": "$price",
+                "boundaries": [*PRICE_BOUNDARIES, math.inf],
+                "default": "below",
+                "output": {"count": {"$sum": 1}},
+            }}],
+            "in_stock": [{"$group": {"_id": "$in_stock", "count": {"$sum": 1}}}, *by_count],
+        }},
+    ]
+
+
+def facets_from_aggregation(result: dict) -> dict:
+    """Shape a ``facet_pipeline`` result like ``FacetSummary.snapshot``."""
+    def counts(name):
+        return [{"value": row["_id"], "count": row["count"]} for row in result.get(name, [])]
+
+    prices = {PRICE_BOUNDARIES.index(row["_id"]): row["count"]
+              for row in result.get("price", []) if row["_id"] in PRICE_BOUNDARIES}
+    total = result.get("total") or [{"count": 0}]
+    return {
+        "total": total[0]["count"],
+        "category": counts("category"),
+        "materials": counts("materials"),
+        "origin": counts("origin"),
+        "price": _price_counts(prices),
+        "in_stock": counts("in_stock"),
+    }
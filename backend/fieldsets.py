@@ -0,0 +1,97 @@
+"""Sparse fieldsets for product reads.
+
+A ``Fieldset`` names the product fields a client wants, optionally trimmed
+(the first few benefits, a description excerpt). It becomes the MongoDB
+projection, so unrequested fields never leave the server, and it can also
+trim already-loaded documents the same way for reads served from memory.
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+PRODUCT_FIELDS = (
+    "id", "name", "description", "price", "category", "image_url", "spiritual_benefits",
+    "materials", "origin", "featured", "in_stock", "created_at", "updated_at",
+)
+
+# Field rules: None keeps the value, ("slice", n) keeps the first n list items,
+# ("truncate", n) keeps the first n characters
+Rule = Optional[Tuple[str, int]]
+
+
+class InvalidFieldset(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Fieldset:
+    name: str
+    fields: Tuple[Tuple[str, Rule], ...]
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return tuple(field for field, _ in self.fields)
+
+    def projection(self, *required: str) -> dict:
+        """MongoDB projection for these fields, plus ``required`` ones the query needs."""
+        projection: Dict[str, object] = {"_id": 0}
+        for field in required:
+            projection[field] = 1
+        for field, rule in self.fields:
+            if rule is None:
+                projection[field] = 1
+            elif rule[0] == "slice":
+                projection[field] = {"$slice": rule[1]}
+            else:
+                projection[field] = {"$substrCP": [f"${field}", 0, rule[1]]}
+        return projection
+
+    def strip(self, product: dict) -> dict:
+        """Drop fields that were only projected for the query's own use."""
+        names = self.names
+        return {field: value for field, value in product.items() if field in names}
+
+    def apply(self, product: dict) -> dict:
+        """Trim a full product document the way ``projection`` would."""
+        trimmed = {}
+        for field, rule in self.fields:
+            if field not in product:
+                continue
+            value = product[field]
+            if rule is not None and value is not None:
+                value = value[:rule[1]]
+            trimmed[field] = value
+        return trimmed
+
+
+VIEWS = {
+    # What a product card in a listing renders
+    "card": Fieldset("card", (
+        ("id", None), ("name", None), ("description", ("truncate", 100)), ("price", None),
+        ("category", None), ("image_url", None), ("spiritual_benefits", ("slice", 2)),
+        ("featured", None), ("in_stock", None),
+    )),
+    # Everything the product page shows, without bookkeeping timestamps
+    "detail": Fieldset("detail", tuple(
+        (field, None) for field in PRODUCT_FIELDS if field not in ("created_at", "updated_at")
+    )),
+}
+
+
+def parse_fields(fields: str) -> Fieldset:
+    names = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in names if field not in PRODUCT_FIELDS]
+    if unknown:
+        raise InvalidFieldset(f"Unknown fields: {', '.join(unknown)}; "
+                              f"available: {', '.join(PRODUCT_FIELDS)}")
+    if not names:
+        raise InvalidFieldset("fields must name at least one field")
+    return Fieldset("fields:" + ",".join(names), tuple((field, None) for field in names))
+
+
+def resolve_fieldset(view: Optional[str], fields: Optional[str]) -> Optional[Fieldset]:
+    """The fieldset a request asks for, or None for whole documents."""
+    if view and fields:
+        raise InvalidFieldset("Use either view or fields, not both")
+    if fields:
+        return parse_fields(fields)
+    return VIEWS[view] if view else None
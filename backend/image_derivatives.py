@@ -0,0 +1,338 @@
+"""Resized WebP/AVIF derivatives of product images, cached on disk.
+
+Each source image is fetched from its origin once and kept on disk; width
+bucketed derivatives are encoded from that copy in a process pool, so the
+event loop never decodes or encodes an image, and cache files are read and
+written in threads so it never waits on the disk either. Originals and derivatives
+share one byte budget and the least recently used files are evicted first.
+
+The origin is a plain ``async (url) -> bytes`` callable: ``HttpOrigin``
+fetches over HTTP (optionally rewriting the host to a local file server) and
+``DirectoryOrigin`` reads files from a directory, for tests and offline use.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Image derivatives are unavailable without Pillow
+    Image = ImageOps = features = None
+
+# Widths derivatives are generated at; requests are rounded up to one of these
+WIDTHS = (160, 320, 480, 640, 960, 1280)
+
+MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+Origin = Callable[[str], Awaitable[bytes]]
+
+
+# What Pillow raises for a source it cannot turn into a derivative: unreadable
+# or truncated files, oversized images, unsupported modes or encoder options
+DECODE_ERRORS = (OSError, SyntaxError, ValueError) + ((Image.DecompressionBombError,) if Image else ())
+
+
+class OriginError(Exception):
+    """The source image could not be fetched or decoded."""
+
+
+class HttpOrigin:
+    """Fetch source images over HTTP.
+
+    With ``base_url`` set, only the path and query of each image URL are kept
+    and requested from that server instead.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, timeout: float = 10.0,
+                 max_bytes: int = 20 * 1024 * 1024):
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.max_bytes = max_bytes
+        self._client = httpx.AsyncClient(timeout=timeout, follow_redirects=True)
+
+    async def __call__(self, url: str) -> bytes:
+        if self.base_url:
+            parts = urlsplit(url)
+            url = self.base_url + parts.path + (f"?{parts.query}" if parts.query else "")
+        try:
+            async with self._client.stream("GET", url) as response:
+                response.raise_for_status()
+                chunks, size = [], 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise OriginError(f"{url} is larger than {self.max_bytes} bytes")
+                    chunks.append(chunk)
+        except httpx.HTTPError as exc:
+            raise OriginError(f"Fetching {url} failed: {exc}") from exc
+        return b"".join(chunks)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class DirectoryOrigin:
+    """Serve source images from ``root``, by the last path segment of their URL."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    async def __call__(self, url: str) -> bytes:
+        name = urlsplit(url).path.rsplit("/", 1)[-1]
+        path = self.root / name
+        if not name or path.parent != self.root:
+            raise OriginError(f"No local file for {url}")
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, path.read_bytes)
+        except OSError as exc:
+            raise OriginError(f"Reading {path} failed: {exc}") from exc
+
+    async def close(self):
+        pass
+
+
+def origin_from_url(spec: str) -> Origin:
+    """``file:///dir`` reads from a directory; an http(s) URL rewrites image hosts to it; empty fetches as-is."""
+    if spec.startswith("file://"):
+        return DirectoryOrigin(Path(urlsplit(spec).path))
+    return HttpOrigin(spec or None)
+
+
+def available_formats() -> Tuple[str, ...]:
+    if features is None:
+        return ()
+    return tuple(fmt for fmt in MEDIA_TYPES if features.check(fmt))
+
+
+def negotiate(accept: str, formats: Tuple[str, ...]) -> Optional[str]:
+    """Prefer AVIF when the client accepts it, then WebP."""
+    accept = accept.lower()
+    for fmt in formats:
+        if MEDIA_TYPES[fmt] in accept:
+            return fmt
+    # Every browser we target decodes WebP, even those that do not advertise it
+    return "webp" if "webp" in formats else None
+
+
+def bucket(width: Optional[int]) -> int:
+    """The smallest bucket at least ``width`` wide."""
+    if width is None:
+        return WIDTHS[-1]
+    for candidate in WIDTHS:
+        if candidate >= width:
+            return candidate
+    return WIDTHS[-1]
+
+
+def resize(data: bytes, width: int, fmt: str, quality: int) -> bytes:
+    """Decode, shrink to ``width`` (never enlarge) and encode as ``fmt``. Runs in a worker process."""
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        out = io.BytesIO()
+        image.save(out, format=fmt.upper(), quality=quality)
+        return out.getvalue()
+
+
+class DiskLRU:
+    """Files under ``directory`` kept within ``max_bytes``, least recently used evicted first.
+
+    Workers sharing the directory keep separate indexes; a file evicted by
+    another worker is simply a miss here.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.directory.iterdir():
+            if path.is_file() and not path.name.endswith(".tmp"):
+                stat = path.stat()
+                entries.append((stat.st_mtime, path.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._sizes[name] = size
+            self.bytes += size
+        self._unlink(self._over_budget())
+
+    def __len__(self):
+        return len(self._sizes)
+
+    @staticmethod
+    async def _run(function, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def get(self, name: str) -> Optional[bytes]:
+        if name not in self._sizes:
+            return None
+        self._sizes.move_to_end(name)
+        try:
+            return await self._run(self._read, name)
+        except FileNotFoundError:
+            if name in self._sizes:
+                self.bytes -= self._sizes.pop(name)
+            return None
+
+    async def put(self, name: str, data: bytes):
+        await self._run(self._write, name, data)
+        self.bytes += len(data) - self._sizes.pop(name, 0)
+        self._sizes[name] = len(data)
+        evicted = self._over_budget()
+        if evicted:
+            await self._run(self._unlink, evicted)
+
+    async def discard(self, name: str):
+        if name in self._sizes:
+            self.bytes -= self._sizes.pop(name)
+            await self._run(self._unlink, [name])
+
+    def _over_budget(self) -> List[str]:
+        """Drop least recently used entries until within budget; return their names."""
+        evicted = []
+        while self.bytes > self.max_bytes and len(self._sizes) > 1:
+            name, size = self._sizes.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+            evicted.append(name)
+        return evicted
+
+    # File access below runs in the default executor, off the event loop
+
+    def _read(self, name: str) -> bytes:
+        path = self.directory / name
+        data = path.read_bytes()
+        # mtime carries recency across restarts
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def _write(self, name: str, data: bytes):
+        path = self.directory / name
+        tmp_path = path.with_name(f"{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def _unlink(self, names: List[str]):
+        for name in names:
+            (self.directory / name).unlink(missing_ok=True)
+
+
+class ImageDerivatives:
+    """Width-bucketed derivatives of source images, fetched and encoded at most once each."""
+
+    def __init__(self, directory: Path, origin: Origin, max_bytes: int = 512 * 1024 * 1024,
+                 workers: Optional[int] = None, quality: int = 70):
+        self.cache = DiskLRU(directory, max_bytes)
+        self.origin = origin
+        self.workers = workers
+        self.quality = quality
+        self.formats = available_formats()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # In-flight fetches and encodes, so concurrent requests share one
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.origin_fetches = 0
+        self.origin_failures = 0
+        self.resizes = 0
+
+    @property
+    def available(self) -> bool:
+        return bool(self.formats)
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+
+    async def get(self, url: str, width: int, fmt: str) -> Tuple[str, bytes]:
+        """The ``(file name, encoded bytes)`` of ``url`` at bucket ``width`` in ``fmt``."""
+        name = f"{self.key(url)}-w{width}.{fmt}"
+        data = await self.cache.get(name)
+        if data is not None:
+            self.hits += 1
+            return name, data
+        self.misses += 1
+        return name, await self._once(name, lambda: self._derive(url, name, width, fmt))
+
+    async def _once(self, name: str, produce: Callable[[], Awaitable[bytes]]) -> bytes:
+        pending = self._pending.get(name)
+        if pending is None:
+            pending = asyncio.ensure_future(produce())
+            self._pending[name] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(name, None))
+        # A cancelled request must not cancel the work other requests wait on
+        return await asyncio.shield(pending)
+
+    async def _derive(self, url: str, name: str, width: int, fmt: str) -> bytes:
+        source = await self._source(url)
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(self._executor(), resize, source, width, fmt, self.quality)
+        except DECODE_ERRORS as exc:
+            # Not an image Pillow can use; fetch it again next time rather than keep it
+            await self.cache.discard(f"{self.key(url)}.orig")
+            raise OriginError(f"{url} could not be decoded: {exc}") from exc
+        self.resizes += 1
+        await self.cache.put(name, data)
+        return data
+
+    async def _source(self, url: str) -> bytes:
+        name = f"{self.key(url)}.orig"
+        data = await self.cache.get(name)
+        if data is not None:
+            return data
+        return await self._once(name, lambda: self._fetch(url, name))
+
+    async def _fetch(self, url: str, name: str) -> bytes:
+        self.origin_fetches += 1
+        try:
+            data = await self.origin(url)
+        except OriginError:
+            self.origin_failures += 1
+            raise
+        await self.cache.put(name, data)
+        return data
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def stats(self) -> dict:
+        return {
+            "formats": list(self.formats),
+            "files": len(self.cache),
+            "bytes": self.cache.bytes,
+            "max_bytes": self.cache.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.cache.evictions,
+            "origin_fetches": self.origin_fetches,
+            "origin_failures": self.origin_failures,
+            "resizes": self.resizes,
+        }
+
+    async def close(self):
+        close = getattr(self.origin, "close", None)
+        if close is not None:
+            await close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
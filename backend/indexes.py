@@ -0,0 +1,248 @@
+"""Declared MongoDB indexes and the query shapes they are meant to serve.
+
+``reconcile_indexes`` creates whatever is missing at startup and rebuilds
+indexes whose definition drifted. ``explain_query_shapes`` runs ``explain()``
+on every route's query shape and flags collection scans and in-memory sorts,
+so a query that stops using an index is caught before it reaches production.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from pagination import keyset_filter
+
+logger = logging.getLogger(__name__)
+
+Keys = Tuple[Tuple[str, int], ...]
+
+EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    name: str
+    keys: Keys
+    unique: bool = False
+    options: Dict = field(default_factory=dict, hash=False, compare=False)
+
+    def model(self) -> IndexModel:
+        return IndexModel(list(self.keys), name=self.name, unique=self.unique, **self.options)
+
+    def matches(self, info: dict) -> bool:
+        """Whether an ``index_information()`` entry has this definition."""
+        if tuple((name, int(direction)) for name, direction in info["key"]) != self.keys:
+            return False
+        if bool(info.get("unique", False)) != self.unique:
+            return False
+        return all(info.get(option) == value for option, value in self.options.items())
+
+
+@dataclass(frozen=True)
+class QueryShape:
+    """A representative query issued by a route."""
+    name: str
+    collection: str
+    filter: Dict = field(default_factory=dict, hash=False)
+    sort: Optional[Keys] = None
+    limit: int = 20
+
+
+INDEXES: List[IndexSpec] = [
+    IndexSpec("products", "id_unique", (("id", ASCENDING),), unique=True),
+    # Keyset pagination order, alone and behind each equality filter
+    IndexSpec("products", "created_at_id", (("created_at", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "category_featured_created_at_id",
+              (("category", ASCENDING), ("featured", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "category_created_at_id",
+              (("category", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "featured_created_at_id",
+              (("featured", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "in_stock_created_at_id",
+              (("in_stock", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "category_in_stock_created_at_id",
+              (("category", ASCENDING), ("in_stock", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING))),
+    # Price and name sorts (either direction), which also serve price ranges
+    IndexSpec("products", "price_id", (("price", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "category_price_id",
+              (("category", ASCENDING), ("price", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "featured_price_id",
+              (("featured", ASCENDING), ("price", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "category_featured_price_id",
+              (("category", ASCENDING), ("featured", ASCENDING), ("price", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "in_stock_price_id",
+              (("in_stock", ASCENDING), ("price", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "category_in_stock_price_id",
+              (("category", ASCENDING), ("in_stock", ASCENDING), ("price", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "name_id", (("name", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "category_name_id",
+              (("category", ASCENDING), ("name", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "featured_name_id",
+              (("featured", ASCENDING), ("name", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "category_featured_name_id",
+              (("category", ASCENDING), ("featured", ASCENDING), ("name", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "in_stock_name_id",
+              (("in_stock", ASCENDING), ("name", ASCENDING), ("id", ASCENDING))),
+    IndexSpec("products", "category_in_stock_name_id",
+              (("category", ASCENDING), ("in_stock", ASCENDING), ("name", ASCENDING), ("id", ASCENDING))),
+    # Known gap: featured and in_stock together have no index of their own.
+    # Such listings walk the featured index in sort order and filter in_stock
+    # from the fetched documents, so they examine more products but never
+    # sort in memory; see the "featured in_stock" query shapes below.
+    # Incremental export
+    IndexSpec("products", "updated_at", (("updated_at", ASCENDING),)),
+]
+
+
+def status_retention_index(retention_seconds: int) -> IndexSpec:
+    """TTL index that also serves status reads ordered or bucketed by time."""
+    return IndexSpec("status_checks", "timestamp", (("timestamp", ASCENDING),),
+                     options={"expireAfterSeconds": retention_seconds})
+
+
+LISTING_ORDER: Keys = (("created_at", ASCENDING), ("id", ASCENDING))
+PRICE_ORDER: Keys = (("price", ASCENDING), ("id", ASCENDING))
+NAME_DESCENDING: Keys = (("name", DESCENDING), ("id", DESCENDING))
+
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape("get_products", "products", sort=LISTING_ORDER),
+    QueryShape("get_products category", "products", {"category": "crystals"}, LISTING_ORDER),
+    QueryShape("get_products featured", "products", {"featured": True}, LISTING_ORDER),
+    QueryShape("get_products category featured", "products",
+               {"category": "crystals", "featured": True}, LISTING_ORDER),
+    QueryShape("get_products search", "products", {"id": {"$in": ["a", "b"]}}, limit=0),
+    QueryShape("get_products sort price", "products", {"price": {"$gte": 10, "$lte": 50}}, PRICE_ORDER),
+    QueryShape("get_products category sort price", "products",
+               {"category": "crystals", "price": {"$gte": 10}}, PRICE_ORDER),
+    QueryShape("get_products sort -name", "products", sort=NAME_DESCENDING),
+    QueryShape("get_products category sort -name", "products", {"category": "crystals"}, NAME_DESCENDING),
+    QueryShape("get_products in_stock price range", "products",
+               {"in_stock": True, "price": {"$lte": 50}}, LISTING_ORDER),
+    QueryShape("get_products category in_stock", "products",
+               {"category": "crystals", "in_stock": False}, LISTING_ORDER),
+    QueryShape("get_products in_stock sort price", "products",
+               {"in_stock": False, "price": {"$gte": 10}}, PRICE_ORDER),
+    QueryShape("get_products category in_stock sort price", "products",
+               {"category": "crystals", "in_stock": True, "price": {"$gte": 10}}, PRICE_ORDER),
+    QueryShape("get_products featured sort price", "products",
+               {"featured": True, "price": {"$lte": 50}}, PRICE_ORDER),
+    QueryShape("get_products category featured sort price", "products",
+               {"category": "crystals", "featured": True}, PRICE_ORDER),
+    QueryShape("get_products featured sort -name", "products", {"featured": True}, NAME_DESCENDING),
+    QueryShape("get_products category featured sort -name", "products",
+               {"category": "crystals", "featured": False}, NAME_DESCENDING),
+    QueryShape("get_products in_stock sort -name", "products", {"in_stock": True}, NAME_DESCENDING),
+    QueryShape("get_products category in_stock sort -name", "products",
+               {"category": "crystals", "in_stock": True}, NAME_DESCENDING),
+    QueryShape("get_products featured in_stock", "products",
+               {"featured": True, "in_stock": True}, LISTING_ORDER),
+    QueryShape("get_products category featured in_stock sort price", "products",
+               {"category": "crystals", "featured": True, "in_stock": True}, PRICE_ORDER),
+    QueryShape("get_product", "products", {"id": "a"}, limit=1),
+    QueryShape("get_product_facets category", "products", {"category": "crystals"}, limit=0),
+    QueryShape("get_featured_products", "products", {"featured": True}, limit=6),
+    QueryShape("export_products updated_since", "products",
+               {"updated_at": {"$gte": EPOCH}}, limit=0),
+    QueryShape("get_status_checks", "status_checks", sort=(("timestamp", ASCENDING),), limit=1000),
+    QueryShape("get_status_checks bucketed", "status_checks", {"timestamp": {"$gte": EPOCH}}, limit=0),
+]
+
+# A cursor's sort value for each keyset ordering
+CURSOR_VALUES = {"created_at": EPOCH, "price": 25.0, "name": "m"}
+
+
+def continuation_shapes() -> List[QueryShape]:
+    """``get_products`` pages after a cursor, for every sort, alone and behind category."""
+    shapes = []
+    for sort_field, value in CURSOR_VALUES.items():
+        for direction in (ASCENDING, DESCENDING):
+            order = sort_field if direction == ASCENDING else f"-{sort_field}"
+            after = keyset_filter(sort_field, value, "a", descending=direction == DESCENDING)
+            sort = ((sort_field, direction), ("id", direction))
+            shapes.append(QueryShape(f"get_products after cursor sort {order}", "products", after, sort, 21))
+            shapes.append(QueryShape(f"get_products category after cursor sort {order}", "products",
+                                     {"$and": [{"category": "crystals"}, after]}, sort, 21))
+    return shapes
+
+
+QUERY_SHAPES.extend(continuation_shapes())
+
+
+async def reconcile_indexes(db, specs: Sequence[IndexSpec] = INDEXES):
+    """Create missing indexes and rebuild any whose definition changed."""
+    by_collection: Dict[str, List[IndexSpec]] = {}
+    for spec in specs:
+        by_collection.setdefault(spec.collection, []).append(spec)
+
+    for collection_name, collection_specs in by_collection.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        missing = []
+        for spec in collection_specs:
+            info = existing.get(spec.name)
+            if info is None:
+                missing.append(spec)
+            elif not spec.matches(info):
+                logger.warning("Index %s.%s changed definition, rebuilding", collection_name, spec.name)
+                await collection.drop_index(spec.name)
+                missing.append(spec)
+        if missing:
+            try:
+                await collection.create_indexes([spec.model() for spec in missing])
+            except OperationFailure:
+                logger.exception("Creating indexes on %s failed", collection_name)
+                continue
+            logger.info("Created indexes on %s: %s", collection_name,
+                        ", ".join(spec.name for spec in missing))
+        declared = {spec.name for spec in collection_specs} | {"_id_"}
+        for name in existing.keys() - declared:
+            logger.info("Index %s.%s is not declared in indexes.py", collection_name, name)
+
+
+def _plan_stages(plan) -> List[dict]:
+    """Flatten every stage of an explain() plan, whatever the server version."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan)
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_plan_stages(value))
+    return stages
+
+
+async def explain_query_shapes(db, shapes: Sequence[QueryShape] = QUERY_SHAPES) -> List[dict]:
+    """Explain each query shape and report how the winning plan executes."""
+    report = []
+    for shape in shapes:
+        cursor = db[shape.collection].find(shape.filter)
+        if shape.sort:
+            cursor = cursor.sort(list(shape.sort))
+        if shape.limit:
+            cursor = cursor.limit(shape.limit)
+        try:
+            explained = await cursor.explain()
+        except OperationFailure as exc:
+            report.append({"name": shape.name, "collection": shape.collection, "error": str(exc)})
+            continue
+        stages = _plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {}))
+        names = [stage["stage"] for stage in stages]
+        entry = {
+            "name": shape.name,
+            "collection": shape.collection,
+            "stages": names,
+            "indexes": sorted({stage["indexName"] for stage in stages if "indexName" in stage}),
+            "collscan": "COLLSCAN" in names,
+            "in_memory_sort": "SORT" in names,
+        }
+        if entry["collscan"] or entry["in_memory_sort"]:
+            logger.warning("Query shape %r on %s is not index-backed: %s",
+                           shape.name, shape.collection, " <- ".join(names))
+        report.append(entry)
+    return report
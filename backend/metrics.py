@@ -0,0 +1,349 @@
+"""Prometheus metrics: request latency, MongoDB commands and pool waits.
+
+A small in-process registry rendered in the Prometheus text exposition
+format, plus an ASGI middleware for per-route HTTP metrics and pymongo
+monitoring listeners for command durations and connection checkout waits.
+Each worker process exposes its own samples.
+"""
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def dec(self, amount: float = 1.0, *labels: str):
+        self.inc(-amount, *labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = defaultdict(float)
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            counts = self._counts.get(labels)
+            if counts is None:
+                counts = self._counts[labels] = [0] * len(self.buckets)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._sums[labels] += value
+
+    def render(self):
+        lines = self.header()
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(self._sums[labels])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class CallbackGauge(Metric):
+    """Gauge (or counter) whose samples are read from ``callback`` at scrape time.
+
+    ``callback`` returns either a number or ``{label values tuple: number}``.
+    """
+
+    def __init__(self, name, help, callback: Callable, labelnames=(), kind: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self):
+        samples = self.callback()
+        if not isinstance(samples, dict):
+            samples = {(): samples}
+        lines = self.header()
+        for labels, value in sorted(samples.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, callback, labelnames=(), kind="gauge") -> CallbackGauge:
+        return self.register(CallbackGauge(name, help, callback, labelnames, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ("method", "route", "status"))
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served", ("method", "route"))
+http_response_size = registry.histogram(
+    "http_response_size_bytes", "HTTP response body size by route",
+    ("method", "route"), buckets=SIZE_BUCKETS)
+mongo_command_duration = registry.histogram(
+    "mongodb_command_duration_seconds", "MongoDB command duration by collection and command",
+    ("collection", "command", "outcome"))
+mongo_pool_checkout_wait = registry.histogram(
+    "mongodb_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection",
+    ("address", "outcome"))
+
+
+# Per-request time split, reported in the Server-Timing header
+class RequestTiming:
+    def __init__(self):
+        self.durations: Dict[str, float] = defaultdict(float)
+
+    def add(self, phase: str, seconds: float):
+        self.durations[phase] += seconds
+
+    def header(self, total: float) -> str:
+        parts = [f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in self.durations.items()]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+request_timing: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar(
+    "request_timing", default=None)
+
+
+@contextmanager
+def timed(phase: str):
+    """Attribute the enclosed block to ``phase`` in the current request's timing."""
+    timing = request_timing.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(phase, time.perf_counter() - started)
+
+
+def route_template(app, scope) -> str:
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Record per-route latency, in-flight requests and response sizes."""
+
+    def __init__(self, app, server_timing: bool = False, exclude: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.server_timing = server_timing
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = route_template(scope["app"], scope)
+        timing = RequestTiming()
+        token = request_timing.set(timing)
+        started = time.perf_counter()
+        status = "500"
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if self.server_timing:
+                    total = time.perf_counter() - started
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timing.header(total).encode()))
+                    message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        http_requests_in_flight.inc(1, method, route)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec(1, method, route)
+            http_request_duration.observe(time.perf_counter() - started, method, route, status)
+            http_response_size.observe(size, method, route)
+            request_timing.reset(token)
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Time MongoDB commands by collection and charge them to the request's DB time."""
+
+    def __init__(self):
+        self._pending: Dict[Tuple, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(event) -> Tuple:
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._pending[self._key(event)] = (collection, event.command_name)
+
+    def _finish(self, event, outcome: str):
+        with self._lock:
+            collection, command = self._pending.pop(self._key(event), ("", event.command_name))
+        seconds = event.duration_micros / 1e6
+        mongo_command_duration.observe(seconds, collection, command, outcome)
+        timing = request_timing.get()
+        if timing is not None:
+            timing.add("db", seconds)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Measure connection checkout waits; a checkout runs start to end on one thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _observe(self, event, outcome: str):
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            self._local.started = None
+            address = "%s:%s" % event.address
+            mongo_pool_checkout_wait.observe(time.perf_counter() - started, address, outcome)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self._observe(event, "success")
+
+    def connection_check_out_failed(self, event):
+        self._observe(event, "failure")
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
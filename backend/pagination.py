@@ -0,0 +1,63 @@
+"""Opaque keyset cursors for product listings.
+
+A cursor records the sort key and ``id`` of the last product on a page. The
+next page starts strictly after that position, so it is served by an index
+seek rather than by skipping over every earlier product.
+"""
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+from typing import Any, Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# JSON type of the sort value a cursor carries for each ordering
+VALUE_TYPES = {
+    "relevance": (int, float),
+    "price": (int, float),
+    "name": (str,),
+    "created_at": (str,),
+}
+
+
+def encode_cursor(order: str, value: Any, product_id: str) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps({"o": order, "v": value, "i": product_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order: str) -> Tuple[Any, str]:
+    """Return the ``(sort value, product id)`` a cursor points at."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if data["o"] != order:
+            raise InvalidCursor("Cursor belongs to a different ordering")
+        value, product_id = data["v"], str(data["i"])
+        field = order.lstrip("-")
+        if isinstance(value, bool) or not isinstance(value, VALUE_TYPES.get(field, object)):
+            raise TypeError(f"Cursor value for {field} has the wrong type")
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ValueError("Cursor value is not finite")
+        if field == "created_at":
+            value = datetime.fromisoformat(value)
+    except InvalidCursor:
+        raise
+    except (binascii.Error, KeyError, TypeError, ValueError) as exc:
+        raise InvalidCursor("Malformed cursor") from exc
+    return value, product_id
+
+
+def keyset_filter(field: str, value: Any, product_id: str, descending: bool = False) -> dict:
+    """Match products after ``(value, product_id)`` in ``(field, id)`` order."""
+    op = "$lt" if descending else "$gt"
+    return {"$or": [
+        {field: {op: value}},
+        {field: value, "id": {op: product_id}},
+    ]}
@@ -0,0 +1,285 @@
+"""Batched product ingestion from NDJSON or CSV streams.
+
+Uploads are parsed line by line as chunks arrive, validated one row at a time
+and written in unordered bulk batches, so memory use is bounded by the batch
+size rather than the size of the upload. Invalid rows are reported and skipped
+without aborting the rest of the batch.
+"""
+import csv
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterable, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from catalog_events import CatalogChange, CatalogEvents
+
+logger = logging.getLogger(__name__)
+
+# CSV cells holding a list (spiritual_benefits, materials) join items with this
+LIST_SEPARATOR = "|"
+LIST_COLUMNS = ("spiritual_benefits", "materials")
+# Longest CSV record buffered while waiting for a quoted field to close
+MAX_RECORD_CHARS = 1 << 20
+# Longest line buffered while waiting for its newline
+MAX_LINE_BYTES = 1 << 20
+
+Row = Tuple[int, Any]
+
+
+class LineTooLong(ValueError):
+    """A line ran past ``MAX_LINE_BYTES``; the rest of the upload is not read."""
+
+    def __init__(self, line: int, max_bytes: int):
+        super().__init__(f"Line {line} is longer than {max_bytes} bytes")
+        self.line = line
+
+
+@dataclass
+class IngestStats:
+    received: int = 0
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[dict] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.received / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+def _decode(line: bytes) -> Union[str, ValueError]:
+    try:
+        return line.decode("utf-8").rstrip("\r")
+    except UnicodeDecodeError as exc:
+        return ValueError(f"Line is not valid UTF-8 (byte {exc.start})")
+
+
+async def iter_lines(chunks: AsyncIterable[bytes],
+                     max_bytes: int = MAX_LINE_BYTES) -> AsyncIterator[Union[str, ValueError]]:
+    """Split a byte stream into decoded lines without buffering the whole body.
+
+    A line that is not valid UTF-8 is yielded as a ``ValueError`` instead; a
+    line longer than ``max_bytes`` raises ``LineTooLong``.
+    """
+    pending = b""
+    line_number = 0
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if len(line) > max_bytes:
+                raise LineTooLong(line_number, max_bytes)
+            yield _decode(line)
+        if len(pending) > max_bytes:
+            raise LineTooLong(line_number + 1, max_bytes)
+    if pending:
+        yield _decode(pending)
+
+
+async def iter_ndjson_rows(lines: AsyncIterable[Union[str, ValueError]]) -> AsyncIterator[Row]:
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if isinstance(line, ValueError):
+            yield line_number, line
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as exc:
+            yield line_number, exc
+
+
+class _RecordLines:
+    """Lines of the CSV record being read, fed to one ``csv.reader``.
+
+    A record is complete once its lines hold an even number of quotes, since
+    quotes inside quoted fields are doubled.
+    """
+
+    def __init__(self):
+        self._lines: deque = deque()
+        self._quotes = 0
+        self.chars = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self._lines:
+            raise StopIteration
+        return self._lines.popleft()
+
+    def __bool__(self) -> bool:
+        return bool(self._lines)
+
+    def append(self, line: str):
+        self._lines.append(line + "\n")
+        self._quotes += line.count('"')
+        self.chars += len(line) + 1
+
+    @property
+    def complete(self) -> bool:
+        return self._quotes % 2 == 0
+
+    def clear(self):
+        self._lines.clear()
+        self._quotes = 0
+        self.chars = 0
+
+
+async def iter_csv_rows(lines: AsyncIterable[Union[str, ValueError]]) -> AsyncIterator[Row]:
+    """Parse CSV with a header row; quoted fields may span lines."""
+    record = _RecordLines()
+    reader = csv.reader(record)
+    header = None
+    line_number = record_start = 0
+    async for line in lines:
+        line_number += 1
+        if isinstance(line, ValueError):
+            # The record this line belonged to is lost with it
+            record.clear()
+            yield line_number, line
+            continue
+        if not record:
+            if not line.strip():
+                continue
+            record_start = line_number
+        record.append(line)
+        if not record.complete:
+            if record.chars > MAX_RECORD_CHARS:
+                record.clear()
+                yield record_start, ValueError("Record too long; is a quoted field unterminated?")
+            continue
+        try:
+            values = next(reader)
+        except csv.Error as exc:
+            record.clear()
+            yield record_start, ValueError(str(exc))
+            continue
+        record.clear()
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield record_start, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        row = {name: value for name, value in zip(header, values) if value != ""}
+        for name in LIST_COLUMNS:
+            if name in row:
+                row[name] = [item.strip() for item in row[name].split(LIST_SEPARATOR) if item.strip()]
+        yield record_start, row
+    if record:
+        yield record_start, ValueError("Unterminated quoted field")
+
+
+async def iter_documents(documents: Iterable[dict]) -> AsyncIterator[Row]:
+    for number, document in enumerate(documents, start=1):
+        yield number, document
+
+
+def _write_request(document: dict, upsert: bool):
+    if not upsert:
+        return InsertOne(document)
+    fields = dict(document)
+    created_at = fields.pop("created_at")
+    return UpdateOne(
+        {"id": document["id"]},
+        {"$set": fields, "$setOnInsert": {"created_at": created_at}},
+        upsert=True,
+    )
+
+
+class ProductIngester:
+    """Validate rows with ``validate`` and write them to ``collection`` in batches.
+
+    ``validate`` turns a raw row into a product document and returns whether it
+    should be upserted by ``id`` (the row named one) or inserted as new.
+    """
+
+    def __init__(self, collection, validate: Callable[[dict], Tuple[dict, bool]],
+                 events: Optional[CatalogEvents] = None,
+                 batch_size: int = 1000, max_errors: int = 100):
+        self.collection = collection
+        self.validate = validate
+        self.events = events
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+
+    def _record_error(self, stats: IngestStats, line: int, error: str):
+        stats.failed += 1
+        if len(stats.errors) < self.max_errors:
+            stats.errors.append({"line": line, "error": error})
+
+    async def ingest(self, rows: AsyncIterable[Row]) -> IngestStats:
+        stats = IngestStats()
+        started = time.perf_counter()
+        batch: List[Tuple[int, dict, bool]] = []
+        async for line, row in rows:
+            stats.received += 1
+            if isinstance(row, Exception):
+                self._record_error(stats, line, str(row))
+                continue
+            if not isinstance(row, dict):
+                self._record_error(stats, line, "Row must be an object")
+                continue
+            try:
+                document, upsert = self.validate(row)
+            except ValidationError as exc:
+                self._record_error(stats, line, "; ".join(
+                    f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors()
+                ))
+                continue
+            batch.append((line, document, upsert))
+            if len(batch) >= self.batch_size:
+                await self._flush(batch, stats)
+                batch = []
+        if batch:
+            await self._flush(batch, stats)
+        stats.elapsed_seconds = time.perf_counter() - started
+        logger.info("Ingested %d/%d products in %.2fs (%.0f rows/s), %d failed",
+                    stats.inserted + stats.updated, stats.received, stats.elapsed_seconds,
+                    stats.rows_per_second, stats.failed)
+        return stats
+
+    async def _flush(self, batch: List[Tuple[int, dict, bool]], stats: IngestStats):
+        requests = [_write_request(document, upsert) for _, document, upsert in batch]
+        failed_indexes = set()
+        try:
+            result = await self.collection.bulk_write(requests, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as exc:
+            details = exc.details
+            for error in details.get("writeErrors", []):
+                failed_indexes.add(error["index"])
+                self._record_error(stats, batch[error["index"]][0], error.get("errmsg", "Write failed"))
+        stats.inserted += details.get("nInserted", 0) + details.get("nUpserted", 0)
+        stats.updated += details.get("nMatched", 0)
+        if self.events is not None:
+            written = [(document, upsert) for index, (_, document, upsert) in enumerate(batch)
+                       if index not in failed_indexes]
+            if written:
+                created = await self._stored_created_at(
+                    [document["id"] for document, upsert in written if upsert])
+                await self.events.publish(CatalogChange(upserted=[
+                    {**document, "created_at": created.get(document["id"], document["created_at"])}
+                    for document, _ in written
+                ]))
+
+    async def _stored_created_at(self, product_ids: List[str]) -> dict:
+        """``created_at`` as stored, since upserts of existing products keep it."""
+        if not product_ids:
+            return {}
+        stored = await self.collection.find(
+            {"id": {"$in": product_ids}}, {"_id": 0, "id": 1, "created_at": 1}
+        ).to_list(len(product_ids))
+        return {document["id"]: document["created_at"] for document in stored}
@@ -0,0 +1,99 @@
+"""Replica-aware routing of catalog reads.
+
+Catalog reads tolerate bounded staleness, so they go to secondaries picked
+with ``maxStalenessSeconds``. Writes, and reads that must observe them, use
+the primary. After any catalog write, made here or observed from another
+worker, catalog reads are pinned to the primary for as long as a secondary
+may still trail it, so a write is never followed by a secondary read (and a
+cache fill under the new catalog version) that does not include it.
+"""
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Tuple
+
+from pymongo import monitoring
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+from catalog_events import CatalogChange
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+READ_COMMANDS = {"find", "getMore", "aggregate", "count", "distinct"}
+
+
+def read_preference(mode: str, max_staleness: int = -1):
+    """Build a read preference; ``max_staleness`` of -1 means no bound."""
+    try:
+        preference = READ_PREFERENCES[mode]
+    except KeyError:
+        raise ValueError(f"Unknown read preference {mode!r}; expected one of {', '.join(READ_PREFERENCES)}")
+    if preference is Primary:
+        return Primary()
+    return preference(max_staleness=max_staleness)
+
+
+class ReadRouter:
+    """Hands out the collection a catalog read should use."""
+
+    def __init__(self, collection, preference, read_concern: ReadConcern = ReadConcern(),
+                 pin_seconds: float = 0.0, heartbeat_seconds: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.primary = collection
+        self.secondary = collection.with_options(read_preference=preference, read_concern=read_concern)
+        self.routes_to_secondaries = not isinstance(preference, Primary)
+        # Staleness is estimated from heartbeats, so a selectable secondary can
+        # trail the primary by up to one heartbeat more than the bound
+        max_staleness = getattr(preference, "max_staleness", -1)
+        if max_staleness >= 0:
+            pin_seconds = max(pin_seconds, max_staleness + heartbeat_seconds)
+        self.pin_seconds = pin_seconds
+        self._clock = clock
+        self._pinned_until = 0.0
+        self.routed: Counter = Counter()
+
+    def collection(self):
+        if self.routes_to_secondaries and self._clock() >= self._pinned_until:
+            self.routed["secondary"] += 1
+            return self.secondary
+        self.routed["primary"] += 1
+        return self.primary
+
+    async def on_catalog_change(self, change: CatalogChange):
+        self._pinned_until = self._clock() + self.pin_seconds
+
+
+class ReadDistributionListener(monitoring.CommandListener):
+    """Count read commands per server, to see where reads actually land."""
+
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if event.command_name in READ_COMMANDS:
+            with self._lock:
+                self._counts[event.connection_id] += 1
+
+    def failed(self, event):
+        pass
+
+    def samples(self, topology) -> Dict[Tuple[str, str], int]:
+        """Read counts keyed by ``(address, server type)``."""
+        servers = topology.server_descriptions()
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            ("%s:%s" % address, servers[address].server_type_name if address in servers else "Unknown"): count
+            for address, count in counts.items()
+        }
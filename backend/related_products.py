@@ -0,0 +1,443 @@
+"""Precomputed "you may also like" lists.
+
+Every product is encoded as a vector of four feature groups: its spiritual
+benefits and its materials (one column per distinct value), its category,
+and its price as an angle that turns ``PRICE_OCTAVE_ANGLE`` per doubling.
+Each group is L2-normalised and scaled by the square root of its weight, so
+the dot product of two vectors is the weighted sum of the per-group cosine
+similarities: 1 for identical products, falling as benefits, materials,
+category and price drift apart.
+
+``NeighbourTable`` holds the ``k`` most similar products of every product.
+Similarities are computed as batched matrix products against the product's
+own category first; another category can contribute at most
+``1 - category weight``, so only products whose k-th best score is below
+that are also compared against the rest of the catalog. The result is exact
+at a fraction of the all-pairs cost.
+
+``RelatedProducts`` keeps the features of every product and recomputes the
+table in the default executor: in full when the catalog views are rebuilt,
+otherwise only the lists a batch of writes can change. Lists are served from
+the last finished table, so they trail writes by one recompute.
+"""
+import asyncio
+import logging
+import math
+import sys
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from catalog_events import CatalogChange
+
+logger = logging.getLogger(__name__)
+
+# Share of the similarity score each feature group contributes
+FEATURE_WEIGHTS = {
+    "spiritual_benefits": 0.4,
+    "materials": 0.3,
+    "category": 0.2,
+    "price": 0.1,
+}
+
+# Prices a doubling apart score cos(pi/8) ~ 0.92, four doublings apart 0
+PRICE_OCTAVE_ANGLE = math.pi / 8
+# Prices are compared on a log scale between these bounds
+PRICE_FLOOR = 1.0
+PRICE_OCTAVES = 8
+
+# Similarity scores held in memory at once while computing lists
+BATCH_ELEMENTS = 1 << 22
+
+# Writes touching more than this fraction of the catalog trigger a full recompute
+REBUILD_FRACTION = 0.05
+
+Features = Tuple[Tuple[str, ...], Tuple[str, ...], str, float]
+
+
+def product_features(product: dict) -> Features:
+    return (
+        tuple(dict.fromkeys(product.get("spiritual_benefits") or ())),
+        tuple(dict.fromkeys(product.get("materials") or ())),
+        product["category"],
+        float(product.get("price") or 0.0),
+    )
+
+
+def price_angle(price: float) -> float:
+    octaves = math.log2(max(price, PRICE_FLOOR) / PRICE_FLOOR)
+    return min(octaves, PRICE_OCTAVES) * PRICE_OCTAVE_ANGLE
+
+
+class TablePatch(NamedTuple):
+    """Changes to a ``NeighbourTable`` computed off the event loop."""
+    added: Dict[str, int]
+    deleted: List[str]
+    rows: np.ndarray
+    neighbours: np.ndarray
+    scores: np.ndarray
+
+
+class NeighbourTable:
+    """Product vectors and the top ``k`` neighbours of each, by row.
+
+    ``build`` and ``update`` run in a worker thread and only touch state the
+    event loop does not read; ``install`` and ``related`` run on the loop.
+    """
+
+    def __init__(self, k: int, weights: Dict[str, float], batch_elements: int = BATCH_ELEMENTS):
+        total = sum(weights.values())
+        self.k = k
+        self.weights = {group: weight / total for group, weight in weights.items()}
+        self.batch_elements = batch_elements
+        # Columns 0 and 1 hold the price; the rest are assigned to values as they appear
+        self.columns: Dict[Tuple[str, str], int] = {}
+        self.category_codes: Dict[str, int] = {}
+        self.size = 0
+        self.vectors = np.zeros((0, 16), np.float32)
+        self.category = np.zeros(0, np.int32)
+        self.alive = np.zeros(0, bool)
+        self.features: List[Optional[Features]] = []
+        self.free: List[int] = []
+        # Read by the event loop
+        self.rows: Dict[str, int] = {}
+        self.row_ids: List[Optional[str]] = []
+        self.neighbours = np.full((0, k), -1, np.int32)
+        self.scores = np.full((0, k), -np.inf, np.float32)
+
+    @classmethod
+    def build(cls, features: Dict[str, Features], k: int, weights: Dict[str, float],
+              batch_elements: int = BATCH_ELEMENTS) -> "NeighbourTable":
+        table = cls(k, weights, batch_elements)
+        table._grow(len(features))
+        for product_id, product in features.items():
+            row = table._new_row()
+            table.rows[product_id] = row
+            table.row_ids.append(product_id)
+            table._store(row, product)
+        rows = np.arange(table.size)
+        table.neighbours[rows], table.scores[rows] = table._nearest(rows)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _grow(self, rows: int, columns: int = 0):
+        capacity, width = self.vectors.shape
+        if rows > capacity:
+            capacity = max(rows, 2 * capacity)
+        while columns > width:
+            width *= 2
+        if (capacity, width) == self.vectors.shape:
+            return
+        vectors = np.zeros((capacity, width), np.float32)
+        vectors[:self.size, :self.vectors.shape[1]] = self.vectors[:self.size]
+        self.vectors = vectors
+        if capacity > len(self.alive):
+            extra = capacity - len(self.alive)
+            self.category = np.concatenate([self.category, np.zeros(extra, np.int32)])
+            self.alive = np.concatenate([self.alive, np.zeros(extra, bool)])
+            # Swapped in whole, so a concurrent read sees the old or the new array
+            self.neighbours = np.concatenate([self.neighbours, np.full((extra, self.k), -1, np.int32)])
+            self.scores = np.concatenate([self.scores, np.full((extra, self.k), -np.inf, np.float32)])
+
+    def _new_row(self) -> int:
+        if self.free:
+            return self.free.pop()
+        self._grow(self.size + 1)
+        self.features.append(None)
+        self.size += 1
+        return self.size - 1
+
+    def _column(self, group: str, value: str) -> int:
+        column = self.columns.get((group, value))
+        if column is None:
+            column = self.columns[group, value] = len(self.columns) + 2
+            self._grow(0, column + 1)
+        return column
+
+    def _store(self, row: int, features: Features):
+        benefits, materials, category, price = features
+        # New values may widen the matrix, so columns are resolved before writing
+        groups = (("spiritual_benefits", benefits), ("materials", materials), ("category", (category,)))
+        columns = [[self._column(group, item) for item in values] for group, values in groups]
+        self.vectors[row] = 0
+        for (group, values), group_columns in zip(groups, columns):
+            if values:
+                self.vectors[row, group_columns] = math.sqrt(self.weights[group] / len(values))
+        angle, scale = price_angle(price), math.sqrt(self.weights["price"])
+        self.vectors[row, 0] = scale * math.cos(angle)
+        self.vectors[row, 1] = scale * math.sin(angle)
+        self.category[row] = self.category_codes.setdefault(category, len(self.category_codes))
+        self.alive[row] = True
+        self.features[row] = features
+
+    def _select(self, rows: np.ndarray, pool: np.ndarray, neighbours: np.ndarray,
+                scores: np.ndarray, out: np.ndarray):
+        """Fill ``out`` entries of the outputs with the best of ``pool`` for each of ``rows``.
+
+        Every row must itself be in ``pool``, which must be sorted.
+        """
+        k = min(self.k, len(pool) - 1)
+        if k <= 0 or not len(rows):
+            return
+        pool_vectors = self.vectors[pool]
+        step = max(1, self.batch_elements // len(pool))
+        for start in range(0, len(rows), step):
+            batch = rows[start:start + step]
+            similarity = self.vectors[batch] @ pool_vectors.T
+            # A product is not related to itself
+            similarity[np.arange(len(batch)), np.searchsorted(pool, batch)] = -np.inf
+            top = np.argpartition(similarity, -k, axis=1)[:, -k:]
+            top_scores = np.take_along_axis(similarity, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            target = out[start:start + step]
+            neighbours[target, :k] = pool[np.take_along_axis(top, order, axis=1)]
+            scores[target, :k] = np.take_along_axis(top_scores, order, axis=1)
+
+    def _nearest(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """The neighbour lists of live ``rows``, best first."""
+        neighbours = np.full((len(rows), self.k), -1, np.int32)
+        scores = np.full((len(rows), self.k), -np.inf, np.float32)
+        if not len(rows):
+            return neighbours, scores
+        live = np.flatnonzero(self.alive[:self.size])
+        categories = self.category[rows]
+        for code in np.unique(categories):
+            members = np.flatnonzero(categories == code)
+            self._select(rows[members], live[self.category[live] == code], neighbours, scores, members)
+        # Products of another category score at most the weight of the other groups
+        unsure = np.flatnonzero(scores[:, -1] < 1 - self.weights["category"])
+        self._select(rows[unsure], live, neighbours, scores, unsure)
+        return neighbours, scores
+
+    def update(self, changes: Dict[str, Optional[Features]]) -> TablePatch:
+        """Store changed features and compute every list they change.
+
+        ``changes`` maps product ids to their new features, or to None for
+        deleted products.
+        """
+        added: Dict[str, int] = {}
+        deleted: List[str] = []
+        changed, removed = [], []
+        for product_id, features in changes.items():
+            row = self.rows.get(product_id)
+            if features is None:
+                if row is not None:
+                    self.alive[row] = False
+                    self.features[row] = None
+                    deleted.append(product_id)
+                    removed.append(row)
+                continue
+            if row is not None and self.features[row] == features:
+                continue
+            if row is None:
+                row = added[product_id] = self._new_row()
+            self._store(row, features)
+            changed.append(row)
+
+        changed_rows = np.array(changed, np.int64)
+        alive = self.alive[:self.size]
+        # Lists holding a changed or deleted product may lose it to one outside the list
+        holding = np.isin(self.neighbours[:self.size], np.array(changed + removed, np.int64)).any(axis=1)
+        recompute = np.flatnonzero(holding & alive)
+        recompute = np.unique(np.concatenate([recompute, changed_rows])).astype(np.int64)
+        neighbours, scores = self._nearest(recompute)
+
+        # Any other list takes in a changed product that now beats its last entry
+        others = alive.copy()
+        others[recompute] = False
+        patched_rows, patched_neighbours, patched_scores = [recompute], [neighbours], [scores]
+        if len(changed_rows):
+            changed_vectors = self.vectors[changed_rows]
+            step = max(1, self.batch_elements // len(changed_rows))
+            for start in range(0, self.size, step):
+                stop = min(start + step, self.size)
+                similarity = self.vectors[start:stop] @ changed_vectors.T
+                entering = (similarity.max(axis=1) > self.scores[start:stop, -1]) & others[start:stop]
+                if not entering.any():
+                    continue
+                batch = start + np.flatnonzero(entering)
+                similarity = similarity[entering]
+                merged_scores = np.concatenate([self.scores[batch], similarity], axis=1)
+                merged_rows = np.concatenate(
+                    [self.neighbours[batch], np.broadcast_to(changed_rows, similarity.shape)], axis=1)
+                order = np.argsort(-merged_scores, axis=1, kind="stable")[:, :self.k]
+                patched_rows.append(batch)
+                patched_neighbours.append(np.take_along_axis(merged_rows, order, axis=1).astype(np.int32))
+                patched_scores.append(np.take_along_axis(merged_scores, order, axis=1))
+        return TablePatch(added, deleted, np.concatenate(patched_rows),
+                          np.concatenate(patched_neighbours), np.concatenate(patched_scores))
+
+    def install(self, patch: TablePatch):
+        for product_id, row in patch.added.items():
+            self.rows[product_id] = row
+            if row < len(self.row_ids):
+                self.row_ids[row] = product_id
+            else:
+                self.row_ids.extend([None] * (row - len(self.row_ids)) + [product_id])
+        self.neighbours[patch.rows] = patch.neighbours
+        self.scores[patch.rows] = patch.scores
+        for product_id in patch.deleted:
+            row = self.rows.pop(product_id)
+            self.row_ids[row] = None
+            # No list refers to the row any more, so it can be reused
+            self.free.append(row)
+
+    def related(self, product_id: str, limit: int) -> Optional[List[str]]:
+        row = self.rows.get(product_id)
+        if row is None:
+            return None
+        return [self.row_ids[neighbour] for neighbour in self.neighbours[row, :limit].tolist() if neighbour >= 0]
+
+    def memory_bytes(self) -> int:
+        arrays = (self.vectors, self.category, self.alive, self.neighbours, self.scores)
+        return (sum(array.nbytes for array in arrays) + sys.getsizeof(self.rows)
+                + sys.getsizeof(self.row_ids) + sys.getsizeof(self.features))
+
+
+class RelatedProducts:
+    """Catalog view serving the precomputed neighbour lists.
+
+    ``run`` is the background job: it waits for the view to be loaded or
+    written to and recomputes the table, letting a burst of writes settle
+    for ``debounce`` seconds first.
+    """
+
+    def __init__(self, k: int = 12, weights: Optional[Dict[str, float]] = None,
+                 batch_elements: int = BATCH_ELEMENTS, debounce: float = 0.05):
+        self.k = k
+        self.weights = weights or FEATURE_WEIGHTS
+        self.batch_elements = batch_elements
+        self.debounce = debounce
+        self._features: Dict[str, Features] = {}
+        self._loaded = False
+        self._rebuild = False
+        self._dirty: Set[str] = set()
+        self._table: Optional[NeighbourTable] = None
+        self._wake = asyncio.Event()
+        self.version = 0
+        self.builds = 0
+        self.updates = 0
+        self.failures = 0
+        self.last_build_seconds = 0.0
+        self.last_update_seconds = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self._table is not None
+
+    @ready.setter
+    def ready(self, value: bool):
+        # The previous table keeps serving until the next one is computed
+        self._loaded = value
+        if value:
+            self._rebuild = True
+            self._wake.set()
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def add(self, product: dict):
+        self._features[product["id"]] = product_features(product)
+        self._changed(product["id"])
+
+    def remove(self, product_id: str):
+        if self._features.pop(product_id, None) is not None:
+            self._changed(product_id)
+
+    def _changed(self, product_id: str):
+        if self._loaded:
+            self._dirty.add(product_id)
+            self._wake.set()
+
+    def clear(self):
+        self._loaded = False
+        self._features.clear()
+        self._dirty.clear()
+
+    def rebuild(self, products: Iterable[dict]):
+        self.clear()
+        for product in products:
+            self.add(product)
+        self.ready = True
+
+    async def on_catalog_change(self, change: CatalogChange):
+        for product_id in change.deleted:
+            self.remove(product_id)
+        for product in change.upserted:
+            self.add(product)
+
+    def related(self, product_id: str, limit: int) -> Optional[List[str]]:
+        """Ids of the products most similar to ``product_id``, best first.
+
+        None for a product not in the catalog; an empty list while its list
+        has not been computed yet.
+        """
+        table = self._table
+        related = table.related(product_id, limit) if table is not None else None
+        if related is None and (product_id in self._features or not self._loaded):
+            return []
+        return related
+
+    async def run(self):
+        while True:
+            await self._wake.wait()
+            # Let a burst of writes settle into one recompute
+            await asyncio.sleep(self.debounce)
+            self._wake.clear()
+            try:
+                await self.refresh()
+            except Exception:
+                self.failures += 1
+                logger.exception("Related products recompute failed")
+
+    async def refresh(self):
+        if not self._loaded:
+            return
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        if self._rebuild or self._table is None or len(self._dirty) > REBUILD_FRACTION * len(self._features):
+            self._rebuild = False
+            self._dirty.clear()
+            # The worker thread gets a copy, so later writes cannot change it mid-build
+            features = dict(self._features)
+            self._table = await loop.run_in_executor(
+                None, NeighbourTable.build, features, self.k, self.weights, self.batch_elements)
+            self.builds += 1
+            self.last_build_seconds = time.perf_counter() - started
+            logger.info("Related products computed for %d products in %.1fs",
+                        len(features), self.last_build_seconds)
+        elif self._dirty:
+            changes = {product_id: self._features.get(product_id) for product_id in self._dirty}
+            self._dirty.clear()
+            table = self._table
+            patch = await loop.run_in_executor(None, table.update, changes)
+            table.install(patch)
+            self.updates += 1
+            self.last_update_seconds = time.perf_counter() - started
+        else:
+            return
+        self.version += 1
+
+    def memory_bytes(self) -> int:
+        table = self._table
+        return table.memory_bytes() if table is not None else 0
+
+    def stats(self) -> dict:
+        table = self._table
+        return {
+            "ready": self.ready,
+            "products": len(self._features),
+            "computed": len(table) if table is not None else 0,
+            "pending": len(self._dirty),
+            "k": self.k,
+            "version": self.version,
+            "builds": self.builds,
+            "updates": self.updates,
+            "failures": self.failures,
+            "last_build_seconds": round(self.last_build_seconds, 3),
+            "last_update_seconds": round(self.last_update_seconds, 3),
+            "memory_bytes": self.memory_bytes(),
+        }
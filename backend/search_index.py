@@ -0,0 +1,218 @@
+"""In-process inverted index for ranked product search."""
+import bisect
+import heapq
+import math
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from catalog_events import CatalogChange
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+# Name matches outrank benefit matches, which outrank description matches
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "spiritual_benefits": 2.0,
+    "description": 1.0,
+}
+
+# BM25 term-frequency saturation
+K1 = 1.2
+
+# Cap on prefix expansions of the last query term
+MAX_PREFIX_TERMS = 64
+
+# Position of each listing sort key in a product's attributes
+SORT_ATTRIBUTES = {"price": 3, "name": 4, "created_at": 5}
+
+
+def _naive_utc(value):
+    # MongoDB hands back naive UTC datetimes; keep local writes comparable with them
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def stem(token: str) -> str:
+    """Fold simple English plurals so "crystals" matches "crystal"."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(token) for token in TOKEN_RE.findall(text.casefold())]
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(tokenize(query))
+
+
+class SearchIndex:
+    """Field-weighted BM25 index over product name, benefits and description.
+
+    Postings map each term to ``{product_id: weighted term frequency}``. A
+    query matches products containing every query term; the last term also
+    matches as a prefix so partially typed words still find results. Each
+    product's category, flags, price, name and creation time are kept too,
+    so listing filters apply to every match before results are ranked, and
+    matches can be put in listing order without a database query.
+    """
+
+    def __init__(self, field_weights: Optional[Dict[str, float]] = None):
+        self.field_weights = field_weights or FIELD_WEIGHTS
+        self.ready = False
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_terms: Dict[str, Tuple[str, ...]] = {}
+        # product_id -> (category, featured, in_stock, price, name, created_at)
+        self._attributes: Dict[str, tuple] = {}
+        self._vocabulary: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def add(self, product: dict):
+        product_id = product["id"]
+        self.remove(product_id)
+        frequencies: Counter = Counter()
+        for field_name, weight in self.field_weights.items():
+            value = product.get(field_name) or ""
+            if isinstance(value, list):
+                value = " ".join(value)
+            for term in tokenize(value):
+                frequencies[term] += weight
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._vocabulary, term)
+            postings[product_id] = frequency
+        self._doc_terms[product_id] = tuple(frequencies)
+        self._attributes[product_id] = (product.get("category"), bool(product.get("featured")),
+                                        bool(product.get("in_stock", True)), product.get("price"),
+                                        product.get("name"), _naive_utc(product.get("created_at")))
+
+    def remove(self, product_id: str):
+        self._attributes.pop(product_id, None)
+        for term in self._doc_terms.pop(product_id, ()):
+            postings = self._postings[term]
+            del postings[product_id]
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+
+    def clear(self):
+        self._postings.clear()
+        self._doc_terms.clear()
+        self._attributes.clear()
+        self._vocabulary.clear()
+
+    def rebuild(self, products: Iterable[dict]):
+        self.clear()
+        for product in products:
+            self.add(product)
+        self.ready = True
+
+    async def on_catalog_change(self, change: CatalogChange):
+        for product_id in change.deleted:
+            self.remove(product_id)
+        for product in change.upserted:
+            self.add(product)
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _idf(self, document_frequency: int) -> float:
+        total = len(self._doc_terms)
+        return math.log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def _term_scores(self, terms: List[str]) -> Dict[str, float]:
+        """Score every product containing any of ``terms`` (one query slot)."""
+        scores: Dict[str, float] = {}
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(len(postings))
+            for product_id, frequency in postings.items():
+                score = idf * frequency * (K1 + 1) / (frequency + K1)
+                if score > scores.get(product_id, 0.0):
+                    scores[product_id] = score
+        return scores
+
+    def _scores(self, query: str) -> Dict[str, float]:
+        terms = tokenize(query)
+        if not terms:
+            return {}
+        slots = [[term] for term in dict.fromkeys(terms[:-1])]
+        last = terms[-1]
+        slots.append([last] + [term for term in self._prefix_terms(last) if term != last])
+
+        slot_scores = [self._term_scores(slot) for slot in slots]
+        slot_scores.sort(key=len)
+        totals = slot_scores[0]
+        for scores in slot_scores[1:]:
+            if not totals:
+                break
+            totals = {product_id: score + scores[product_id]
+                      for product_id, score in totals.items() if product_id in scores}
+        return totals
+
+    def match(self, query: str, category: Optional[str] = None, featured: Optional[bool] = None,
+              in_stock: Optional[bool] = None, min_price: Optional[float] = None,
+              max_price: Optional[float] = None) -> Dict[str, float]:
+        """Score every product matching ``query`` and the listing filters."""
+        scores = self._scores(query)
+        if category is None and featured is None and in_stock is None and min_price is None and max_price is None:
+            return scores
+        matched = {}
+        for product_id, score in scores.items():
+            product_category, product_featured, product_in_stock, price = self._attributes[product_id][:4]
+            if ((category is None or product_category == category)
+                    and (featured is None or product_featured == featured)
+                    and (in_stock is None or product_in_stock == in_stock)
+                    and (min_price is None or price >= min_price)
+                    and (max_price is None or price <= max_price)):
+                matched[product_id] = score
+        return matched
+
+    def search(self, query: str, limit: Optional[int] = None,
+               after: Optional[Tuple[float, str]] = None, **filters) -> List[Tuple[float, str]]:
+        """Return ``(score, product_id)`` pairs, best first.
+
+        Only products matching ``filters`` (see ``match``) and ranked after
+        the ``(score, product_id)`` position ``after`` are returned, at most
+        ``limit`` of them.
+        """
+        # Ties break on id so result order is stable across requests
+        keys = ((-score, product_id) for product_id, score in self.match(query, **filters).items())
+        if after is not None:
+            bound = (-after[0], after[1])
+            keys = (key for key in keys if key > bound)
+        best = sorted(keys) if limit is None else heapq.nsmallest(limit, keys)
+        return [(-negated, product_id) for negated, product_id in best]
+
+    def ordered(self, query: str, sort: str, limit: int, after: Optional[Tuple[Any, str]] = None,
+                descending: bool = False, **filters) -> List[Tuple[Any, str]]:
+        """Return ``(sort value, product_id)`` pairs in listing order.
+
+        Matches are ordered by ``(sort, id)``, like a listing sorted on
+        ``sort``, and only those past the ``(sort value, product_id)``
+        position ``after`` are returned, at most ``limit`` of them.
+        """
+        column = SORT_ATTRIBUTES[sort]
+        keys = ((self._attributes[product_id][column], product_id) for product_id in self.match(query, **filters))
+        if after is not None:
+            bound = (_naive_utc(after[0]), after[1])
+            keys = (key for key in keys if (key < bound if descending else key > bound))
+        return heapq.nlargest(limit, keys) if descending else heapq.nsmallest(limit, keys)
@@ -1,25 +1,181 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import PlainTextResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_concern import ReadConcern
+import asyncio
+import hashlib
 import os
 import logging
+import re
+import tempfile
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, List, Optional, Tuple, Union
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 
+from compression import CompressedBodyCache, CompressionMiddleware
+from catalog_export import ENCODERS, MEDIA_TYPES, parquet_available
+from catalog_cache import CatalogCache, product_list_key
+from catalog_events import CatalogChange, CatalogEvents
+from catalog_snapshot import CatalogSnapshot, SnapshotStore
+from catalog_version import (
+    CatalogVersion, catalog_etag, conditional_headers, etag_matches, is_not_modified, not_modified_response,
+)
+from metrics import CommandMetricsListener, MetricsMiddleware, PoolMetricsListener, registry, route_template, timed
+from admission import AdmissionController, AdmissionMiddleware
+from read_routing import ReadDistributionListener, ReadRouter, read_preference
+from indexes import INDEXES, explain_query_shapes, reconcile_indexes, status_retention_index
+from write_behind import WriteBehindBuffer
+from fast_json import PRODUCT_PROJECTION, PrerenderedJSONResponse, render
+from product_ingest import (
+    LineTooLong, ProductIngester, iter_csv_rows, iter_documents, iter_lines, iter_ndjson_rows,
+)
+from pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter
+from single_flight import SingleFlight
+from search_index import SearchIndex, normalize_query
+from suggest_index import SuggestIndex
+from related_products import RelatedProducts
+from facets import FacetSummary, facet_pipeline, facets_from_aggregation
+from fieldsets import Fieldset, InvalidFieldset, resolve_fieldset
+from image_derivatives import MEDIA_TYPES as IMAGE_MEDIA_TYPES, ImageDerivatives, OriginError, bucket, negotiate, origin_from_url
+
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+wait_queue_timeout_ms = os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+read_distribution = ReadDistributionListener()
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+    # How long a request may wait for a pooled connection before failing
+    waitQueueTimeoutMS=int(wait_queue_timeout_ms) if wait_queue_timeout_ms else None,
+    serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000)),
+    event_listeners=[CommandMetricsListener(), PoolMetricsListener(), read_distribution],
+)
 db = client[os.environ['DB_NAME']]
 
+# Catalog reads may be served by secondaries at most CATALOG_MAX_STALENESS_SECONDS
+# behind (-1 for no bound; the server minimum is 90). Writes, and catalog reads
+# after any catalog write for that bound plus a heartbeat (or for
+# CATALOG_READ_YOUR_WRITES_SECONDS if longer), use the primary.
+catalog_reader = ReadRouter(
+    db.products,
+    read_preference(
+        os.environ.get('CATALOG_READ_PREFERENCE', 'secondaryPreferred'),
+        int(os.environ.get('CATALOG_MAX_STALENESS_SECONDS', 90)),
+    ),
+    read_concern=ReadConcern(os.environ.get('CATALOG_READ_CONCERN', 'local')),
+    pin_seconds=float(os.environ.get('CATALOG_READ_YOUR_WRITES_SECONDS', 10)),
+)
+
+# Catalog read cache, invalidated on every product write
+catalog_cache = CatalogCache(
+    maxsize=int(os.environ.get('CATALOG_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('CATALOG_CACHE_TTL', 300)),
+)
+# Identical concurrent catalog queries share one in-flight MongoDB call
+catalog_flights = SingleFlight(
+    enabled=os.environ.get('CATALOG_SINGLE_FLIGHT', 'true').lower() in ('1', 'true', 'yes'),
+)
+catalog_events = CatalogEvents()
+catalog_events.subscribe(catalog_reader.on_catalog_change)
+catalog_events.subscribe(catalog_cache.on_catalog_change)
+# Shared catalog version driving ETag/Last-Modified on catalog reads
+catalog_version = CatalogVersion(db.catalog_meta, db.products, catalog_events)
+catalog_events.subscribe(catalog_version.on_catalog_change)
+catalog_cache_control = os.environ.get('CATALOG_CACHE_CONTROL', 'public, max-age=60')
+categories_cache_control = os.environ.get('CATEGORIES_CACHE_CONTROL', 'public, max-age=86400')
+# Seconds between checks for writes made by other workers, 0 to only check when
+# a local write reveals one
+catalog_version_poll_interval = float(os.environ.get('CATALOG_VERSION_POLL_INTERVAL', 5))
+catalog_version_task: Optional[asyncio.Task] = None
+
+# Ranked full-text search over the catalog
+search_index = SearchIndex()
+# Unfiltered facet counts, maintained incrementally
+facet_summary = FacetSummary()
+# Precomputed "you may also like" lists, recomputed in the background
+related_products = RelatedProducts(k=int(os.environ.get('RELATED_PRODUCTS_K', 12)))
+related_products_task: Optional[asyncio.Task] = None
+# In-process views derived from the products collection, rebuilt together
+catalog_views = [search_index, facet_summary, related_products]
+catalog_views_task: Optional[asyncio.Task] = None
+
+# Log any route query shape that is not index-backed once indexes are reconciled
+query_diagnostics = os.environ.get('QUERY_DIAGNOSTICS', 'false').lower() in ('1', 'true', 'yes')
+index_task: Optional[asyncio.Task] = None
+
+# Status checks are group-committed and expire after the retention period
+status_buffer = WriteBehindBuffer(
+    db.status_checks,
+    max_batch=int(os.environ.get('STATUS_FLUSH_BATCH', 500)),
+    max_delay=float(os.environ.get('STATUS_FLUSH_INTERVAL', 1.0)),
+    max_pending=int(os.environ.get('STATUS_MAX_PENDING', 50000)),
+)
+status_retention_seconds = int(os.environ.get('STATUS_RETENTION_SECONDS', 7 * 24 * 3600))
+# Follow the products change stream so writes from other workers invalidate too
+watch_catalog = os.environ.get('CATALOG_CHANGE_STREAM', 'false').lower() in ('1', 'true', 'yes')
+
+# Optionally serve catalog reads from a memory-mapped snapshot shared by all workers
+serve_from_snapshot = os.environ.get('CATALOG_SNAPSHOT', 'false').lower() in ('1', 'true', 'yes')
+catalog_snapshots = SnapshotStore(
+    db.products,
+    db.catalog_meta,
+    Path(os.environ.get('CATALOG_SNAPSHOT_DIR',
+                        Path(tempfile.gettempdir()) / f"catalog-snapshot-{os.environ['DB_NAME']}")),
+    interval=float(os.environ.get('CATALOG_SNAPSHOT_INTERVAL', 5)),
+)
+if serve_from_snapshot:
+    catalog_events.subscribe(catalog_snapshots.on_catalog_change)
+    # Pages cached from the previous snapshot must not outlive it
+    catalog_snapshots.on_swap(lambda snapshot: catalog_cache.invalidate())
+catalog_snapshot_task: Optional[asyncio.Task] = None
+
+# Resized product images, cached on disk up to IMAGE_CACHE_BYTES. IMAGE_ORIGIN
+# is empty to fetch image URLs as-is, an http(s) base URL to fetch their paths
+# from another server, or file:///dir to read them from a local directory.
+image_derivatives = ImageDerivatives(
+    Path(os.environ.get('IMAGE_CACHE_DIR',
+                        Path(tempfile.gettempdir()) / f"image-cache-{os.environ['DB_NAME']}")),
+    origin_from_url(os.environ.get('IMAGE_ORIGIN', '')),
+    max_bytes=int(os.environ.get('IMAGE_CACHE_BYTES', 512 * 1024 * 1024)),
+    workers=int(os.environ['IMAGE_RESIZE_WORKERS']) if os.environ.get('IMAGE_RESIZE_WORKERS') else None,
+    quality=int(os.environ.get('IMAGE_QUALITY', 70)),
+)
+image_cache_control = os.environ.get('IMAGE_CACHE_CONTROL', 'public, max-age=604800, stale-while-revalidate=86400')
+
+# Cacheable (ETag-carrying) response bodies are compressed once per encoding and
+# kept up to COMPRESSION_CACHE_BYTES, at the highest level once they are reused;
+# others are compressed per request from COMPRESSION_MIN_SIZE bytes up
+compress_responses = os.environ.get('COMPRESSION', 'true').lower() in ('1', 'true', 'yes')
+compressed_bodies = CompressedBodyCache(max_bytes=int(os.environ.get('COMPRESSION_CACHE_BYTES', 64 * 1024 * 1024)))
+
+# Latency-adaptive concurrency limits; requests beyond them queue briefly by
+# priority class, then get a 503. ADMISSION_ROUTE_LIMITS caps single routes,
+# e.g. "POST /api/status=32,GET /api/products/export=2"
+admission_control = os.environ.get('ADMISSION_CONTROL', 'true').lower() in ('1', 'true', 'yes')
+admission = AdmissionController(
+    initial_limit=int(os.environ.get('ADMISSION_INITIAL_LIMIT', 64)),
+    min_limit=int(os.environ.get('ADMISSION_MIN_LIMIT', 4)),
+    max_limit=int(os.environ.get('ADMISSION_MAX_LIMIT', 512)),
+    max_queue=int(os.environ.get('ADMISSION_MAX_QUEUE', 256)),
+    tolerance=float(os.environ.get('ADMISSION_LATENCY_TOLERANCE', 2.0)),
+    route_limits={
+        route.strip(): int(limit)
+        for route, _, limit in (
+            entry.rpartition('=') for entry in os.environ.get('ADMISSION_ROUTE_LIMITS', '').split(',') if entry.strip()
+        )
+    },
+)
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -27,6 +183,11 @@ app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
 
+# Largest number of ids one batch lookup may resolve
+MAX_BATCH_IDS = int(os.environ.get('MAX_BATCH_IDS', 500))
+# Most typeahead suggestions one request may ask for
+MAX_SUGGESTIONS = 20
+
 # Define Enums
 class ProductCategory(str, Enum):
     CRYSTALS = "crystals"
@@ -36,6 +197,12 @@ class ProductCategory(str, Enum):
     PROTECTION_CHARMS = "protection_charms"
     HEALING_STONES = "healing_stones"
 
+CATEGORY_LABELS = {cat.value: cat.value.replace("_", " ").title() for cat in ProductCategory}
+
+# Typeahead over product names, benefits, materials and category labels
+suggest_index = SuggestIndex(CATEGORY_LABELS, max_limit=MAX_SUGGESTIONS)
+catalog_views.append(suggest_index)
+
 # Define Models
 class Product(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -50,6 +217,31 @@ class Product(BaseModel):
     featured: bool = False
     in_stock: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ProductCard(BaseModel):
+    """The ``card`` view of a product: what a listing tile renders"""
+    id: str
+    name: str
+    description: str = Field(..., description="First 100 characters")
+    price: float
+    category: ProductCategory
+    image_url: str
+    spiritual_benefits: List[str] = Field([], description="First two benefits")
+    featured: bool
+    in_stock: bool
+
+class ProductSort(str, Enum):
+    CREATED_AT = "created_at"
+    CREATED_AT_DESC = "-created_at"
+    PRICE = "price"
+    PRICE_DESC = "-price"
+    NAME = "name"
+    NAME_DESC = "-name"
+
+class ProductView(str, Enum):
+    CARD = "card"
+    DETAIL = "detail"
 
 class ProductCreate(BaseModel):
     name: str
@@ -63,6 +255,58 @@ class ProductCreate(BaseModel):
     featured: bool = False
     in_stock: bool = True
 
+class BulkFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+    PARQUET = "parquet"
+
+class FacetCount(BaseModel):
+    value: Union[str, bool]
+    count: int
+
+class PriceBucketCount(BaseModel):
+    min: float
+    max: Optional[float] = None
+    count: int
+
+class ProductFacets(BaseModel):
+    total: int
+    category: List[FacetCount]
+    materials: List[FacetCount]
+    origin: List[FacetCount]
+    price: List[PriceBucketCount]
+    in_stock: List[FacetCount]
+
+class ProductBatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+
+class ProductBatch(BaseModel):
+    products: List[Product]
+    missing: List[str]
+
+class Suggestion(BaseModel):
+    text: str
+    kind: str = Field(..., description="name, benefit, material or category")
+    value: str = Field(..., description="The category value for categories, else the text")
+    count: int = Field(..., description="Products carrying this phrase")
+
+class BulkRowError(BaseModel):
+    line: int
+    error: str
+
+class BulkIngestResult(BaseModel):
+    received: int
+    inserted: int
+    updated: int
+    failed: int
+    errors: List[BulkRowError] = []
+    elapsed_seconds: float
+    rows_per_second: float
+
 class StatusCheck(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     client_name: str
@@ -71,6 +315,38 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+class StatusBucketUnit(str, Enum):
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+
+class StatusCount(BaseModel):
+    client_name: str
+    bucket: datetime
+    count: int
+
+def validate_product_row(row: dict) -> Tuple[dict, bool]:
+    """Build a product document from an upload row; rows with an id are upserts"""
+    product_id = row.get("id")
+    with timed("validate"):
+        product = ProductCreate(**row)
+        if product_id:
+            return Product(id=str(product_id), **product.dict()).dict(), True
+        return Product(**product.dict()).dict(), False
+
+product_ingester = ProductIngester(
+    db.products,
+    validate_product_row,
+    events=catalog_events,
+    batch_size=int(os.environ.get('INGEST_BATCH_SIZE', 1000)),
+)
+
+@api_router.on_event("startup")
+async def load_catalog_version():
+    global catalog_version_task
+    await catalog_version.load()
+    catalog_version_task = asyncio.create_task(catalog_version.poll(catalog_version_poll_interval))
+
 # Sample data initialization
 @api_router.on_event("startup")
 async def initialize_sample_data():
@@ -155,53 +431,640 @@ async def initialize_sample_data():
         }
     ]
     
-    for product_data in sample_products:
-        product = Product(**product_data)
-        await db.products.insert_one(product.dict())
+    await product_ingester.ingest(iter_documents(sample_products))
+
+async def rebuild_catalog_views():
+    """Rebuild every in-process view of the catalog from one collection scan"""
+    for view in catalog_views:
+        view.ready = False
+        view.clear()
+    async for product in db.products.find({}, PRODUCT_PROJECTION):
+        for view in catalog_views:
+            view.add(product)
+    for view in catalog_views:
+        view.ready = True
+    # Drop results served by query fallbacks while the views were building
+    catalog_cache.invalidate()
+    logger.info("Catalog views built with %d products", len(search_index))
+
+def schedule_catalog_views_rebuild():
+    global catalog_views_task
+    if catalog_views_task is not None and not catalog_views_task.done():
+        catalog_views_task.cancel()
+    catalog_views_task = asyncio.create_task(rebuild_catalog_views())
+
+async def update_catalog_views(change: CatalogChange):
+    if change.reset:
+        schedule_catalog_views_rebuild()
+    else:
+        for view in catalog_views:
+            await view.on_catalog_change(change)
+
+catalog_events.subscribe(update_catalog_views)
+
+@api_router.on_event("startup")
+async def build_catalog_views():
+    schedule_catalog_views_rebuild()
+
+@api_router.on_event("startup")
+async def backfill_updated_at():
+    # Reads serve stored documents as-is, so older products need every Product field
+    await db.products.update_many(
+        {"updated_at": {"$exists": False}}, [{"$set": {"updated_at": "$created_at"}}]
+    )
+
+async def reconcile_and_diagnose_indexes():
+    await reconcile_indexes(db, [*INDEXES, status_retention_index(status_retention_seconds)])
+    if query_diagnostics:
+        await explain_query_shapes(db)
+
+@api_router.on_event("startup")
+async def manage_indexes():
+    # Index builds can take a while on a large catalog; serve while they run
+    global index_task
+    index_task = asyncio.create_task(reconcile_and_diagnose_indexes())
+
+async def find_hit_products(hits: List[Tuple[Any, str]], projection: dict) -> List[Tuple[Any, dict]]:
+    """Fetch the products of ``(key, product_id)`` index hits, in hit order, as ``(key, product)``
+
+    Hits the index has not yet seen deleted are dropped.
+    """
+    if not hits:
+        return []
+    keys = {product_id: key for key, product_id in hits}
+    rank = {product_id: position for position, product_id in enumerate(keys)}
+    products = await catalog_reader.collection().find({"id": {"$in": list(keys)}}, projection).to_list(len(keys))
+    products.sort(key=lambda product: rank[product["id"]])
+    return [(keys[product["id"]], product) for product in products]
+
+def snapshot_ranked_positions(snapshot: CatalogSnapshot, search: str, filters: dict, limit: int,
+                              after: Optional[Tuple[float, str]] = None) -> List[Tuple[float, int]]:
+    """Up to ``limit`` ranked search hits after ``after`` that the snapshot has, as ``(score, position)``"""
+    hits = []
+    while len(hits) < limit:
+        ranked = search_index.search(search, limit, after, **filters)
+        for score, product_id in ranked:
+            # The snapshot may trail the index, so its own copy of each product decides
+            position = snapshot.position(product_id)
+            if position is not None and snapshot.matches(position, **filters):
+                hits.append((score, position))
+        if len(ranked) < limit:
+            break
+        after = ranked[-1]
+    return hits[:limit]
+
+def product_fieldset(view: Optional[ProductView], fields: Optional[str]) -> Optional[Fieldset]:
+    try:
+        return resolve_fieldset(view.value if view else None, fields)
+    except InvalidFieldset as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+def fieldset_key(fieldset: Optional[Fieldset]) -> tuple:
+    return (fieldset.name,) if fieldset else ()
+
+def render_product(product: dict, fieldset: Optional[Fieldset]) -> bytes:
+    """Render a product fetched with ``fieldset``'s projection"""
+    return render(fieldset.strip(product) if fieldset else product)
+
+def render_snapshot_products(snapshot: CatalogSnapshot, positions, fieldset: Optional[Fieldset]) -> List[bytes]:
+    if fieldset is None:
+        return [snapshot.body(position) for position in positions]
+    return [render(fieldset.apply(snapshot.product(position))) for position in positions]
+
+def active_snapshot() -> Optional[CatalogSnapshot]:
+    return catalog_snapshots.current if serve_from_snapshot else None
+
+def catalog_last_modified() -> datetime:
+    snapshot = active_snapshot()
+    return snapshot.updated_at if snapshot else catalog_version.updated_at
+
+def catalog_headers() -> dict:
+    snapshot = active_snapshot()
+    if snapshot is None:
+        return conditional_headers(catalog_version.etag, catalog_version.updated_at, catalog_cache_control)
+    # Validators describe what is served, which may trail the shared version
+    headers = conditional_headers(catalog_etag(snapshot.version), snapshot.updated_at, catalog_cache_control)
+    headers["X-Catalog-Staleness"] = f"{catalog_snapshots.staleness():.3f}"
+    return headers
+
+def catalog_not_modified(request: Request, headers: dict) -> bool:
+    return is_not_modified(request, headers["ETag"], catalog_last_modified())
+
+def product_page_response(body: bytes, next_cursor: Optional[str], headers: dict) -> Response:
+    if next_cursor:
+        headers = {**headers, "X-Next-Cursor": next_cursor}
+    return PrerenderedJSONResponse(body, headers=headers)
+
+async def lookup_products(ids: List[str], fieldset: Optional[Fieldset] = None) -> Tuple[List[bytes], List[str]]:
+    """Resolve ids to rendered products in request order, with one $in query for cache misses"""
+    snapshot = active_snapshot()
+    if snapshot is not None:
+        positions = {product_id: snapshot.position(product_id) for product_id in dict.fromkeys(ids)}
+        found_ids = [product_id for product_id in ids if positions[product_id] is not None]
+        found = render_snapshot_products(snapshot, [positions[product_id] for product_id in found_ids], fieldset)
+        missing = [product_id for product_id in ids if positions[product_id] is None]
+        return found, missing
+    bodies = {}
+    for product_id in dict.fromkeys(ids):
+        body = catalog_cache.get(("product", product_id, *fieldset_key(fieldset)))
+        if body is not None:
+            bodies[product_id] = body
+    uncached = [product_id for product_id in dict.fromkeys(ids) if product_id not in bodies]
+    if uncached:
+        generation = catalog_cache.generation
+        projection = fieldset.projection("id") if fieldset else PRODUCT_PROJECTION
+        async for product in catalog_reader.collection().find({"id": {"$in": uncached}}, projection):
+            body = render_product(product, fieldset)
+            bodies[product["id"]] = body
+            catalog_cache.set(("product", product["id"], *fieldset_key(fieldset)), body, generation)
+    found = [bodies[product_id] for product_id in ids if product_id in bodies]
+    missing = [product_id for product_id in ids if product_id not in bodies]
+    return found, missing
+
+def render_list(bodies: List[bytes]) -> bytes:
+    return b"[" + b",".join(bodies) + b"]"
+
+# Fallback results differ from what the index will return under the same
+# catalog version, so they carry no validators and are never stored
+SEARCH_FALLBACK_HEADERS = {"Cache-Control": "no-store"}
+
+def regex_search_filter(search: str) -> dict:
+    """Unindexed substring match, used until the search index is ready"""
+    pattern = re.escape(search)
+    return {"$or": [
+        {"name": {"$regex": pattern, "$options": "i"}},
+        {"description": {"$regex": pattern, "$options": "i"}},
+        {"spiritual_benefits": {"$regex": pattern, "$options": "i"}}
+    ]}
+
+def listing_query(filters: dict) -> dict:
+    """MongoDB filter for the listing ``filters`` (category, featured, in_stock, min_price, max_price)"""
+    query = {name: filters[name] for name in ("category", "featured", "in_stock") if filters[name] is not None}
+    price_range = {}
+    if filters["min_price"] is not None:
+        price_range["$gte"] = filters["min_price"]
+    if filters["max_price"] is not None:
+        price_range["$lte"] = filters["max_price"]
+    if price_range:
+        query["price"] = price_range
+    return query
+
+def and_filters(*filters: dict) -> dict:
+    filters = [f for f in filters if f]
+    if len(filters) == 1:
+        return filters[0]
+    return {"$and": filters} if filters else {}
+
+async def load_product_page(filter_dict: dict, filters: dict, search: Optional[str], order: str,
+                            after: Optional[tuple], limit: int,
+                            fieldset: Optional[Fieldset]) -> Tuple[bytes, Optional[str]]:
+    """Query MongoDB for one rendered keyset page and its next cursor
+
+    ``filter_dict`` is the MongoDB form of the listing ``filters``.
+    """
+    sort_field, descending = order.lstrip("-"), order.startswith("-")
+    # Keyset cursors need the sort key even when the client did not ask for it
+    projection = fieldset.projection("id", sort_field) if fieldset else PRODUCT_PROJECTION
+    # Fetch one extra product to learn whether there is a next page
+    if order == "relevance" or (search and search_index.ready):
+        if order == "relevance":
+            hits = search_index.search(search, limit + 1, after, **filters)
+        else:
+            # Put every hit in listing order here, so MongoDB only fetches the page
+            hits = search_index.ordered(search, sort_field, limit + 1, after, descending, **filters)
+        hits = await find_hit_products(hits, projection)
+        sort_values = [value for value, _ in hits]
+        products = [product for _, product in hits]
+    else:
+        filter_dict = dict(filter_dict)
+        if search:
+            filter_dict.update(regex_search_filter(search))
+        if after:
+            filter_dict = and_filters(filter_dict, keyset_filter(sort_field, *after, descending=descending))
+        direction = -1 if descending else 1
+        products = await catalog_reader.collection().find(filter_dict, projection).sort(
+            [(sort_field, direction), ("id", direction)]
+        ).limit(limit + 1).to_list(limit + 1)
+        sort_values = [product[sort_field] for product in products]
+
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = encode_cursor(order, sort_values[limit - 1], products[-1]["id"])
+    if fieldset:
+        products = [fieldset.strip(product) for product in products]
+    return render(products), next_cursor
 
 # Product Routes
-@api_router.get("/products", response_model=List[Product])
+@api_router.get("/products", response_model=Union[List[Product], List[ProductCard]])
 async def get_products(
+    request: Request,
     category: Optional[ProductCategory] = None,
     featured: Optional[bool] = None,
     search: Optional[str] = None,
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's X-Next-Cursor header"),
+    ids: Optional[str] = Query(None, description="Comma-separated product ids to fetch in this order; other filters are ignored"),
+    view: Optional[ProductView] = Query(None, description="Named fieldset; card is sized for listing tiles"),
+    fields: Optional[str] = Query(None, description="Comma-separated product fields to return instead of a view"),
+    sort: Optional[ProductSort] = Query(None, description="Sort field, '-' for descending; defaults to relevance when searching, else created_at"),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: Optional[bool] = None
 ):
-    """Get products with optional filtering"""
+    """Get products with optional filtering, one keyset page at a time"""
+    fieldset = product_fieldset(view, fields)
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(status_code=400, detail="min_price must not exceed max_price")
+    headers = catalog_headers()
+    if search and ids is None and not search_index.ready:
+        headers = SEARCH_FALLBACK_HEADERS
+    elif catalog_not_modified(request, headers):
+        return not_modified_response(headers)
+    if ids is not None:
+        id_list = [product_id for product_id in ids.split(",") if product_id]
+        if len(id_list) > MAX_BATCH_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+        found, missing = await lookup_products(id_list, fieldset)
+        if missing:
+            headers = {**headers, "X-Missing-Ids": ",".join(missing)}
+        return PrerenderedJSONResponse(render_list(found), headers=headers)
+    search = normalize_query(search) if search else None
+    if search == "":
+        # Nothing but punctuation, which no product can match
+        return product_page_response(render_list([]), None, headers)
+    cache_key = (product_list_key(category.value if category else None, featured, search, limit)
+                 + (sort.value if sort else None, min_price, max_price, in_stock, cursor, *fieldset_key(fieldset)))
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        return product_page_response(*cached, headers)
+    generation = catalog_cache.generation
+
+    filters = {"category": category.value if category else None, "featured": featured,
+               "in_stock": in_stock, "min_price": min_price, "max_price": max_price}
+    filter_dict = listing_query(filters)
+    if search and search_index.ready and sort is None:
+        order = "relevance"
+    else:
+        order = sort.value if sort else "created_at"
+    sort_field, descending = order.lstrip("-"), order.startswith("-")
+    try:
+        after = decode_cursor(cursor, order) if cursor else None
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    # Fetch one extra product to learn whether there is a next page
+    snapshot = active_snapshot()
+    if snapshot is not None and (not search or search_index.ready):
+        if order == "relevance":
+            hits = snapshot_ranked_positions(snapshot, search, filters, limit + 1, after)
+            sort_values = [score for score, _ in hits]
+            positions = [position for _, position in hits]
+        else:
+            within = None
+            if search:
+                within = {snapshot.position(hit_id) for hit_id in search_index.match(search, **filters)}
+            positions = snapshot.page(after, limit + 1, sort_field, descending, within, **filters)
+            sort_values = [snapshot.sort_value(position, sort_field) for position in positions]
+        next_cursor = None
+        if len(positions) > limit:
+            positions = positions[:limit]
+            next_cursor = encode_cursor(order, sort_values[limit - 1], snapshot.product_id(positions[-1]))
+        body = render_list(render_snapshot_products(snapshot, positions, fieldset))
+        catalog_cache.set(cache_key, (body, next_cursor), generation)
+        return product_page_response(body, next_cursor, headers)
+    body, next_cursor = await catalog_flights.run(
+        (generation, *cache_key),
+        lambda: load_product_page(filter_dict, filters, search, order, after, limit, fieldset),
+    )
+    catalog_cache.set(cache_key, (body, next_cursor), generation)
+    return product_page_response(body, next_cursor, headers)
+
+@api_router.post("/products/batch", response_model=ProductBatch)
+async def get_product_batch(
+    batch: ProductBatchRequest,
+    view: Optional[ProductView] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated product fields to return instead of a view")
+):
+    """Get many products by id in one round trip, in request order"""
+    found, missing = await lookup_products(batch.ids, product_fieldset(view, fields))
+    return PrerenderedJSONResponse(
+        b'{"products":' + render_list(found) + b',"missing":' + render(missing) + b"}"
+    )
+
+@api_router.post("/products/bulk", response_model=BulkIngestResult)
+async def bulk_ingest_products(
+    request: Request,
+    fmt: Optional[BulkFormat] = Query(None, alias="format", description="Defaults from Content-Type, else ndjson")
+):
+    """Stream NDJSON or CSV product rows into the catalog with batched upserts"""
+    if fmt is None:
+        content_type = request.headers.get("content-type", "")
+        fmt = BulkFormat.CSV if "csv" in content_type else BulkFormat.NDJSON
+    lines = iter_lines(request.stream())
+    rows = iter_csv_rows(lines) if fmt == BulkFormat.CSV else iter_ndjson_rows(lines)
+    try:
+        stats = await product_ingester.ingest(rows)
+    except LineTooLong as exc:
+        # Batches written before the long line stay written
+        raise HTTPException(status_code=413, detail=str(exc))
+    return BulkIngestResult(
+        received=stats.received,
+        inserted=stats.inserted,
+        updated=stats.updated,
+        failed=stats.failed,
+        errors=stats.errors,
+        elapsed_seconds=stats.elapsed_seconds,
+        rows_per_second=stats.rows_per_second,
+    )
+
+@api_router.get("/products/export")
+async def export_products(
+    fmt: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    category: Optional[ProductCategory] = None,
+    featured: Optional[bool] = None,
+    updated_since: Optional[datetime] = Query(None, description="Only products written at or after this time"),
+    batch_size: int = Query(1000, ge=1, le=10000)
+):
+    """Stream the whole catalog (or a filtered slice of it)"""
+    if fmt == ExportFormat.PARQUET and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
     filter_dict = {}
-    
     if category:
         filter_dict["category"] = category.value
     if featured is not None:
         filter_dict["featured"] = featured
-    if search:
+    if updated_since:
+        # Products written before updated_at existed only carry created_at
         filter_dict["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}},
-            {"spiritual_benefits": {"$regex": search, "$options": "i"}}
+            {"updated_at": {"$gte": updated_since}},
+            {"updated_at": {"$exists": False}, "created_at": {"$gte": updated_since}},
         ]
-    
-    products = await db.products.find(filter_dict).limit(limit).to_list(limit)
-    return [Product(**product) for product in products]
+    cursor = catalog_reader.collection().find(filter_dict, {"_id": 0}).sort([("created_at", 1), ("id", 1)])
+    return StreamingResponse(
+        ENCODERS[fmt.value](cursor, batch_size),
+        media_type=MEDIA_TYPES[fmt.value],
+        headers={"Content-Disposition": f'attachment; filename="products.{fmt.value}"'},
+    )
 
-@api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
+@api_router.get("/products/facets", response_model=ProductFacets)
+async def get_product_facets(
+    request: Request,
+    category: Optional[ProductCategory] = None,
+    featured: Optional[bool] = None,
+    search: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: Optional[bool] = None
+):
+    """Get facet counts for the products matching the same filters as /products"""
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(status_code=400, detail="min_price must not exceed max_price")
+    headers = catalog_headers()
+    if search and not search_index.ready:
+        headers = SEARCH_FALLBACK_HEADERS
+    elif catalog_not_modified(request, headers):
+        return not_modified_response(headers)
+    search = normalize_query(search) if search else None
+    if search == "":
+        return PrerenderedJSONResponse(render(FacetSummary().snapshot()), headers=headers)
+    filters = {"category": category.value if category else None, "featured": featured,
+               "in_stock": in_stock, "min_price": min_price, "max_price": max_price}
+    cache_key = ("facets", *filters.values(), search)
+    body = catalog_cache.get(cache_key)
+    if body is not None:
+        return PrerenderedJSONResponse(body, headers=headers)
+    generation = catalog_cache.generation
+
+    snapshot = active_snapshot()
+    unfiltered = search is None and all(value is None for value in filters.values())
+    if unfiltered and facet_summary.ready:
+        facets = facet_summary.snapshot()
+    elif snapshot is not None and (not search or search_index.ready):
+        if search:
+            positions = [snapshot.position(hit_id) for hit_id in search_index.match(search, **filters)]
+        else:
+            positions = snapshot.positions(filters["category"], featured)
+        summary = FacetSummary()
+        for position in positions:
+            if position is not None and snapshot.matches(position, **filters):
+                summary.add(snapshot.product(position))
+        facets = summary.snapshot()
+    elif search and search_index.ready and facet_summary.ready:
+        facets = facet_summary.subset(search_index.match(search, **filters)).snapshot()
+    else:
+        filter_dict = listing_query(filters)
+        if search:
+            filter_dict.update(regex_search_filter(search))
+        result = await catalog_flights.run(
+            (generation, *cache_key),
+            lambda: catalog_reader.collection().aggregate(facet_pipeline(filter_dict)).to_list(1),
+        )
+        facets = facets_from_aggregation(result[0] if result else {})
+    body = render(facets)
+    catalog_cache.set(cache_key, body, generation)
+    return PrerenderedJSONResponse(body, headers=headers)
+
+async def load_product_body(product_id: str, projection: dict) -> Optional[bytes]:
+    product = await catalog_reader.collection().find_one({"id": product_id}, projection)
+    return render(product) if product else None
+
+@api_router.get("/products/{product_id}", response_model=Union[Product, ProductCard])
+async def get_product(
+    product_id: str,
+    request: Request,
+    view: Optional[ProductView] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated product fields to return instead of a view")
+):
     """Get a specific product by ID"""
-    product = await db.products.find_one({"id": product_id})
-    if not product:
+    fieldset = product_fieldset(view, fields)
+    headers = catalog_headers()
+    if catalog_not_modified(request, headers):
+        return not_modified_response(headers)
+    snapshot = active_snapshot()
+    if snapshot is not None:
+        position = snapshot.position(product_id)
+        if position is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        body, = render_snapshot_products(snapshot, [position], fieldset)
+        return PrerenderedJSONResponse(body, headers=headers)
+    cache_key = ("product", product_id, *fieldset_key(fieldset))
+    body = catalog_cache.get(cache_key)
+    if body is None:
+        generation = catalog_cache.generation
+        projection = fieldset.projection() if fieldset else PRODUCT_PROJECTION
+        body = await catalog_flights.run(
+            (generation, *cache_key),
+            lambda: load_product_body(product_id, projection),
+        )
+        if body is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        catalog_cache.set(cache_key, body, generation)
+    return PrerenderedJSONResponse(body, headers=headers)
+
+@api_router.get("/products/{product_id}/related", response_model=Union[List[Product], List[ProductCard]])
+async def get_related_products(
+    product_id: str,
+    request: Request,
+    limit: int = Query(6, ge=1, le=related_products.k),
+    view: Optional[ProductView] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated product fields to return instead of a view")
+):
+    """Get the products most similar to this one by benefits, materials, category and price"""
+    fieldset = product_fieldset(view, fields)
+    related = related_products.related(product_id, limit)
+    if related is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return Product(**product)
+    if not related:
+        # Lists are still being computed; do not let clients cache the empty answer
+        return PrerenderedJSONResponse(b"[]", headers={"Cache-Control": "no-store"})
+    headers = catalog_headers()
+    # Lists are recomputed after the write that moves the catalog version
+    headers["ETag"] = f'{headers["ETag"][:-1]}-related-{related_products.version}"'
+    if catalog_not_modified(request, headers):
+        return not_modified_response(headers)
+    found, _ = await lookup_products(related, fieldset)
+    return PrerenderedJSONResponse(render_list(found), headers=headers)
+
+@api_router.get("/products/related/stats")
+async def get_related_products_stats():
+    """Get the size, memory and recompute timings of the related products table"""
+    return related_products.stats()
+
+async def product_image_url(product_id: str) -> str:
+    snapshot = active_snapshot()
+    if snapshot is not None:
+        position = snapshot.position(product_id)
+        if position is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return snapshot.product(position)["image_url"]
+    cache_key = ("image-url", product_id)
+    image_url = catalog_cache.get(cache_key)
+    if image_url is None:
+        generation = catalog_cache.generation
+        product = await catalog_reader.collection().find_one({"id": product_id}, {"_id": 0, "image_url": 1})
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        image_url = product["image_url"]
+        catalog_cache.set(cache_key, image_url, generation)
+    return image_url
+
+@api_router.get("/images/stats")
+async def get_image_cache_stats():
+    """Get image derivative cache size and hit/fetch/resize counters"""
+    return image_derivatives.stats()
+
+@api_router.get("/images/{product_id}")
+async def get_product_image(
+    product_id: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096, description="Display width in pixels, rounded up to a size bucket")
+):
+    """Get a product image resized for display, as AVIF or WebP"""
+    if not image_derivatives.available:
+        raise HTTPException(status_code=501, detail="Image resizing requires Pillow with WebP support")
+    image_url = await product_image_url(product_id)
+    fmt = negotiate(request.headers.get("accept", ""), image_derivatives.formats)
+    try:
+        name, data = await image_derivatives.get(image_url, bucket(w), fmt)
+    except OriginError as exc:
+        logger.warning("Image for product %s unavailable: %s", product_id, exc)
+        raise HTTPException(status_code=502, detail="Source image unavailable")
+    # The name hashes the source URL, so a new image_url gets a new ETag
+    etag = f'"{name}"'
+    headers = {"ETag": etag, "Cache-Control": image_cache_control, "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return not_modified_response(headers)
+    return Response(data, media_type=IMAGE_MEDIA_TYPES[fmt], headers=headers)
+
+# Categories come from the enum, so they only change with a deploy
+CATEGORIES_BODY = render([{"value": value, "label": label} for value, label in CATEGORY_LABELS.items()])
+CATEGORIES_ETAG = f'"categories-{hashlib.blake2b(CATEGORIES_BODY, digest_size=8).hexdigest()}"'
+CATEGORIES_LAST_MODIFIED = datetime.now(timezone.utc).replace(microsecond=0)
 
 @api_router.get("/categories")
-async def get_categories():
+async def get_categories(request: Request):
     """Get all product categories"""
-    return [{"value": cat.value, "label": cat.value.replace("_", " ").title()} for cat in ProductCategory]
+    headers = conditional_headers(CATEGORIES_ETAG, CATEGORIES_LAST_MODIFIED, categories_cache_control)
+    if is_not_modified(request, CATEGORIES_ETAG, CATEGORIES_LAST_MODIFIED):
+        return not_modified_response(headers)
+    return PrerenderedJSONResponse(CATEGORIES_BODY, headers=headers)
+
+async def load_featured_body(projection: dict) -> bytes:
+    products = await catalog_reader.collection().find({"featured": True}, projection).limit(6).to_list(6)
+    return render(products)
 
-@api_router.get("/featured-products", response_model=List[Product])
-async def get_featured_products():
+@api_router.get("/search/suggest", response_model=List[Suggestion])
+async def suggest_search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100, description="What has been typed so far"),
+    limit: int = Query(8, ge=1, le=MAX_SUGGESTIONS)
+):
+    """Get typeahead suggestions for a partial search, most popular first"""
+    if not suggest_index.ready:
+        # Do not let clients cache the empty answer given while the index builds
+        return PrerenderedJSONResponse(b"[]", headers={"Cache-Control": "no-store"})
+    headers = catalog_headers()
+    if catalog_not_modified(request, headers):
+        return not_modified_response(headers)
+    with timed("suggest"):
+        suggestions = suggest_index.suggest(q, limit)
+    return PrerenderedJSONResponse(render(suggestions), headers=headers)
+
+@api_router.get("/search/suggest/stats")
+async def get_suggest_stats():
+    """Get typeahead index sizes, including an estimate of its memory"""
+    return {**suggest_index.stats(), "memory_bytes": suggest_index.memory_bytes()}
+
+@api_router.get("/featured-products", response_model=Union[List[Product], List[ProductCard]])
+async def get_featured_products(
+    request: Request,
+    view: Optional[ProductView] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated product fields to return instead of a view")
+):
     """Get featured products for homepage"""
-    products = await db.products.find({"featured": True}).limit(6).to_list(6)
-    return [Product(**product) for product in products]
+    fieldset = product_fieldset(view, fields)
+    headers = catalog_headers()
+    if catalog_not_modified(request, headers):
+        return not_modified_response(headers)
+    cache_key = ("featured-products", *fieldset_key(fieldset))
+    body = catalog_cache.get(cache_key)
+    snapshot = active_snapshot()
+    if body is None and snapshot is not None:
+        positions = snapshot.positions(featured=True)[:6]
+        body = render_list(render_snapshot_products(snapshot, positions, fieldset))
+        catalog_cache.set(cache_key, body)
+    elif body is None:
+        generation = catalog_cache.generation
+        projection = fieldset.projection() if fieldset else PRODUCT_PROJECTION
+        body = await catalog_flights.run((generation, *cache_key), lambda: load_featured_body(projection))
+        catalog_cache.set(cache_key, body, generation)
+    return PrerenderedJSONResponse(body, headers=headers)
+
+@api_router.get("/diagnostics/query-plans")
+async def get_query_plans():
+    """Explain every route query shape and flag collection scans and in-memory sorts"""
+    return await explain_query_shapes(db)
+
+@api_router.get("/catalog/snapshot")
+async def get_catalog_snapshot_stats():
+    """Get the catalog snapshot version, size and staleness bound"""
+    return {"enabled": serve_from_snapshot, **catalog_snapshots.stats()}
+
+@api_router.get("/compression/stats")
+async def get_compression_stats():
+    """Get precompressed body cache size and hit/miss counters"""
+    return {"enabled": compress_responses, **compressed_bodies.stats()}
+
+@api_router.get("/admission/stats")
+async def get_admission_stats():
+    """Get concurrency limits, queued requests and admit/shed counters"""
+    return {"enabled": admission_control, **admission.stats()}
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Get catalog cache hit/miss/eviction counters"""
+    return catalog_cache.stats()
 
 # Legacy status endpoints
 @api_router.get("/")
@@ -212,25 +1075,141 @@ async def root():
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    await status_buffer.add(status_obj.dict())
     return status_obj
 
-@api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+@api_router.get("/status", response_model=Union[List[StatusCheck], List[StatusCount]])
+async def get_status_checks(
+    bucket: Optional[StatusBucketUnit] = Query(None, description="Count checks per client per time bucket instead of listing them"),
+    since: Optional[datetime] = Query(None, description="Start of the bucketed window, defaults to one hour ago")
+):
+    # Make this worker's buffered checks visible to its own reads
+    await status_buffer.flush()
+    if bucket is None:
+        status_checks = await db.status_checks.find().sort("timestamp", 1).to_list(1000)
+        return [StatusCheck(**status_check) for status_check in status_checks]
+
+    since = since or datetime.utcnow() - timedelta(hours=1)
+    pipeline = [
+        {"$match": {"timestamp": {"$gte": since}}},
+        {"$group": {
+            "_id": {
+                "client_name": "$client_name",
+                "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": bucket.value}},
+            },
+            "count": {"$sum": 1},
+        }},
+        {"$sort": {"_id.bucket": 1, "_id.client_name": 1}},
+    ]
+    buckets = await db.status_checks.aggregate(pipeline).to_list(None)
+    return [StatusCount(count=row["count"], **row["_id"]) for row in buckets]
+
+@api_router.get("/status/buffer")
+async def get_status_buffer_stats():
+    """Get write-behind counters for status checks"""
+    return status_buffer.stats()
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Innermost, so shed requests still get CORS headers and show up in metrics
+if admission_control:
+    app.add_middleware(
+        AdmissionMiddleware,
+        controller=admission,
+        route=lambda scope: route_template(scope["app"], scope),
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Missing-Ids", "X-Catalog-Staleness"],
 )
 
+if compress_responses:
+    app.add_middleware(
+        CompressionMiddleware,
+        cache=compressed_bodies,
+        min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+    )
+
+# Per-route latency and size metrics; SERVER_TIMING adds a per-request breakdown header
+app.add_middleware(
+    MetricsMiddleware,
+    server_timing=os.environ.get('SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes'),
+)
+
+registry.callback("catalog_cache_entries", "Entries in the catalog read cache",
+                  lambda: catalog_cache.stats()["size"])
+registry.callback("catalog_cache_events_total", "Catalog cache lookups and removals by outcome",
+                  lambda: {(name,): catalog_cache.stats()[name]
+                           for name in ("hits", "misses", "evictions", "expirations", "invalidations")},
+                  ("outcome",), kind="counter")
+registry.callback("catalog_query_flights_total", "Catalog queries by whether they ran or joined one in flight",
+                  lambda: {(name,): catalog_flights.stats()[name]
+                           for name in ("leaders", "coalesced", "failures", "cancellations")},
+                  ("outcome",), kind="counter")
+registry.callback("catalog_query_flights_in_flight", "Distinct catalog queries currently in flight",
+                  lambda: len(catalog_flights))
+registry.callback("catalog_reads_routed_total", "Catalog reads by the member type they were routed to",
+                  lambda: {(target,): count for target, count in catalog_reader.routed.items()},
+                  ("target",), kind="counter")
+registry.callback("mongodb_reads_total", "Read commands by the server that ran them",
+                  lambda: read_distribution.samples(client.delegate.topology_description),
+                  ("address", "server_type"), kind="counter")
+registry.callback("catalog_version", "Current catalog version", lambda: catalog_version.version)
+registry.callback("search_index_products", "Products in the search index", lambda: len(search_index))
+registry.callback("suggest_index_phrases", "Distinct phrases in the typeahead index",
+                  lambda: suggest_index.stats()["phrases"])
+registry.callback("suggest_index_keys", "Word-prefix keys in the typeahead index",
+                  lambda: suggest_index.stats()["keys"])
+registry.callback("related_products_pending", "Product writes waiting for related products to be recomputed",
+                  lambda: related_products.stats()["pending"])
+registry.callback("related_products_memory_bytes", "Memory held by the related products table",
+                  related_products.memory_bytes)
+registry.callback("status_buffer_pending", "Status checks waiting to be written",
+                  lambda: status_buffer.stats()["pending"])
+registry.callback("status_buffer_documents_total", "Status checks by write-behind outcome",
+                  lambda: {(name,): status_buffer.stats()[name] for name in ("written", "dropped")},
+                  ("outcome",), kind="counter")
+
+registry.callback("catalog_snapshot_staleness_seconds", "Upper bound on how far the catalog snapshot lags",
+                  lambda: {} if catalog_snapshots.staleness() is None else catalog_snapshots.staleness())
+registry.callback("catalog_snapshot_products", "Products in the loaded catalog snapshot",
+                  lambda: catalog_snapshots.stats()["products"])
+
+registry.callback("image_cache_bytes", "Bytes of source images and derivatives on disk",
+                  lambda: image_derivatives.stats()["bytes"])
+registry.callback("image_cache_events_total", "Image derivative cache lookups, fetches and encodes by outcome",
+                  lambda: {(name,): image_derivatives.stats()[name]
+                           for name in ("hits", "misses", "evictions", "origin_fetches", "origin_failures", "resizes")},
+                  ("outcome",), kind="counter")
+
+registry.callback("http_admission_limit", "Adaptive limit on concurrently served requests",
+                  lambda: admission.limit.limit)
+registry.callback("http_admission_route_limit", "Adaptive concurrency limit by route",
+                  lambda: {tuple(key.split(" ", 1)): route["limit"]
+                           for key, route in admission.stats()["routes"].items()},
+                  ("method", "route"))
+registry.callback("http_admission_queued", "Requests waiting for a slot by priority class",
+                  lambda: {(name,): count for name, count in admission.stats()["queued"].items()},
+                  ("class",))
+registry.callback("http_admission_requests_total", "Requests by priority class and admission outcome",
+                  lambda: dict(admission.outcomes), ("class", "outcome"), kind="counter")
+
+registry.callback("compression_cache_bytes", "Bytes of precompressed response bodies held in memory",
+                  lambda: compressed_bodies.bytes)
+registry.callback("compression_cache_events_total", "Precompressed body lookups and evictions by outcome",
+                  lambda: {(name,): compressed_bodies.stats()[name] for name in ("hits", "misses", "evictions")},
+                  ("outcome",), kind="counter")
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -238,6 +1217,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+catalog_watch_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_catalog_watcher():
+    global catalog_watch_task
+    if watch_catalog:
+        catalog_watch_task = asyncio.create_task(catalog_events.watch(db.products))
+
+@app.on_event("startup")
+async def start_catalog_snapshots():
+    global catalog_snapshot_task
+    if serve_from_snapshot:
+        catalog_snapshot_task = asyncio.create_task(catalog_snapshots.run())
+
+@app.on_event("startup")
+async def start_related_products():
+    global related_products_task
+    related_products_task = asyncio.create_task(related_products.run())
+
+@app.on_event("startup")
+async def start_status_buffer():
+    status_buffer.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in (catalog_watch_task, catalog_version_task, catalog_views_task, index_task,
+                 catalog_snapshot_task, related_products_task):
+        if task is not None:
+            task.cancel()
+    await status_buffer.close()
+    catalog_snapshots.close()
+    await image_derivatives.close()
     client.close()
\ No newline at end of file
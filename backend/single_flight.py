@@ -0,0 +1,72 @@
+"""Coalescing of identical concurrent catalog queries.
+
+The first request for a key starts the query; requests arriving while it is
+in flight await the same task and get its result or its exception. The task
+is shielded from any single waiter's cancellation and cancelled only once
+every waiter has gone. Nothing is kept after the task finishes, so this
+works with or without a result cache in front of it.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.cancellations = 0
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def run(self, key: Hashable, query: Callable[[], Awaitable[Any]]) -> Any:
+        """Await ``query()``, or the identical query already in flight under ``key``."""
+        if not self.enabled:
+            return await query()
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(query()))
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller went away; later callers start a fresh query
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.cancellations += 1
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _finish(self, key: Hashable, flight: _Flight):
+        self._forget(key, flight)
+        if not flight.task.cancelled() and flight.task.exception() is not None:
+            self.failures += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "cancellations": self.cancellations,
+        }
@@ -0,0 +1,432 @@
+"""In-memory prefix index for search-box typeahead.
+
+Suggestions are distinct phrases (product names, spiritual benefits,
+materials and category labels), weighted by how many products carry them,
+with featured products counting extra. Each phrase is reachable from the
+start of every one of its words, so "quartz" suggests "Rose Quartz".
+
+A key is a reference to one word start of one phrase; its text is sliced
+from the phrase on demand, so a key costs eight bytes. Keys are kept in
+sorted runs searched with ``bisect``, and the keys starting with a prefix
+form one contiguous range per run. Each run also keeps the best phrases of
+every block of ``BLOCK`` keys and of every node of a segment tree over those
+blocks, so the best phrases of any range come from O(log n) precomputed
+lists plus two partial blocks, however short the prefix.
+
+Writes update those lists along the tree paths of the changed phrases'
+keys. A weight increase is applied in place; a decrease that might let a
+phrase outside a full list overtake it marks the node and its ancestors
+stale, to be recomputed when next read. Keys of new phrases go to a small
+sorted buffer, which is merged into a recent run, which is merged into the
+main run once it has grown large enough.
+"""
+import bisect
+import heapq
+import itertools
+import sys
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from catalog_events import CatalogChange
+from search_index import TOKEN_RE
+
+# Phrase kinds, in the product fields they come from
+KIND_FIELDS = {
+    "name": "name",
+    "benefit": "spiritual_benefits",
+    "material": "materials",
+}
+
+# A featured product counts this many times towards its phrases' weight
+FEATURED_WEIGHT = 4
+
+# Keys are compared on at most this many characters
+MAX_KEY_LENGTH = 24
+# Words a phrase can be found by, counted from its start
+MAX_WORD_KEYS = 6
+
+# Keys per block of a run's segment tree
+BLOCK = 64
+# Ranges up to this many keys are scanned instead of read from the tree
+SCAN_LIMIT = 2 * BLOCK
+
+# Buffered keys are merged into the recent run once there are this many
+PENDING_LIMIT = 1024
+# The recent run is merged into the main run once it is this fraction of it
+RECENT_FRACTION = 0.125
+
+# Ranks order phrases heaviest first, then oldest first; dead phrases rank here
+DEAD = 1 << 62
+# A key packs its phrase id with the offset of its word in the phrase
+OFFSET_BITS = 8
+
+
+def normalize(text: str) -> str:
+    return " ".join(TOKEN_RE.findall(text.casefold()))
+
+
+def word_offsets(normalized: str) -> List[int]:
+    offsets, start = [], 0
+    while start < min(len(normalized), 1 << OFFSET_BITS) and len(offsets) < MAX_WORD_KEYS:
+        offsets.append(start)
+        space = normalized.find(" ", start)
+        if space < 0:
+            break
+        start = space + 1
+    return offsets
+
+
+def _successor(prefix: str) -> str:
+    """The smallest string greater than every string starting with ``prefix``."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class _KeyRun:
+    """Sorted keys with a segment tree of the best phrases per block.
+
+    ``None`` marks a stale tree node; a stale node's ancestors are stale too.
+    """
+
+    def __init__(self, refs: Iterable[int], key: Callable[[int], str], ranks: Sequence[int], top: int):
+        self.refs = array("q", refs)
+        self.key = key
+        self.ranks = ranks
+        self.top = top
+        blocks = -(-len(self.refs) // BLOCK)
+        self.size = 1
+        while self.size < blocks:
+            self.size *= 2
+        self.nodes: List[Optional[List[int]]] = [None] * (2 * self.size)
+        if self.refs:
+            self._node(1)
+
+    def __len__(self):
+        return len(self.refs)
+
+    def range(self, prefix: str, upper: str):
+        return (bisect.bisect_left(self.refs, prefix, key=self.key),
+                bisect.bisect_left(self.refs, upper, key=self.key))
+
+    def _position(self, ref: int) -> Optional[int]:
+        lo, hi = self.range(self.key(ref), self.key(ref) + "\0")
+        position = bisect.bisect_left(self.refs, ref, lo, hi)
+        return position if position < hi and self.refs[position] == ref else None
+
+    def _live(self, refs) -> set:
+        ranks = self.ranks
+        return {ref >> OFFSET_BITS for ref in refs if ranks[ref >> OFFSET_BITS] < DEAD}
+
+    def _node(self, node: int) -> List[int]:
+        best = self.nodes[node]
+        if best is None:
+            if node >= self.size:
+                start = (node - self.size) * BLOCK
+                candidates = self._live(self.refs[start:start + BLOCK])
+            else:
+                candidates = set(itertools.chain(self._node(2 * node), self._node(2 * node + 1)))
+            best = self.nodes[node] = heapq.nsmallest(self.top, candidates, key=self.ranks.__getitem__)
+        return best
+
+    def _invalidate(self, node: int):
+        while node and self.nodes[node] is not None:
+            self.nodes[node] = None
+            node //= 2
+
+    def reweigh(self, ref: int, improved: bool) -> bool:
+        """Bring the lists on ``ref``'s tree path up to date with its phrase's new rank.
+
+        Returns False if ``ref`` is not in this run.
+        """
+        position = self._position(ref)
+        if position is None:
+            return False
+        phrase_id = ref >> OFFSET_BITS
+        rank = self.ranks[phrase_id]
+        node = self.size + position // BLOCK
+        while node:
+            best = self.nodes[node]
+            if best is None:
+                break
+            full = len(best) == self.top
+            if phrase_id in best:
+                best.remove(phrase_id)
+                if rank < DEAD and (improved or not full or (best and rank < self.ranks[best[-1]])):
+                    bisect.insort(best, phrase_id, key=self.ranks.__getitem__)
+                elif full:
+                    # Something outside the list may now outrank it
+                    self._invalidate(node)
+                    break
+            elif rank < DEAD and (not full or rank < self.ranks[best[-1]]):
+                bisect.insort(best, phrase_id, key=self.ranks.__getitem__)
+                if len(best) > self.top:
+                    best.pop()
+            node //= 2
+        return True
+
+    def candidates(self, lo: int, hi: int, limit: int) -> Iterable[int]:
+        """Phrases including the best ``limit`` live phrases of keys ``lo:hi``."""
+        if hi - lo <= SCAN_LIMIT:
+            return self._live(self.refs[lo:hi])
+        first, last = -(-lo // BLOCK), hi // BLOCK
+        candidates = self._live(itertools.chain(self.refs[lo:first * BLOCK], self.refs[last * BLOCK:hi]))
+        # Iterative segment tree walk over the whole blocks first:last
+        left, right = first + self.size, last + self.size
+        while left < right:
+            if left & 1:
+                candidates.update(self._node(left)[:limit])
+                left += 1
+            if right & 1:
+                right -= 1
+                candidates.update(self._node(right)[:limit])
+            left //= 2
+            right //= 2
+        return candidates
+
+
+class SuggestIndex:
+    """Popularity-weighted phrase prefixes over the catalog.
+
+    ``categories`` maps category values to their labels; categories are
+    always suggested, even before any product is in them.
+    """
+
+    def __init__(self, categories: Optional[Dict[str, str]] = None, max_limit: int = 20):
+        self.max_limit = max_limit
+        self._categories = dict(categories or {})
+        self.clear()
+
+    def clear(self):
+        self._ready = False
+        # Phrases by id; ids are not reused, a dropped phrase's text is None
+        self._texts: List[Optional[str]] = []
+        self._normalized: List[Optional[str]] = []
+        self._kinds: List[str] = []
+        self._values: List[Optional[str]] = []
+        self._counts = array("q")
+        self._featured = array("q")
+        self._ranks = array("q")
+        self._pinned: set = set()
+        self._phrase_ids: Dict[str, Dict[str, int]] = {}
+        # product id -> packed [featured, *phrase ids]
+        self._doc_phrases: Dict[str, bytes] = {}
+        self._main = self._run(())
+        self._recent = self._run(())
+        # Keys not yet in a run, kept sorted once ready
+        self._pending: List[int] = []
+        self._dead = 0
+        for value, label in self._categories.items():
+            phrase_id = self._phrase(label, "category", value)
+            self._pinned.add(phrase_id)
+            self._rerank(phrase_id)
+
+    def __len__(self) -> int:
+        return len(self._doc_phrases)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    @ready.setter
+    def ready(self, value: bool):
+        # Keys added during a rebuild are sorted and indexed once, here
+        if value and not self._ready:
+            self._pending.sort(key=self._sort_key)
+            self._compact()
+        self._ready = value
+
+    # Keys
+
+    def _key(self, ref: int) -> str:
+        offset = ref & ((1 << OFFSET_BITS) - 1)
+        return self._normalized[ref >> OFFSET_BITS][offset:offset + MAX_KEY_LENGTH]
+
+    def _sort_key(self, ref: int):
+        return self._key(ref), ref
+
+    def _refs(self, phrase_id: int) -> List[int]:
+        return [(phrase_id << OFFSET_BITS) | offset for offset in word_offsets(self._normalized[phrase_id])]
+
+    def _run(self, refs: Iterable[int]) -> _KeyRun:
+        return _KeyRun(refs, self._key, self._ranks, self.max_limit)
+
+    # Phrases and weights
+
+    def _phrase(self, text: str, kind: str, value: str) -> Optional[int]:
+        normalized = normalize(text)
+        if not normalized:
+            return None
+        phrases = self._phrase_ids.setdefault(kind, {})
+        phrase_id = phrases.get(normalized)
+        if phrase_id is not None:
+            return phrase_id
+        phrase_id = phrases[normalized] = len(self._texts)
+        self._texts.append(text)
+        self._normalized.append(normalized)
+        self._kinds.append(kind)
+        self._values.append(value)
+        self._counts.append(0)
+        self._featured.append(0)
+        self._ranks.append(DEAD)
+        for ref in self._refs(phrase_id):
+            if self._ready:
+                bisect.insort(self._pending, ref, key=self._sort_key)
+            else:
+                self._pending.append(ref)
+        return phrase_id
+
+    def _product_phrases(self, product: dict) -> List[int]:
+        phrases = []
+        for kind, field_name in KIND_FIELDS.items():
+            values = product.get(field_name) or ()
+            if isinstance(values, str):
+                values = (values,)
+            phrases.extend(self._phrase(value, kind, value) for value in values)
+        category = product.get("category")
+        if category in self._categories:
+            phrases.append(self._phrase(self._categories[category], "category", category))
+        return [phrase_id for phrase_id in dict.fromkeys(phrases) if phrase_id is not None]
+
+    def _rerank(self, phrase_id: int) -> bool:
+        """Recompute the rank of ``phrase_id``; return whether it improved."""
+        alive = self._counts[phrase_id] > 0 or phrase_id in self._pinned
+        previous = self._ranks[phrase_id]
+        if not alive and previous < DEAD:
+            self._dead += 1
+        weight = self._counts[phrase_id] + FEATURED_WEIGHT * self._featured[phrase_id]
+        self._ranks[phrase_id] = -(weight << 32) + phrase_id if alive else DEAD
+        return self._ranks[phrase_id] < previous
+
+    def _update(self, product_id: str, phrase_ids: List[int], featured: bool):
+        deltas: Dict[int, List[int]] = {}
+        packed = self._doc_phrases.pop(product_id, None)
+        if packed is not None:
+            old_featured, *old_ids = array("q", packed)
+            for phrase_id in old_ids:
+                deltas[phrase_id] = [-1, -old_featured]
+        for phrase_id in phrase_ids:
+            delta = deltas.setdefault(phrase_id, [0, 0])
+            delta[0] += 1
+            delta[1] += featured
+        # Phrases a rewritten product keeps with the same weight are left alone
+        for phrase_id, (count, featured_count) in deltas.items():
+            if count or featured_count:
+                self._counts[phrase_id] += count
+                self._featured[phrase_id] += featured_count
+                self._reweigh(phrase_id, self._rerank(phrase_id))
+        if phrase_ids:
+            self._doc_phrases[product_id] = array("q", [featured, *phrase_ids]).tobytes()
+        self._maybe_compact()
+
+    def add(self, product: dict):
+        featured = bool(product.get("featured"))
+        self._update(product["id"], self._product_phrases(product), featured)
+
+    def remove(self, product_id: str):
+        self._update(product_id, [], False)
+
+    def rebuild(self, products: Iterable[dict]):
+        self.clear()
+        for product in products:
+            self.add(product)
+        self.ready = True
+
+    async def on_catalog_change(self, change: CatalogChange):
+        for product_id in change.deleted:
+            self.remove(product_id)
+        for product in change.upserted:
+            self.add(product)
+
+    def _reweigh(self, phrase_id: int, improved: bool):
+        if not self._ready:
+            return
+        for ref in self._refs(phrase_id):
+            if not self._main.reweigh(ref, improved):
+                # Keys still in the buffer are scanned on every lookup
+                self._recent.reweigh(ref, improved)
+
+    # Lookup
+
+    def suggest(self, query: str, limit: int = 8) -> List[dict]:
+        """The ``limit`` heaviest phrases with a word starting with ``query``."""
+        prefix = normalize(query)
+        if not prefix or not self._ready:
+            return []
+        limit = min(limit, self.max_limit)
+        key = prefix[:MAX_KEY_LENGTH]
+        upper = _successor(key)
+        truncated = len(prefix) > MAX_KEY_LENGTH
+        candidates = set()
+        for run in (self._main, self._recent):
+            lo, hi = run.range(key, upper)
+            # Keys are cut short, so a long query checks every match's full text below
+            candidates.update(run.candidates(lo, hi, hi - lo if truncated else limit))
+        lo = bisect.bisect_left(self._pending, key, key=self._key)
+        hi = bisect.bisect_left(self._pending, upper, key=self._key)
+        candidates.update(ref >> OFFSET_BITS for ref in self._pending[lo:hi])
+        ranks = self._ranks
+        candidates = [phrase_id for phrase_id in candidates if ranks[phrase_id] < DEAD]
+        if truncated:
+            candidates = [phrase_id for phrase_id in candidates
+                          if f" {prefix}" in f" {self._normalized[phrase_id]}"]
+        return [
+            {"text": self._texts[phrase_id], "kind": self._kinds[phrase_id],
+             "value": self._values[phrase_id], "count": self._counts[phrase_id]}
+            for phrase_id in heapq.nsmallest(limit, candidates, key=ranks.__getitem__)
+        ]
+
+    # Maintenance
+
+    def _maybe_compact(self):
+        if not self._ready:
+            return
+        if len(self._pending) >= PENDING_LIMIT:
+            self._recent = self._run(heapq.merge(self._recent.refs, self._pending, key=self._sort_key))
+            self._pending = []
+        if (len(self._recent) > RECENT_FRACTION * len(self._main)
+                or self._dead > RECENT_FRACTION * len(self._texts)):
+            self._compact()
+
+    def _compact(self):
+        """Merge every key into the main run, dropping phrases no product carries."""
+        dropped = set()
+        for phrases in self._phrase_ids.values():
+            for normalized, phrase_id in list(phrases.items()):
+                if self._ranks[phrase_id] == DEAD:
+                    del phrases[normalized]
+                    dropped.add(phrase_id)
+
+        def kept(refs):
+            return (ref for ref in refs if ref >> OFFSET_BITS not in dropped)
+
+        merged = heapq.merge(kept(self._main.refs), kept(self._recent.refs), kept(self._pending),
+                             key=self._sort_key)
+        for phrase_id in dropped:
+            self._texts[phrase_id] = self._normalized[phrase_id] = self._values[phrase_id] = None
+        self._main = self._run(list(merged))
+        self._recent = self._run(())
+        self._pending = []
+        self._dead = 0
+
+    def memory_bytes(self) -> int:
+        """Approximate bytes held by the index; walks every phrase, so keep it off hot paths."""
+        size = sum(sys.getsizeof(container) for container in (
+            self._texts, self._normalized, self._kinds, self._values, self._counts, self._featured,
+            self._ranks, self._pinned, self._doc_phrases, self._pending))
+        size += sum(sys.getsizeof(phrases) for phrases in self._phrase_ids.values())
+        for strings in (self._texts, self._normalized):
+            size += sum(sys.getsizeof(text) for text in strings if text is not None)
+        size += sum(sys.getsizeof(product_id) + sys.getsizeof(packed)
+                    for product_id, packed in self._doc_phrases.items())
+        for run in (self._main, self._recent):
+            size += sys.getsizeof(run.refs) + sys.getsizeof(run.nodes)
+            size += sum(sys.getsizeof(best) for best in run.nodes if best is not None)
+        return size
+
+    def stats(self) -> dict:
+        return {
+            "ready": self._ready,
+            "products": len(self._doc_phrases),
+            "phrases": sum(len(phrases) for phrases in self._phrase_ids.values()),
+            "keys": len(self._main) + len(self._recent) + len(self._pending),
+            "pending_keys": len(self._pending),
+        }
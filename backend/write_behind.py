@@ -0,0 +1,150 @@
+"""Write-behind buffer that group-commits inserts into MongoDB."""
+import asyncio
+import logging
+from typing import List, Optional
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Queue documents in memory and insert them in batches.
+
+    A batch is flushed as soon as ``max_batch`` documents are pending or
+    ``max_delay`` seconds after the previous flush, whichever comes first.
+    Batches that fail to reach the server are put back for the next flush; if
+    MongoDB stays down the oldest documents beyond ``max_pending`` are dropped
+    rather than growing without bound. Documents the server rejects one by one
+    are logged and dropped, since retrying them would fail the same way.
+
+    ``add`` applies backpressure: while ``max_pending`` documents are waiting
+    it blocks until a flush makes room, for at most ``max_wait`` seconds, and
+    then drops the oldest pending document to make room itself.
+    """
+
+    DUPLICATE_KEY = 11000
+
+    def __init__(self, collection, max_batch: int = 500, max_delay: float = 1.0,
+                 max_pending: int = 50000, max_wait: float = 5.0):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self._pending: List[dict] = []
+        self._wake = asyncio.Event()
+        # Set while fewer than max_pending documents are waiting
+        self._room = asyncio.Event()
+        self._room.set()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def add(self, document: dict):
+        if len(self._pending) >= self.max_pending:
+            await self._wait_for_room()
+        self._pending.append(document)
+        if len(self._pending) >= self.max_pending:
+            self._room.clear()
+        if len(self._pending) >= self.max_batch:
+            self._wake.set()
+
+    async def _wait_for_room(self):
+        self._wake.set()
+        if self._task is None:
+            await self.flush()
+        else:
+            try:
+                await asyncio.wait_for(self._room.wait(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+        overflow = len(self._pending) - self.max_pending + 1
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.dropped += overflow
+            logger.error("Write-behind buffer for %s full, dropped %d documents",
+                         self.collection.name, overflow)
+
+    def _made_room(self):
+        if len(self._pending) < self.max_pending:
+            self._room.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:len(batch)]
+                self._made_room()
+                try:
+                    await self.collection.insert_many(batch, ordered=False)
+                except BulkWriteError as exc:
+                    # insert_many assigned each document an _id, so a duplicate
+                    # key means an earlier attempt already stored it
+                    errors = exc.details.get("writeErrors", [])
+                    rejected = [error for error in errors if error.get("code") != self.DUPLICATE_KEY]
+                    if rejected:
+                        self.dropped += len(rejected)
+                        logger.error("Write-behind insert into %s rejected %d documents: %s",
+                                     self.collection.name, len(rejected), rejected[0].get("errmsg"))
+                    self.written += len(batch) - len(errors)
+                    self.batches += 1
+                    continue
+                except PyMongoError as exc:
+                    self.failed_batches += 1
+                    logger.warning("Write-behind flush to %s failed: %s", self.collection.name, exc)
+                    self._requeue(batch)
+                    return
+                except asyncio.CancelledError:
+                    # close() cancelled the flusher mid-insert; it drains the batch with the rest
+                    self._pending[:0] = batch
+                    raise
+                self.written += len(batch)
+                self.batches += 1
+
+    def _requeue(self, batch: List[dict]):
+        self._pending[:0] = batch
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.dropped += overflow
+            logger.error("Write-behind buffer for %s full, dropped %d documents",
+                         self.collection.name, overflow)
+        if len(self._pending) >= self.max_pending:
+            self._room.clear()
+
+    async def close(self):
+        """Stop the background flusher and drain everything still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "written": self.written,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Overload benchmark: per-route p99 latency with and without admission control.
+
+Drives a simulated API in-process (no server or MongoDB involved) with an
+open-loop Poisson arrival stream above its capacity, once bare and once
+behind ``AdmissionMiddleware``. The simulated database serves ``--db-slots``
+queries at a time, each taking ``--query-ms``; every request also spends
+``--cpu-ms`` of event loop time. Catalog reads and status writes query the
+database, ``/api/categories`` does not. Requests still waiting after
+``--client-timeout`` count as timeouts, like a client giving up.
+
+Shed requests (503) are counted separately from the latency of served ones.
+To measure a real server instead, run load_test.py against it with
+ADMISSION_CONTROL=true and false.
+
+    python benchmarks/admission_bench.py --rate 3000 --duration 10
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from admission import AdmissionController, AdmissionMiddleware  # noqa: E402
+
+# (name, method, route template, share of traffic, queries per request)
+WORKLOAD = (
+    ("list", "GET", "/api/products", 0.35, 1),
+    ("detail", "GET", "/api/products/{product_id}", 0.35, 1),
+    ("categories", "GET", "/api/categories", 0.10, 0),
+    ("status_write", "POST", "/api/status", 0.15, 1),
+    ("status_read", "GET", "/api/status", 0.05, 2),
+)
+
+
+class SimulatedAPI:
+    """An ASGI app whose cost is event loop time plus bounded database work."""
+
+    def __init__(self, db_slots: int, query_ms: float, cpu_ms: float):
+        self.database = asyncio.Semaphore(db_slots)
+        self.query = query_ms / 1000
+        self.cpu = cpu_ms / 1000
+        self.queries = {route: queries for _, _, route, _, queries in WORKLOAD}
+
+    async def __call__(self, scope, receive, send):
+        deadline = time.perf_counter() + self.cpu
+        while time.perf_counter() < deadline:
+            pass
+        for _ in range(self.queries[scope["route"]]):
+            async with self.database:
+                await asyncio.sleep(self.query * random.uniform(0.5, 1.5))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50_ms": None, "p99_ms": None}
+    samples = sorted(samples)
+    pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1e3, 1)  # noqa: E731
+    return {"p50_ms": pick(0.50), "p99_ms": pick(0.99)}
+
+
+async def request(app, name: str, method: str, route: str, timeout: float, results: dict):
+    scope = {"type": "http", "method": method, "path": route, "route": route}
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(app(scope, receive, send), timeout)
+    except asyncio.TimeoutError:
+        results[name]["timeouts"] += 1
+        return
+    if status[0] == 503:
+        results[name]["shed"] += 1
+    else:
+        results[name]["latencies"].append(time.perf_counter() - started)
+
+
+async def run(args, admission: bool) -> dict:
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+    app = SimulatedAPI(args.db_slots, args.query_ms, args.cpu_ms)
+    controller = None
+    if admission:
+        controller = AdmissionController(initial_limit=args.initial_limit, max_queue=args.max_queue)
+        app = AdmissionMiddleware(app, controller, route=lambda scope: scope["route"])
+    results = defaultdict(lambda: {"latencies": [], "shed": 0, "timeouts": 0})
+    weights = [share for _, _, _, share, _ in WORKLOAD]
+    tasks = []
+    started = time.perf_counter()
+    next_at = started
+    while next_at - started < args.duration:
+        next_at += rng.expovariate(args.rate)
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        name, method, route, _, _ = rng.choices(WORKLOAD, weights)[0]
+        tasks.append(asyncio.create_task(request(app, name, method, route, args.client_timeout, results)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    report = {"requests": len(tasks), "elapsed_seconds": round(elapsed, 1), "routes": {}}
+    for name, *_ in WORKLOAD:
+        entry = results[name]
+        report["routes"][name] = {
+            "served": len(entry["latencies"]), "shed": entry["shed"], "timeouts": entry["timeouts"],
+            **percentiles(entry["latencies"]),
+        }
+    report["goodput_per_second"] = round(
+        sum(len(entry["latencies"]) for entry in results.values()) / elapsed)
+    if controller is not None:
+        report["final_limit"] = round(controller.limit.limit, 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=float, default=3000, help="offered requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of arrivals")
+    parser.add_argument("--db-slots", type=int, default=8, help="concurrent simulated queries")
+    parser.add_argument("--query-ms", type=float, default=4.0)
+    parser.add_argument("--cpu-ms", type=float, default=0.05, help="event loop time per request")
+    parser.add_argument("--client-timeout", type=float, default=5.0)
+    parser.add_argument("--initial-limit", type=int, default=64)
+    parser.add_argument("--max-queue", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    capacity = args.db_slots / (args.query_ms / 1000) / sum(
+        share * queries for _, _, _, share, queries in WORKLOAD)
+    results = {
+        "capacity_per_second": round(capacity),
+        "rate": args.rate,
+        "without": asyncio.run(run(args, admission=False)),
+        "with": asyncio.run(run(args, admission=True)),
+    }
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"offered {args.rate:.0f} req/s against ~{capacity:.0f} req/s of database capacity "
+          f"for {args.duration:.0f}s")
+    for mode in ("without", "with"):
+        report = results[mode]
+        limit = f", final limit {report['final_limit']}" if "final_limit" in report else ""
+        print(f"  {mode} admission control: goodput {report['goodput_per_second']} req/s{limit}")
+        for name, route in report["routes"].items():
+            p50 = "-" if route["p50_ms"] is None else f"{route['p50_ms']:8.1f}"
+            p99 = "-" if route["p99_ms"] is None else f"{route['p99_ms']:8.1f}"
+            print(f"    {name:>12}: p50 {p50:>8} ms  p99 {p99:>8} ms  served {route['served']:6d}  "
+                  f"shed {route['shed']:6d}  timeouts {route['timeouts']:6d}")
+
+
+if __name__ == "__main__":
+    main()
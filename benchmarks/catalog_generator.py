@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Synthetic product catalog for load tests.
+
+Generates 10k-1M products shaped like the seed catalog: per-category
+materials and spiritual benefits drawn from a Zipf-like distribution (a few
+very common values, a long tail), log-normal prices, ~5% featured and ~90% in
+stock. Documents are bulk-loaded into MongoDB with unordered ``insert_many``
+batches; indexes are left to the server's startup reconciliation.
+
+    python benchmarks/catalog_generator.py --products 100000 \\
+        --mongo-url mongodb://localhost:27017 --db-name mystic_bench
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterator, List, Sequence
+
+from pymongo import MongoClient
+
+CATEGORIES = {
+    # category: (share of catalog, median price)
+    "crystals": (0.30, 40.0),
+    "healing_stones": (0.22, 25.0),
+    "spiritual_jewelry": (0.18, 70.0),
+    "amulets": (0.12, 45.0),
+    "talismans": (0.10, 55.0),
+    "protection_charms": (0.08, 30.0),
+}
+
+MATERIALS = {
+    "crystals": ["Clear Quartz", "Amethyst", "Rose Quartz", "Citrine", "Selenite", "Smoky Quartz",
+                 "Fluorite", "Labradorite", "Celestite", "Wood base", "Brass stand"],
+    "healing_stones": ["Rose Quartz", "Black Tourmaline", "Jade", "Carnelian", "Lapis Lazuli",
+                       "Moonstone", "Hematite", "Obsidian", "Aventurine", "Tiger Eye"],
+    "spiritual_jewelry": ["Sterling Silver", "Gold Plated", "Black Onyx", "Amethyst", "Lava Stone",
+                          "Leather Cord", "Copper", "Turquoise", "Freshwater Pearl", "Rudraksha"],
+    "amulets": ["Bronze", "Sterling Silver", "Brass", "Evil Eye Glass", "Pewter", "Copper",
+                "Silk Cord", "Sandalwood"],
+    "talismans": ["Brass", "Parchment", "Sterling Silver", "Copper", "Wood", "Bone", "Tin",
+                  "Red String"],
+    "protection_charms": ["Black Tourmaline", "Evil Eye Glass", "Red String", "Obsidian", "Silver",
+                          "Salt", "Cotton Cord", "Blue Glass"],
+}
+
+BENEFITS = {
+    "crystals": ["Mental clarity", "Energy amplification", "Peaceful sleep", "Stress relief",
+                 "Enhanced intuition", "Chakra balancing", "Manifestation power", "Focus",
+                 "Sacred space creation", "Cleansing"],
+    "healing_stones": ["Emotional healing", "Self-love", "Grounding", "Compassion", "Stress relief",
+                       "Heart chakra activation", "Vitality", "Courage", "Calm", "Balance"],
+    "spiritual_jewelry": ["Spiritual protection", "Positive energy", "Confidence", "Grounding",
+                          "Meditation aid", "Inner peace", "Good fortune", "Clarity"],
+    "amulets": ["Ward off evil", "Good fortune", "Spiritual protection", "Ancestral blessing",
+                "Safe travels", "Prosperity", "Strength"],
+    "talismans": ["Prosperity", "Success", "Good fortune", "Wisdom", "Courage", "Love attraction",
+                  "Career growth"],
+    "protection_charms": ["Ward off evil", "Negative energy shield", "Home protection",
+                          "Spiritual protection", "Safe travels", "Peace of mind"],
+}
+
+FORMS = {
+    "crystals": ["Cluster", "Point", "Tower", "Sphere", "Geode", "Grid", "Wand"],
+    "healing_stones": ["Heart Stone", "Palm Stone", "Tumbled Set", "Worry Stone", "Pendulum"],
+    "spiritual_jewelry": ["Necklace", "Bracelet", "Mala", "Ring", "Pendant", "Earrings"],
+    "amulets": ["Amulet", "Pendant", "Medallion", "Hamsa", "Coin"],
+    "talismans": ["Talisman", "Seal", "Scroll", "Coin", "Sigil Plate"],
+    "protection_charms": ["Charm", "Wall Hanging", "Keychain", "Bracelet", "Pouch"],
+}
+
+ADJECTIVES = ["Sacred", "Mystic", "Celestial", "Ancient", "Radiant", "Lunar", "Solar", "Harmony",
+              "Serene", "Divine", "Enchanted", "Golden", "Moonlit", "Blessed", "Guardian"]
+
+ORIGINS = ["Brazil", "Madagascar", "India", "Nepal", "Tibet", "Turkey", "Morocco", "Mexico",
+           "Uruguay", "China", "Handcrafted", "Peru", "Sri Lanka"]
+
+IMAGE_URL = "https://images.unsplash.com/photo-1521133573892-e44906baee46?crop=entropy&cs=srgb&fm=jpg&q=85"
+
+
+def zipf_weights(count: int, exponent: float = 1.1) -> List[float]:
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def _sample(rng: random.Random, values: Sequence[str], weights: Sequence[float], k: int) -> List[str]:
+    """``k`` distinct values, weighted without replacement."""
+    chosen: List[str] = []
+    pool, pool_weights = list(values), list(weights)
+    for _ in range(min(k, len(pool))):
+        index = rng.choices(range(len(pool)), pool_weights)[0]
+        chosen.append(pool.pop(index))
+        pool_weights.pop(index)
+    return chosen
+
+
+def search_terms() -> List[str]:
+    """Words the load driver can search for; all of them occur in the catalog."""
+    words = set(ADJECTIVES)
+    for values in (*MATERIALS.values(), *BENEFITS.values(), *FORMS.values()):
+        for value in values:
+            words.update(value.split())
+    return sorted(word.lower() for word in words if len(word) > 2)
+
+
+def generate_products(count: int, seed: int = 42) -> Iterator[dict]:
+    rng = random.Random(seed)
+    categories = list(CATEGORIES)
+    shares = [CATEGORIES[name][0] for name in categories]
+    material_weights = {name: zipf_weights(len(values)) for name, values in MATERIALS.items()}
+    benefit_weights = {name: zipf_weights(len(values)) for name, values in BENEFITS.items()}
+    origin_weights = zipf_weights(len(ORIGINS), 0.8)
+    now = datetime.utcnow()
+    for _ in range(count):
+        category = rng.choices(categories, shares)[0]
+        materials = _sample(rng, MATERIALS[category], material_weights[category],
+                            rng.choices([1, 2, 3, 4], [50, 30, 15, 5])[0])
+        benefits = _sample(rng, BENEFITS[category], benefit_weights[category],
+                           rng.choices([2, 3, 4, 5], [15, 35, 35, 15])[0])
+        form = rng.choice(FORMS[category])
+        price = round(rng.lognormvariate(math.log(CATEGORIES[category][1]), 0.6), 2)
+        created_at = now - timedelta(seconds=rng.randrange(2 * 365 * 86400))
+        name = f"{rng.choice(ADJECTIVES)} {materials[0]} {form}"
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "name": name,
+            "description": f"{name} for {benefits[0].lower()} and {benefits[-1].lower()}. "
+                           f"Made from {', '.join(materials).lower()}.",
+            "price": max(price, 1.0),
+            "category": category,
+            "image_url": IMAGE_URL,
+            "spiritual_benefits": benefits,
+            "materials": materials,
+            "origin": rng.choices(ORIGINS, origin_weights)[0],
+            "featured": rng.random() < 0.05,
+            "in_stock": rng.random() < 0.9,
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+
+
+def load_catalog(db, count: int, seed: int = 42, batch_size: int = 10000, drop: bool = True) -> float:
+    """Bulk-load ``count`` generated products; return the elapsed seconds."""
+    products = db.products
+    if drop:
+        products.drop()
+    started = time.perf_counter()
+    batch: List[dict] = []
+    loaded = 0
+    for product in generate_products(count, seed):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            products.insert_many(batch, ordered=False)
+            loaded += len(batch)
+            batch = []
+            print(f"  {loaded}/{count}", end="\r", file=sys.stderr)
+    if batch:
+        products.insert_many(batch, ordered=False)
+    # Running servers pick the new catalog up through the version poll
+    db.catalog_meta.update_one(
+        {"_id": "products"},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+    )
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="mystic_bench")
+    parser.add_argument("--append", action="store_true", help="keep existing products")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_url)
+    try:
+        elapsed = load_catalog(client[args.db_name], args.products, args.seed,
+                               args.batch_size, drop=not args.append)
+    finally:
+        client.close()
+    print(f"Loaded {args.products} products into {args.db_name} in {elapsed:.1f}s "
+          f"({args.products / elapsed:,.0f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
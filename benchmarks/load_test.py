@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+HTTP load test for the catalog API.
+
+Replays a weighted mix of list, search, filter, detail, featured and status
+calls against a running backend, either closed-loop at a fixed concurrency or
+open-loop at a fixed request rate, and reports p50/p95/p99 latency and
+throughput per endpoint as JSON, along with the size of a listing page in
+each product view. Open-loop latency is measured from each
+request's scheduled start, so a stalled server is not hidden by the driver
+slowing down with it.
+
+Results can be saved as a named baseline under ``benchmarks/baselines`` and a
+later run compared against it; the comparison exits non-zero on regression.
+
+    # local mongod, generated catalog, server started by the driver
+    python benchmarks/load_test.py --start-server --products 100000 \\
+        --concurrency 32 --duration 30 --save-baseline local-100k
+    python benchmarks/load_test.py --start-server --concurrency 32 \\
+        --duration 30 --compare local-100k
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from catalog_generator import CATEGORIES, load_catalog, search_terms
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+DEFAULT_MIX = "list=30,search=15,filter=20,detail=25,featured=5,status=5"
+
+# Product views whose page sizes are reported; "full" is the default response
+VIEWS = ("full", "card", "detail")
+
+# Relative slack before a percentile or throughput change counts as a regression
+DEFAULT_TOLERANCE = 0.15
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"unknown operation {name!r}; expected one of {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Workload:
+    """Request factory; product ids and page cursors are sampled from the server."""
+
+    def __init__(self, seed: int = 1, view: Optional[str] = None):
+        self.rng = random.Random(seed)
+        self.view = {"view": view} if view else {}
+        self.terms = search_terms()
+        self.categories = list(CATEGORIES)
+        self.ids: List[str] = []
+        self.cursors: List[str] = []
+
+    async def prepare(self, client: httpx.AsyncClient, pages: int = 20):
+        cursor = None
+        for _ in range(pages):
+            params = {"limit": 100}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get("/products", params=params)
+            response.raise_for_status()
+            self.ids.extend(product["id"] for product in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            self.cursors.append(cursor)
+        if not self.ids:
+            raise SystemExit("the catalog is empty; load one with --products")
+
+    async def payload_sizes(self, client: httpx.AsyncClient, limit: int = 20) -> Dict[str, int]:
+        """Bytes in one listing page for each product view."""
+        sizes = {}
+        for view in VIEWS:
+            params = {"limit": limit} if view == "full" else {"limit": limit, "view": view}
+            response = await client.get("/products", params=params)
+            response.raise_for_status()
+            sizes[view] = len(response.content)
+        return sizes
+
+    def list(self, client):
+        params = {"limit": 20, **self.view}
+        if self.cursors and self.rng.random() < 0.5:
+            params["cursor"] = self.rng.choice(self.cursors)
+        return client.get("/products", params=params)
+
+    def search(self, client):
+        query = self.rng.choice(self.terms)
+        if self.rng.random() < 0.3:
+            query += " " + self.rng.choice(self.terms)
+        return client.get("/products", params={"search": query, "limit": 20, **self.view})
+
+    def filter(self, client):
+        params = {"category": self.rng.choice(self.categories), "limit": 20, **self.view}
+        if self.rng.random() < 0.3:
+            params["featured"] = "true"
+        return client.get("/products", params=params)
+
+    def detail(self, client):
+        return client.get(f"/products/{self.rng.choice(self.ids)}", params=self.view)
+
+    def featured(self, client):
+        return client.get("/featured-products", params=self.view)
+
+    def status(self, client):
+        return client.post("/status", json={"client_name": f"load-test-{self.rng.randrange(100)}"})
+
+
+OPERATIONS = ("list", "search", "filter", "detail", "featured", "status")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.bytes: Dict[str, int] = defaultdict(int)
+        self.recording = False
+
+    def record(self, name: str, seconds: float, ok: bool, size: int = 0):
+        if not self.recording:
+            return
+        self.latencies[name].append(seconds)
+        self.bytes[name] += size
+        if not ok:
+            self.errors[name] += 1
+
+
+async def issue(workload: Workload, client: httpx.AsyncClient, recorder: Recorder, name: str,
+                started: Optional[float] = None):
+    started = time.perf_counter() if started is None else started
+    size = 0
+    try:
+        response = await getattr(workload, name)(client)
+        ok = response.status_code < 400
+        size = len(response.content)
+    except httpx.HTTPError:
+        ok = False
+    recorder.record(name, time.perf_counter() - started, ok, size)
+
+
+async def closed_loop(workload, client, recorder, mix, concurrency: int, deadline: float):
+    names, weights = list(mix), list(mix.values())
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            await issue(workload, client, recorder, workload.rng.choices(names, weights)[0])
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def open_loop(workload, client, recorder, mix, rate: float, deadline: float):
+    names, weights = list(mix), list(mix.values())
+    interval = 1 / rate
+    scheduled = time.perf_counter()
+    tasks = set()
+    while scheduled < deadline:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(
+            issue(workload, client, recorder, workload.rng.choices(names, weights)[0], scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        scheduled += interval
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float, size: int = 0) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "mean_bytes": round(size / len(ordered)) if ordered else 0,
+        "rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+async def run(args, mix: Dict[str, float]) -> dict:
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        workload = Workload(args.seed, args.view)
+        await workload.prepare(client)
+        payload_bytes = await workload.payload_sizes(client)
+        recorder = Recorder()
+
+        async def phase(seconds: float):
+            deadline = time.perf_counter() + seconds
+            if args.rate:
+                await open_loop(workload, client, recorder, mix, args.rate, deadline)
+            else:
+                await closed_loop(workload, client, recorder, mix, args.concurrency, deadline)
+
+        if args.warmup:
+            await phase(args.warmup)
+        recorder.recording = True
+        started = time.perf_counter()
+        await phase(args.duration)
+        elapsed = time.perf_counter() - started
+
+    every = [latency for latencies in recorder.latencies.values() for latency in latencies]
+    return {
+        "config": {
+            "base_url": args.base_url,
+            "mode": "rate" if args.rate else "concurrency",
+            "concurrency": None if args.rate else args.concurrency,
+            "rate": args.rate,
+            "duration": args.duration,
+            "mix": mix,
+            "view": args.view,
+            "catalog_ids_sampled": len(workload.ids),
+        },
+        "endpoints": {
+            name: summarize(recorder.latencies[name], recorder.errors[name], elapsed, recorder.bytes[name])
+            for name in mix if recorder.latencies[name]
+        },
+        "total": summarize(every, sum(recorder.errors.values()), elapsed, sum(recorder.bytes.values())),
+        "payload_bytes": payload_bytes,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of ``result`` against ``baseline``, one message each."""
+    regressions = []
+    for name, base in baseline["endpoints"].items():
+        current = result["endpoints"].get(name)
+        if current is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if base[key] and current[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {base[key]} -> {current[key]}")
+        if base["rps"] and current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name} rps: {base['rps']} -> {current['rps']}")
+        base_rate = base["errors"] / base["requests"] if base["requests"] else 0
+        rate = current["errors"] / current["requests"] if current["requests"] else 0
+        if rate > base_rate + 0.01:
+            regressions.append(f"{name} error rate: {base_rate:.2%} -> {rate:.2%}")
+    return regressions
+
+
+def start_server(args) -> subprocess.Popen:
+    env = {**os.environ, "MONGO_URL": args.mongo_url, "DB_NAME": args.db_name}
+    port = httpx.URL(args.base_url).port or 8001
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"server exited with status {process.returncode}")
+        try:
+            if httpx.get(f"{args.base_url}/", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise SystemExit("server did not become ready within 60s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8001/api")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma-separated operation=weight pairs")
+    parser.add_argument("--concurrency", type=int, default=16, help="closed-loop workers")
+    parser.add_argument("--rate", type=float, help="open-loop requests per second (overrides --concurrency)")
+    parser.add_argument("--view", choices=VIEWS[1:], help="request this product view on catalog reads")
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="write the JSON report here as well as stdout")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME", help="fail if worse than this baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="mystic_bench")
+    parser.add_argument("--products", type=int, help="generate and load this many products first")
+    parser.add_argument("--start-server", action="store_true", help="run uvicorn against --mongo-url")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    if args.products:
+        from pymongo import MongoClient
+
+        client = MongoClient(args.mongo_url)
+        try:
+            elapsed = load_catalog(client[args.db_name], args.products)
+        finally:
+            client.close()
+        print(f"Loaded {args.products} products in {elapsed:.1f}s", file=sys.stderr)
+
+    server = start_server(args) if args.start_server else None
+    try:
+        result = asyncio.run(run(args, mix))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        args.output.write_text(report + "\n")
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        (BASELINE_DIR / f"{args.save_baseline}.json").write_text(report + "\n")
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text())
+        regressions = compare(result, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against baseline {args.compare!r}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
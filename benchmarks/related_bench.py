@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: related products table build time, memory and update cost.
+
+Builds ``NeighbourTable`` over a generated catalog (no MongoDB involved),
+then times ``update`` + ``install`` for single product writes and for small
+batches of them, the way the background job applies catalog changes. Memory
+is the table's own count of its arrays; ``--trace-memory`` also reports the
+peak tracemalloc sees during a second, traced build, which includes the
+similarity batches. ``--verify`` checks that many lists against a brute-force
+scan of the whole catalog.
+
+    python benchmarks/related_bench.py --products 100000 --verify 200
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from catalog_generator import generate_products  # noqa: E402
+from related_products import FEATURE_WEIGHTS, NeighbourTable, product_features  # noqa: E402
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1e3  # noqa: E731
+    return {"p50_ms": round(pick(0.50), 2), "p99_ms": round(pick(0.99), 2),
+            "max_ms": round(samples[-1] * 1e3, 2)}
+
+
+def verify(table: NeighbourTable, product_ids: List[str]) -> int:
+    """Compare lists with a brute-force scan; return how many differ."""
+    live = np.flatnonzero(table.alive[:table.size])
+    vectors = table.vectors[live]
+    wrong = 0
+    for product_id in product_ids:
+        row = table.rows[product_id]
+        similarity = vectors @ table.vectors[row]
+        similarity[np.searchsorted(live, row)] = -np.inf
+        k = min(table.k, len(live) - 1)
+        expected = np.sort(similarity)[::-1][:k]
+        wrong += not np.allclose(table.scores[row, :k], expected, atol=1e-5)
+    return wrong
+
+
+def time_updates(table: NeighbourTable, products: List[dict], rng: random.Random,
+                 writes: int, batch: int) -> List[float]:
+    samples = []
+    for serial in range(writes):
+        changes = {}
+        for _ in range(batch):
+            product = dict(rng.choice(products))
+            product["price"] = round(product["price"] * rng.uniform(0.8, 1.25), 2)
+            if rng.random() < 0.25:
+                product["id"] = f"bench-{serial}-{len(changes)}"
+                product["materials"] = product["materials"][::-1]
+            changes[product["id"]] = product_features(product)
+        started = time.perf_counter()
+        table.install(table.update(changes))
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--k", type=int, default=12)
+    parser.add_argument("--writes", type=int, default=200, help="timed updates of each size")
+    parser.add_argument("--verify", type=int, default=0, help="lists to check by brute force")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--trace-memory", action="store_true", help="also measure a build with tracemalloc")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    products = list(generate_products(args.products, args.seed))
+    features = {product["id"]: product_features(product) for product in products}
+
+    peak_bytes = None
+    if args.trace_memory:
+        tracemalloc.start()
+        NeighbourTable.build(features, args.k, FEATURE_WEIGHTS)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    started = time.perf_counter()
+    table = NeighbourTable.build(features, args.k, FEATURE_WEIGHTS)
+    build_seconds = time.perf_counter() - started
+    table_bytes = table.memory_bytes()
+
+    rng = random.Random(args.seed)
+    wrong = verify(table, rng.sample(list(features), min(args.verify, len(features))))
+    single = time_updates(table, products, rng, args.writes, 1)
+    batched = time_updates(table, products, rng, args.writes, 10)
+    if args.verify:
+        wrong += verify(table, rng.sample(list(table.rows), min(args.verify, len(table))))
+
+    results = {
+        "products": args.products,
+        "k": args.k,
+        "columns": len(table.columns) + 2,
+        "build_seconds": round(build_seconds, 2),
+        "table_bytes": table_bytes,
+        "peak_traced_bytes": peak_bytes,
+        "update_1": percentiles(single),
+        "update_10": percentiles(batched),
+        "verified": args.verify * 2,
+        "mismatches": wrong,
+    }
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{args.products} products, k={args.k}, {results['columns']} feature columns")
+    peak = f", {peak_bytes / 2**20:.0f} MiB peak traced" if peak_bytes is not None else ""
+    print(f"  build: {build_seconds:.1f}s, {results['table_bytes'] / 2**20:.0f} MiB table{peak}")
+    for name in ("update_1", "update_10"):
+        stats = results[name]
+        print(f"  {name:>9}: p50 {stats['p50_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms  "
+              f"max {stats['max_ms']:7.2f} ms")
+    if args.verify:
+        print(f"  verified {results['verified']} lists against brute force, {wrong} mismatches")
+    if wrong:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Run a throwaway local replica set for testing read routing.
+
+Starts ``--members`` mongod processes on consecutive ports, initiates them as
+one replica set and prints the connection string. Runs until interrupted,
+then stops the members and removes their data.
+
+    python benchmarks/replica_set.py --members 3 --port 27017
+    MONGO_URL="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0" \\
+        CATALOG_READ_PREFERENCE=secondaryPreferred uvicorn server:app --port 8001
+    curl -s localhost:8001/metrics | grep -E 'mongodb_reads_total|catalog_reads_routed_total'
+"""
+
+import argparse
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+
+
+def start_members(mongod: str, name: str, ports, data_dir: Path):
+    processes = []
+    for port in ports:
+        path = data_dir / str(port)
+        path.mkdir(parents=True)
+        processes.append(subprocess.Popen(
+            [mongod, "--replSet", name, "--port", str(port), "--bind_ip", "localhost",
+             "--dbpath", str(path), "--quiet", "--logpath", str(path / "mongod.log")],
+        ))
+    return processes
+
+
+def initiate(name: str, ports, timeout: float = 60.0):
+    client = MongoClient("localhost", ports[0], directConnection=True, serverSelectionTimeoutMS=timeout * 1000)
+    config = {
+        "_id": name,
+        "members": [
+            # Only the first member can become primary, so test runs are predictable
+            {"_id": index, "host": f"localhost:{port}", "priority": 1 if index == 0 else 0}
+            for index, port in enumerate(ports)
+        ],
+    }
+    try:
+        client.admin.command("replSetInitiate", config)
+    except OperationFailure as exc:
+        if "already initialized" not in str(exc):
+            raise
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if client.admin.command("hello").get("isWritablePrimary"):
+                return
+        except PyMongoError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit("replica set did not elect a primary in time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=3)
+    parser.add_argument("--port", type=int, default=27017)
+    parser.add_argument("--name", default="rs0")
+    parser.add_argument("--mongod", default=shutil.which("mongod") or "mongod")
+    args = parser.parse_args()
+
+    ports = [args.port + offset for offset in range(args.members)]
+    data_dir = Path(tempfile.mkdtemp(prefix="mystic-rs-"))
+    processes = start_members(args.mongod, args.name, ports, data_dir)
+    try:
+        initiate(args.name, ports)
+        hosts = ",".join(f"localhost:{port}" for port in ports)
+        print(f"mongodb://{hosts}/?replicaSet={args.name}", flush=True)
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-request CPU to serialize a 100-item product page.
+
+Compares the original read path (``Product(**doc)`` per row, then FastAPI's
+response_model validation and stdlib JSON encoding) with the pre-rendered
+orjson path. No MongoDB or network is involved; documents are generated in
+the shape they are stored in.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from fast_json import PrerenderedJSONResponse, render  # noqa: E402
+from server import Product  # noqa: E402
+
+
+def make_documents(count: int) -> List[dict]:
+    now = datetime.utcnow().replace(microsecond=123000)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Amethyst Crystal Cluster {i}",
+            "description": "Beautiful purple amethyst cluster known for its calming and spiritual properties. " * 2,
+            "price": 45.99 + i,
+            "category": "crystals",
+            "image_url": "https://images.unsplash.com/photo-1521133573892-e44906baee46?crop=entropy&cs=srgb&fm=jpg&q=85",
+            "spiritual_benefits": ["Stress relief", "Enhanced intuition", "Peaceful sleep", "Mental clarity"],
+            "materials": ["Natural Amethyst", "Wood base"],
+            "origin": "Brazil",
+            "featured": i % 3 == 0,
+            "in_stock": True,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(count)
+    ]
+
+
+async def model_path(documents: List[dict], field) -> bytes:
+    content = [Product(**document) for document in documents]
+    serialized = await serialize_response(field=field, response_content=content)
+    return JSONResponse(serialized).body
+
+
+async def prerendered_path(documents: List[dict], field) -> bytes:
+    return PrerenderedJSONResponse(render(documents)).body
+
+
+async def measure(path, documents: List[dict], field, iterations: int) -> float:
+    """Return CPU microseconds per request."""
+    for _ in range(min(iterations, 50)):
+        await path(documents, field)
+    started = time.process_time()
+    for _ in range(iterations):
+        await path(documents, field)
+    return (time.process_time() - started) / iterations * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    documents = make_documents(args.items)
+    field = create_response_field(name="response", type_=List[Product])
+
+    # Both paths must produce the same JSON document
+    expected = json.loads(await model_path(documents, field))
+    assert json.loads(await prerendered_path(documents, field)) == expected
+
+    before = await measure(model_path, documents, field, args.iterations)
+    after = await measure(prerendered_path, documents, field, args.iterations)
+    results = {
+        "items": args.items,
+        "iterations": args.iterations,
+        "model_path_us": round(before, 1),
+        "prerendered_path_us": round(after, 1),
+        "speedup": round(before / after, 1),
+    }
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{args.items}-item page, {args.iterations} iterations (CPU time per request)")
+        print(f"  Product(**doc) + response_model + json: {before:8.1f} us")
+        print(f"  projected docs + orjson, pre-rendered:  {after:8.1f} us")
+        print(f"  speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: typeahead index build time, memory and lookup latency.
+
+Builds ``SuggestIndex`` over a generated catalog (no MongoDB involved), then
+times ``suggest`` for every prefix of the catalog's search words, cold and
+warm, and for lookups interleaved with product writes. Memory is the
+index's own estimate; ``--trace-memory`` also counts the bytes tracemalloc
+sees allocated by a second, traced build (tracing slows that build down
+several times, so it is never the timed one). ``--unique-names`` gives every
+product its own name, the worst case for the index's size.
+
+    python benchmarks/suggest_bench.py --products 1000000 --unique-names
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from catalog_generator import CATEGORIES, generate_products, search_terms  # noqa: E402
+from suggest_index import SuggestIndex  # noqa: E402
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1e6  # noqa: E731
+    return {"p50_us": round(pick(0.50), 1), "p99_us": round(pick(0.99), 1),
+            "max_us": round(samples[-1] * 1e6, 1)}
+
+
+def time_lookups(index: SuggestIndex, prefixes: List[str], limit: int) -> List[float]:
+    samples = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        index.suggest(prefix, limit)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def build(products: List[dict], labels: Dict[str, str]) -> SuggestIndex:
+    index = SuggestIndex(labels)
+    for product in products:
+        index.add(product)
+    index.ready = True
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=1000000)
+    parser.add_argument("--unique-names", action="store_true", help="suffix every name with a serial")
+    parser.add_argument("--limit", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=10000, help="product writes in the mixed phase")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--trace-memory", action="store_true", help="also measure a build with tracemalloc")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    products = list(generate_products(args.products, args.seed))
+    if args.unique_names:
+        for serial, product in enumerate(products):
+            product["name"] = f"{product['name']} {serial:x}"
+    labels = {category: category.replace("_", " ").title() for category in CATEGORIES}
+
+    traced_bytes = None
+    if args.trace_memory:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        build(products, labels)
+        traced_bytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+    started = time.perf_counter()
+    index = build(products, labels)
+    build_seconds = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    prefixes = [word[:end] for word in search_terms() for end in range(1, len(word) + 1)]
+    cold = time_lookups(index, prefixes, args.limit)
+    warm = time_lookups(index, prefixes * 5, args.limit)
+
+    # Writes mark tree nodes stale, so lookups after them pay for recomputing
+    mixed, write_samples = [], []
+    for serial in range(args.writes):
+        product = dict(rng.choice(products))
+        product["featured"] = not product["featured"]
+        if serial % 4 == 0:
+            product["id"] = f"bench-{serial}"
+            product["name"] = f"{product['name']} new {serial}"
+        started = time.perf_counter()
+        index.add(product)
+        write_samples.append(time.perf_counter() - started)
+        mixed.extend(time_lookups(index, [rng.choice(prefixes)], args.limit))
+
+    results = {
+        "products": args.products,
+        "unique_names": args.unique_names,
+        **index.stats(),
+        "build_seconds": round(build_seconds, 2),
+        "traced_bytes": traced_bytes,
+        "estimated_bytes": index.memory_bytes(),
+        "cold": percentiles(cold),
+        "warm": percentiles(warm),
+        "after_write": percentiles(mixed),
+        "write": percentiles(write_samples),
+    }
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{args.products} products, {results['phrases']} phrases, {results['keys']} keys")
+    traced = f", {traced_bytes / 2**20:.0f} MiB traced" if traced_bytes is not None else ""
+    print(f"  build: {build_seconds:.1f}s, {results['estimated_bytes'] / 2**20:.0f} MiB estimated{traced}")
+    for phase in ("cold", "warm", "after_write", "write"):
+        stats = results[phase]
+        print(f"  {phase:>11}: p50 {stats['p50_us']:8.1f} us  p99 {stats['p99_us']:8.1f} us  "
+              f"max {stats['max_us']:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -134,8 +134,58 @@ const Footer = () => {
   );
 };
 
+// Typeahead suggestions for the search box, fetched once typing pauses
+const useSearchSuggestions = (searchTerm) => {
+  const [suggestions, setSuggestions] = useState([]);
+
+  useEffect(() => {
+    const query = searchTerm.trim();
+    if (!query) {
+      setSuggestions([]);
+      return undefined;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/search/suggest`, { params: { q: query, limit: 8 } });
+        if (!cancelled) setSuggestions(response.data);
+      } catch (error) {
+        if (!cancelled) setSuggestions([]);
+      }
+    }, 120);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchTerm]);
+
+  return suggestions;
+};
+
+// Product field each suggestion kind filters on when picked; names stay free-text searches
+const SUGGESTION_FIELDS = {
+  benefit: 'spiritual_benefits',
+  material: 'materials',
+  category: 'category',
+};
+
+const matchesSuggestion = (product, suggestion) => {
+  const value = product[SUGGESTION_FIELDS[suggestion.kind]];
+  return Array.isArray(value) ? value.includes(suggestion.value) : value === suggestion.value;
+};
+
 // Header Component
-const Header = ({ currentPage, setCurrentPage, searchTerm, setSearchTerm }) => {
+const Header = ({ currentPage, setCurrentPage, searchTerm, setSearchTerm, setPickedSuggestion }) => {
+  const suggestions = useSearchSuggestions(searchTerm);
+
+  const handleSearchChange = (value) => {
+    setSearchTerm(value);
+    const picked = suggestions.find(
+      (suggestion) => suggestion.text === value && SUGGESTION_FIELDS[suggestion.kind]
+    );
+    setPickedSuggestion(picked || null);
+  };
+
   return (
     <header className="mystical-header">
       <div className="container mx-auto px-4 py-6">
@@ -175,9 +225,16 @@ const Header = ({ currentPage, setCurrentPage, searchTerm, setSearchTerm }) => {
                 type="text"
                 placeholder="Search mystical items..."
                 value={searchTerm}
-                onChange={(e) => setSearchTerm(e.target.value)}
+                onChange={(e) => handleSearchChange(e.target.value)}
                 className="search-input"
+                list="search-suggestions"
+                autoComplete="off"
               />
+              <datalist id="search-suggestions">
+                {suggestions.map((suggestion) => (
+                  <option key={`${suggestion.kind}-${suggestion.value}`} value={suggestion.text} />
+                ))}
+              </datalist>
               <span className="search-icon">🔮</span>
             </div>
           </div>
@@ -187,12 +244,29 @@ const Header = ({ currentPage, setCurrentPage, searchTerm, setSearchTerm }) => {
   );
 };
 
+// Resized image for a product, falling back to the original if resizing fails
+const productImage = (product, width) => `${API}/images/${product.id}?w=${width}`;
+const fallBackToOriginal = (product) => (e) => {
+  if (e.currentTarget.src !== product.image_url) {
+    e.currentTarget.srcset = "";
+    e.currentTarget.src = product.image_url;
+  }
+};
+
 // Product Card Component
 const ProductCard = ({ product, onClick }) => {
   return (
     <div className="product-card" onClick={() => onClick(product)}>
       <div className="product-image-container">
-        <img src={product.image_url} alt={product.name} className="product-image" />
+        <img
+          src={productImage(product, 320)}
+          srcSet={`${productImage(product, 320)} 320w, ${productImage(product, 640)} 640w`}
+          sizes="320px"
+          loading="lazy"
+          onError={fallBackToOriginal(product)}
+          alt={product.name}
+          className="product-image"
+        />
         {product.featured && <span className="featured-badge">✨ Featured</span>}
       </div>
       <div className="product-content">
@@ -284,11 +358,12 @@ const HomePage = ({ products, setSelectedProduct }) => {
 };
 
 // Product Catalog Component
-const ProductCatalog = ({ products, searchTerm, setSelectedProduct }) => {
+const ProductCatalog = ({ products, searchTerm, pickedSuggestion, setSelectedProduct }) => {
   const [selectedCategory, setSelectedCategory] = useState('all');
   
   const filteredProducts = products.filter(product => {
-    const matchesSearch = product.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
+    const matchesSearch = pickedSuggestion ? matchesSuggestion(product, pickedSuggestion) :
+                         product.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
                          product.description.toLowerCase().includes(searchTerm.toLowerCase());
     const matchesCategory = selectedCategory === 'all' || product.category === selectedCategory;
     return matchesSearch && matchesCategory;
@@ -355,9 +430,29 @@ const ProductCatalog = ({ products, searchTerm, setSelectedProduct }) => {
   );
 };
 
+// Products similar to the one shown, from the precomputed related lists
+const useRelatedProducts = (productId) => {
+  const [related, setRelated] = useState([]);
+
+  useEffect(() => {
+    let cancelled = false;
+    setRelated([]);
+    axios.get(`${API}/products/${productId}/related`, { params: { limit: 4 } })
+      .then((response) => {
+        if (!cancelled) setRelated(response.data);
+      })
+      .catch((error) => console.error('Error fetching related products:', error));
+    return () => {
+      cancelled = true;
+    };
+  }, [productId]);
+
+  return related;
+};
+
 // Product Detail Modal
-const ProductDetail = ({ product, onClose }) => {
-  if (!product) return null;
+const ProductDetail = ({ product, onClose, onSelect }) => {
+  const related = useRelatedProducts(product.id);
 
   return (
     <div className="modal-overlay" onClick={onClose}>
@@ -366,7 +461,12 @@ const ProductDetail = ({ product, onClose }) => {
         
         <div className="modal-content">
           <div className="modal-image-section">
-            <img src={product.image_url} alt={product.name} className="modal-image" />
+            <img
+              src={productImage(product, 960)}
+              onError={fallBackToOriginal(product)}
+              alt={product.name}
+              className="modal-image"
+            />
           </div>
           
           <div className="modal-details">
@@ -410,6 +510,26 @@ const ProductDetail = ({ product, onClose }) => {
             </div>
           </div>
         </div>
+
+        {related.length > 0 && (
+          <div className="modal-related">
+            <h4>You May Also Like</h4>
+            <div className="related-list">
+              {related.map((item) => (
+                <button key={item.id} className="related-item" onClick={() => onSelect(item)}>
+                  <img
+                    src={productImage(item, 160)}
+                    onError={fallBackToOriginal(item)}
+                    alt={item.name}
+                    className="related-image"
+                  />
+                  <span className="related-name">{item.name}</span>
+                  <span className="related-price">${item.price}</span>
+                </button>
+              ))}
+            </div>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -420,6 +540,8 @@ function App() {
   const [currentPage, setCurrentPage] = useState('home');
   const [products, setProducts] = useState([]);
   const [searchTerm, setSearchTerm] = useState('');
+  // Benefit, material or category suggestion picked from the search box, if any
+  const [pickedSuggestion, setPickedSuggestion] = useState(null);
   const [selectedProduct, setSelectedProduct] = useState(null);
   const [loading, setLoading] = useState(true);
 
@@ -457,6 +579,7 @@ function App() {
         setCurrentPage={setCurrentPage}
         searchTerm={searchTerm}
         setSearchTerm={setSearchTerm}
+        setPickedSuggestion={setPickedSuggestion}
       />
       
       <main className="main-content">
@@ -471,6 +594,7 @@ function App() {
           <ProductCatalog 
             products={products}
             searchTerm={searchTerm}
+            pickedSuggestion={pickedSuggestion}
             setSelectedProduct={setSelectedProduct}
           />
         )}
@@ -480,6 +604,7 @@ function App() {
         <ProductDetail 
           product={selectedProduct}
           onClose={() => setSelectedProduct(null)}
+          onSelect={setSelectedProduct}
         />
       )}
       
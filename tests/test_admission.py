@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from admission import PRIORITY_CLASSES, AdmissionController, GradientLimit, Overloaded
+
+CATALOG = PRIORITY_CLASSES["catalog"]
+WRITE = PRIORITY_CLASSES["write"]
+BULK = PRIORITY_CLASSES["bulk"]
+
+
+def busy_limit(limit: float, **options) -> GradientLimit:
+    gradient = GradientLimit(limit, window=4, **options)
+    gradient.in_flight = int(limit)
+    return gradient
+
+
+def observe_window(gradient: GradientLimit, inflation: float) -> bool:
+    return [gradient.observe(inflation) for _ in range(gradient.window)][-1]
+
+
+def test_limit_grows_while_latency_stays_within_tolerance():
+    gradient = busy_limit(16)
+    assert observe_window(gradient, 1.0)
+    assert 16 < gradient.limit <= 16 + 4
+
+
+def test_limit_shrinks_in_proportion_to_inflation_and_at_most_halves():
+    gradient = busy_limit(100)
+    observe_window(gradient, 3.0)
+    assert gradient.limit < 100
+    steep = busy_limit(100, smoothing=1.0)
+    observe_window(steep, 100.0)
+    assert steep.limit == pytest.approx(50 + 10)
+
+
+def test_limit_is_left_alone_while_mostly_idle():
+    gradient = GradientLimit(16, window=4)
+    gradient.in_flight = 2
+    assert not observe_window(gradient, 100.0)
+    assert gradient.limit == 16
+
+
+def test_limit_stays_within_bounds():
+    low = busy_limit(100, min_limit=40, smoothing=1.0)
+    for _ in range(10):
+        observe_window(low, 100.0)
+    assert low.limit == 40
+    high = busy_limit(10, max_limit=12, smoothing=1.0)
+    for _ in range(10):
+        high.in_flight = int(high.limit)
+        observe_window(high, 1.0)
+    assert high.limit == 12
+
+
+def test_routes_are_classified_by_method_and_template():
+    controller = AdmissionController()
+    assert not controller.classify("GET", "/api/categories").limited
+    assert controller.classify("POST", "/api/products/bulk") is BULK
+    assert controller.classify("GET", "/api/status") is WRITE
+    assert controller.classify("GET", "/api/products") is CATALOG
+    assert controller.classify("DELETE", "/api/products/{product_id}") is WRITE
+
+
+def test_requests_beyond_the_limit_queue_until_a_slot_frees():
+    async def main():
+        controller = AdmissionController(initial_limit=2, min_limit=1)
+        tickets = [await controller.acquire("GET /a", CATALOG) for _ in range(2)]
+        waiting = asyncio.ensure_future(controller.acquire("GET /a", CATALOG))
+        await asyncio.sleep(0)
+        assert not waiting.done() and controller.stats()["queued"] == {"catalog": 1}
+        controller.release(tickets[0])
+        ticket = await asyncio.wait_for(waiting, 1)
+        assert controller.limit.in_flight == 2
+        controller.release(ticket)
+        controller.release(tickets[1])
+        return controller
+
+    controller = asyncio.run(main())
+    assert controller.limit.in_flight == 0
+    assert controller.outcomes["catalog", "admitted"] == 2
+    assert controller.outcomes["catalog", "queued"] == 1
+
+
+def test_classes_that_cannot_wait_are_shed_at_once():
+    async def main():
+        controller = AdmissionController(initial_limit=1, min_limit=1)
+        await controller.acquire("GET /a", CATALOG)
+        with pytest.raises(Overloaded) as shed:
+            await controller.acquire("POST /bulk", BULK)
+        return controller, shed.value
+
+    controller, shed = asyncio.run(main())
+    assert shed.reason == "no_slot" and shed.retry_after >= 1
+    assert controller.outcomes["bulk", "shed_no_slot"] == 1
+
+
+def test_waiters_are_shed_after_their_class_max_wait():
+    async def main():
+        controller = AdmissionController(initial_limit=1, min_limit=1)
+        await controller.acquire("GET /a", CATALOG)
+        with pytest.raises(Overloaded) as shed:
+            await controller.acquire("POST /status", WRITE)
+        return controller, shed.value
+
+    controller, shed = asyncio.run(main())
+    assert shed.reason == "timeout"
+    assert controller.stats()["queued"] == {}
+
+
+def test_full_queue_displaces_lower_classes_and_turns_away_the_rest():
+    async def main():
+        controller = AdmissionController(initial_limit=1, min_limit=1, max_queue=1)
+        await controller.acquire("GET /a", CATALOG)
+        write = asyncio.ensure_future(controller.acquire("POST /status", WRITE))
+        await asyncio.sleep(0)
+        catalog = asyncio.ensure_future(controller.acquire("GET /a", CATALOG))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as displaced:
+            await write
+        with pytest.raises(Overloaded) as turned_away:
+            await controller.acquire("POST /status", WRITE)
+        catalog.cancel()
+        return displaced.value, turned_away.value, controller
+
+    displaced, turned_away, controller = asyncio.run(main())
+    assert displaced.reason == "displaced"
+    assert turned_away.reason == "queue_full"
+    assert controller.outcomes["write", "shed_displaced"] == 1
+
+
+def test_route_ceilings_hold_regardless_of_the_global_limit():
+    async def main():
+        controller = AdmissionController(initial_limit=64, route_limits={"GET /slow": 1})
+        await controller.acquire("GET /slow", CATALOG)
+        slow = asyncio.ensure_future(controller.acquire("GET /slow", CATALOG))
+        fast = await controller.acquire("GET /fast", CATALOG)
+        await asyncio.sleep(0)
+        assert not slow.done()
+        slow.cancel()
+        return fast
+
+    assert asyncio.run(main()) is not None
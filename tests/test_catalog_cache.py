@@ -0,0 +1,93 @@
+import asyncio
+
+from catalog_cache import CatalogCache, product_list_key
+from catalog_events import CatalogChange
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = CatalogCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = CatalogCache(ttl=10, clock=clock)
+    cache.set("a", 1)
+    clock.now = 9.9
+    assert cache.get("a") == 1
+    clock.now = 10.0
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_result_loaded_across_an_invalidation_is_not_stored():
+    cache = CatalogCache()
+    generation = cache.generation
+    cache.invalidate()
+    cache.set("a", "stale", generation)
+    assert cache.get("a") is None
+    cache.set("a", "fresh", cache.generation)
+    assert cache.get("a") == "fresh"
+
+
+def test_catalog_change_drops_every_entry():
+    cache = CatalogCache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+    asyncio.run(cache.on_catalog_change(CatalogChange(upserted=[{"id": "p1"}])))
+    assert cache.get("a") is None and cache.get("b") is None
+    assert cache.stats()["generation"] == 1
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_hit_and_miss_counters():
+    cache = CatalogCache()
+    assert cache.stats()["hit_ratio"] == 0.0
+    cache.get("a")
+    cache.set("a", 0)
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_zero_maxsize_disables_caching():
+    cache = CatalogCache(maxsize=0)
+    assert not cache.enabled
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_product_list_key_ignores_search_case():
+    assert (product_list_key("crystals", True, "Rose QUARTZ", 20)
+            == product_list_key("crystals", True, "rose quartz", 20))
+    assert product_list_key(None, None, "", 20) == product_list_key(None, None, None, 20)
+
+
+def test_product_list_key_separates_every_filter():
+    keys = {
+        product_list_key(None, None, None, 20),
+        product_list_key("crystals", None, None, 20),
+        product_list_key(None, True, None, 20),
+        product_list_key(None, False, None, 20),
+        product_list_key(None, None, "rose", 20),
+        product_list_key(None, None, None, 50),
+    }
+    assert len(keys) == 6
@@ -0,0 +1,91 @@
+import asyncio
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from catalog_export import EXPORT_FIELDS, iter_batches, iter_csv, iter_ndjson, parquet_available
+from product_ingest import iter_csv_rows, iter_lines
+
+PRODUCTS = [
+    {"_id": object(), "id": f"p{number}", "name": f"Stone, \"No. {number}\"", "description": "Line one\nline two",
+     "price": 10.5 + number, "category": "crystals", "image_url": "http://img/a.png",
+     "spiritual_benefits": ["Love", "Calm"], "materials": ["Quartz"], "origin": None if number % 2 else "Brazil",
+     "featured": number == 0, "in_stock": True,
+     "created_at": datetime(2024, 1, 1, 12, number), "updated_at": datetime(2024, 2, 1)}
+    for number in range(5)
+]
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+        self.requested_batch_size = None
+
+    def batch_size(self, size):
+        self.requested_batch_size = size
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+async def single(data: bytes):
+    yield data
+
+
+def test_batches_hold_at_most_batch_size_documents():
+    cursor = FakeCursor(PRODUCTS)
+    batches = asyncio.run(collect(iter_batches(cursor, 2)))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert cursor.requested_batch_size == 2
+
+
+def test_ndjson_yields_one_chunk_per_batch_with_export_fields_only():
+    chunks = asyncio.run(collect(iter_ndjson(FakeCursor(PRODUCTS), 2)))
+    assert len(chunks) == 3
+    rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert [list(row) for row in rows] == [EXPORT_FIELDS] * 5
+    assert rows[0]["created_at"] == "2024-01-01T12:00:00"
+    assert rows[1]["origin"] is None
+    assert rows[3]["spiritual_benefits"] == ["Love", "Calm"]
+
+
+def test_csv_export_round_trips_through_the_csv_importer():
+    body = b"".join(asyncio.run(collect(iter_csv(FakeCursor(PRODUCTS), 2))))
+    rows = [row for _, row in asyncio.run(collect(iter_csv_rows(iter_lines(single(body)))))]
+    assert len(rows) == 5
+    for row, product in zip(rows, PRODUCTS):
+        assert row["name"] == product["name"]
+        assert row["description"] == product["description"]
+        assert row["spiritual_benefits"] == product["spiritual_benefits"]
+        assert float(row["price"]) == product["price"]
+        assert row.get("origin") == product["origin"]
+        assert datetime.fromisoformat(row["created_at"]) == product["created_at"]
+
+
+def test_empty_catalog_exports_only_the_csv_header():
+    body = b"".join(asyncio.run(collect(iter_csv(FakeCursor([]), 2))))
+    assert body.decode().strip() == ",".join(EXPORT_FIELDS)
+
+
+@pytest.mark.skipif(not parquet_available(), reason="Parquet export requires pyarrow")
+def test_parquet_export_reads_back():
+    import pyarrow.parquet as pq
+    from catalog_export import iter_parquet
+
+    body = b"".join(asyncio.run(collect(iter_parquet(FakeCursor(PRODUCTS), 2))))
+    table = pq.read_table(io.BytesIO(body))
+    assert table.num_rows == 5
+    assert pq.ParquetFile(io.BytesIO(body)).num_row_groups == 3
+    assert table.column("materials").to_pylist() == [["Quartz"]] * 5
+    assert table.column("created_at").to_pylist()[4] == PRODUCTS[4]["created_at"]
@@ -0,0 +1,116 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+
+from catalog_snapshot import CatalogSnapshot, write_snapshot
+from fast_json import render
+
+CATEGORIES = ["crystals", "amulets", "talismans"]
+
+
+def make_products(count=300, seed=3):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    products = [{
+        "id": f"p{number:04d}",
+        "name": rng.choice(["Amber", "Jade", "Onyx", "Opal"]) + f" {rng.randrange(20)}",
+        "description": "Stone",
+        "price": float(rng.choice([5, 9.5, 12, 20, 35, 80])),
+        "category": rng.choice(CATEGORIES),
+        "featured": rng.random() < 0.2,
+        "in_stock": rng.random() < 0.8,
+        # Repeated timestamps exercise the id tie-break
+        "created_at": start + timedelta(minutes=rng.randrange(100)),
+    } for number in range(count)]
+    products.sort(key=lambda product: (product["created_at"], product["id"]))
+    return products
+
+
+@pytest.fixture(scope="module")
+def catalog(tmp_path_factory):
+    products = make_products()
+    path = tmp_path_factory.mktemp("snapshot") / "catalog-7.snap"
+    write_snapshot(path, products, 7, datetime(2024, 3, 1, 12, 0, 0, 500))
+    snapshot = CatalogSnapshot(path)
+    yield snapshot, products
+    snapshot.close()
+
+
+def expected_page(products, sort, descending, after, limit, within=None, **filters):
+    def matches(product):
+        return all([
+            filters.get("category") is None or product["category"] == filters["category"],
+            filters.get("featured") is None or product["featured"] == filters["featured"],
+            filters.get("in_stock") is None or product["in_stock"] == filters["in_stock"],
+            filters.get("min_price") is None or product["price"] >= filters["min_price"],
+            filters.get("max_price") is None or product["price"] <= filters["max_price"],
+            within is None or product["id"] in within,
+        ])
+
+    ordered = sorted((product for product in products if matches(product)),
+                     key=lambda product: (product[sort], product["id"]), reverse=descending)
+    if after is not None:
+        keys = [(product[sort], product["id"]) for product in ordered]
+        ordered = [product for product, key in zip(ordered, keys) if (key < after if descending else key > after)]
+    return [product["id"] for product in ordered[:limit]]
+
+
+def test_header_and_lookups(catalog):
+    snapshot, products = catalog
+    assert (snapshot.version, len(snapshot)) == (7, len(products))
+    assert snapshot.updated_at == datetime(2024, 3, 1, 12, tzinfo=timezone.utc)
+    for position, product in enumerate(products[:20]):
+        assert snapshot.position(product["id"]) == position
+        assert snapshot.get(product["id"]) == render(product)
+        assert snapshot.product_id(position) == product["id"]
+        assert snapshot.created_at(position) == product["created_at"]
+    assert orjson.loads(snapshot.get(products[5]["id"]))["name"] == products[5]["name"]
+    assert snapshot.position("missing") is None and snapshot.get("missing") is None
+
+
+def test_positions_follow_listing_order(catalog):
+    snapshot, products = catalog
+    crystals = [position for position, product in enumerate(products) if product["category"] == "crystals"
+                and not product["featured"]]
+    assert list(snapshot.positions("crystals", False)) == crystals
+    assert list(snapshot.positions()) == list(range(len(products)))
+    assert list(snapshot.positions("unknown")) == []
+
+
+@pytest.mark.parametrize("sort", ["created_at", "price", "name"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_match_brute_force(catalog, sort, descending):
+    snapshot, products = catalog
+    rng = random.Random(f"{sort}{descending}")
+    for _ in range(40):
+        filters = {
+            "category": rng.choice([None, *CATEGORIES]),
+            "featured": rng.choice([None, True, False]),
+            "in_stock": rng.choice([None, True, False]),
+            "min_price": rng.choice([None, 9.5, 20]),
+            "max_price": rng.choice([None, 20, 80]),
+        }
+        within = None
+        if rng.random() < 0.3:
+            within = {product["id"] for product in rng.sample(products, rng.choice([5, 150]))}
+        positions = None if within is None else {snapshot.position(product_id) for product_id in within}
+        after, seen = None, []
+        while True:
+            page = snapshot.page(after, 7, sort, descending, positions, **filters)
+            ids = [snapshot.product_id(position) for position in page]
+            assert ids == expected_page(products, sort, descending, after, 7, within, **filters)
+            seen.extend(ids)
+            if len(page) < 7:
+                break
+            last = page[-1]
+            after = (snapshot.sort_value(last, sort), snapshot.product_id(last))
+        assert len(seen) == len(set(seen))
+
+
+def test_file_that_is_not_a_snapshot_is_rejected(tmp_path):
+    path = tmp_path / "bogus.snap"
+    path.write_bytes(b"x" * 64)
+    with pytest.raises(ValueError, match="not a catalog snapshot"):
+        CatalogSnapshot(path)
@@ -0,0 +1,148 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from catalog_events import CatalogEvents
+from catalog_version import CatalogVersion
+
+
+class FakeMeta:
+    """The two catalog_meta operations CatalogVersion uses."""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def find_one(self, query):
+        return self.documents.get(query["_id"])
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        document = self.documents.get(query["_id"])
+        if document is None:
+            document = self.documents[query["_id"]] = {"_id": query["_id"], **update.get("$setOnInsert", {})}
+            document.setdefault("version", 0)
+        for name, amount in update.get("$inc", {}).items():
+            document[name] = document.get(name, 0) + amount
+        document.update(update.get("$set", {}))
+        return dict(document)
+
+    def bump_elsewhere(self, key="products"):
+        self.documents[key]["version"] += 1
+        self.documents[key]["updated_at"] = datetime.utcnow()
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents[:length]
+
+
+class FakeProducts:
+    def __init__(self):
+        self.documents = {}
+
+    def write(self, product_id, **fields):
+        self.documents[product_id] = {"id": product_id, "updated_at": datetime.utcnow(), **fields}
+
+    def find(self, query, projection=None):
+        since = query["updated_at"]["$gt"]
+        return FakeCursor([dict(document) for document in self.documents.values() if document["updated_at"] > since])
+
+
+def version_with_events(max_changes=10000):
+    meta, products, events = FakeMeta(), FakeProducts(), CatalogEvents()
+    published = []
+
+    async def record(change):
+        published.append(change)
+
+    events.subscribe(record)
+    return CatalogVersion(meta, products, events, max_changes=max_changes), meta, products, published
+
+
+def age(products, seconds):
+    for document in products.documents.values():
+        document["updated_at"] -= timedelta(seconds=seconds)
+
+
+def test_local_bump_without_gap_needs_no_catch_up():
+    async def main():
+        version, meta, products, published = version_with_events()
+        await version.load()
+        await version.bump()
+        await version.catch_up()
+        return version, published
+
+    version, published = asyncio.run(main())
+    assert version.version == 2
+    assert version.etag == '"catalog-2"'
+    assert published == []
+
+
+def test_gap_in_versions_publishes_remote_writes_as_upserts():
+    async def main():
+        version, meta, products, published = version_with_events()
+        products.write("old", name="Old")
+        age(products, 3600)
+        await version.load()
+        # Another worker writes and bumps before this process's own write
+        products.write("remote", name="Remote")
+        meta.bump_elsewhere()
+        await version.bump()
+        await version.catch_up()
+        return version, published
+
+    version, published = asyncio.run(main())
+    assert version.version == 3
+    assert len(published) == 1
+    change = published[0]
+    assert not change.reset and not change.local
+    assert [product["id"] for product in change.upserted] == ["remote"]
+
+
+def test_catch_up_publishes_nothing_once_synced():
+    async def main():
+        version, meta, products, published = version_with_events()
+        await version.load()
+        products.write("remote")
+        meta.bump_elsewhere()
+        await version.catch_up()
+        await version.catch_up()
+        return published
+
+    published = asyncio.run(main())
+    assert len(published) == 1
+
+
+def test_too_many_remote_writes_publish_a_reset():
+    async def main():
+        version, meta, products, published = version_with_events(max_changes=2)
+        await version.load()
+        for number in range(3):
+            products.write(f"p{number}")
+        meta.bump_elsewhere()
+        await version.catch_up()
+        return published
+
+    published = asyncio.run(main())
+    assert len(published) == 1
+    assert published[0].reset and not published[0].local and published[0].upserted == []
+
+
+def test_poll_catches_up_when_a_bump_finds_a_gap():
+    async def main():
+        version, meta, products, published = version_with_events()
+        await version.load()
+        poller = asyncio.ensure_future(version.poll(0))
+        products.write("remote")
+        meta.bump_elsewhere()
+        await version.bump()
+        for _ in range(100):
+            if published:
+                break
+            await asyncio.sleep(0.01)
+        poller.cancel()
+        return published
+
+    published = asyncio.run(main())
+    assert [product["id"] for product in published[0].upserted] == ["remote"]
@@ -0,0 +1,140 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from catalog_version import etag_matches
+from compression import CompressedBodyCache, CompressionMiddleware, negotiate
+
+ETAG = '"catalog-7"'
+
+
+async def settle():
+    """Let background refinements and their callbacks run."""
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def make_client(bodies, cache_control="public, max-age=60"):
+    """An app serving ``bodies[path]`` under one fixed ETag, with conditional GETs."""
+    async def endpoint(request: Request):
+        headers = {"ETag": ETAG, "Cache-Control": cache_control}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and etag_matches(if_none_match, ETAG):
+            return Response(status_code=304, headers=headers)
+        return Response(bodies[request.url.path], media_type="application/json", headers=headers)
+
+    cache = CompressedBodyCache()
+    app = CompressionMiddleware(Starlette(routes=[Route("/{name}", endpoint)]), cache=cache, min_size=64,
+                                encodings=("gzip",))
+    return TestClient(app, headers={"Accept-Encoding": "gzip"}), cache
+
+
+def test_negotiate_honours_q_values():
+    assert negotiate("gzip, br", ("br", "gzip")) == "br"
+    assert negotiate("br;q=0, gzip;q=0.5", ("br", "gzip")) == "gzip"
+    assert negotiate("*;q=0.1, gzip;q=0", ("br", "gzip")) == "br"
+    assert negotiate("identity", ("br", "gzip")) is None
+    assert negotiate("gzip;q=bogus", ("gzip",)) is None
+
+
+def test_changed_body_under_the_same_etag_is_not_served_from_cache():
+    bodies = {"/search": b'[{"name": "regex fallback"}]' * 10}
+    client, cache = make_client(bodies)
+    first = client.get("/search")
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.content == bodies["/search"]
+
+    bodies["/search"] = b'[{"name": "ranked by the index"}]' * 10
+    second = client.get("/search")
+    assert second.content == bodies["/search"]
+    assert (cache.misses, len(cache)) == (2, 2)
+
+
+def test_identical_bodies_share_one_entry():
+    body = b'{"products": []}' * 10
+    client, cache = make_client({"/a": body, "/b": body})
+    assert client.get("/a").content == client.get("/b").content == body
+    assert (cache.misses, cache.hits, len(cache)) == (1, 1, 1)
+
+
+def test_encoded_responses_carry_a_weak_etag_that_revalidates():
+    client, _ = make_client({"/page": b'{"id": "p1"}' * 20})
+    response = client.get("/page")
+    assert response.headers["etag"] == f"W/{ETAG}"
+    assert "accept-encoding" in response.headers["vary"].lower()
+
+    revalidated = client.get("/page", headers={"If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == f"W/{ETAG}"
+    strong = client.get("/page", headers={"If-None-Match": ETAG})
+    assert strong.status_code == 304 and strong.headers["etag"] == ETAG
+
+
+def test_uncacheable_and_small_bodies():
+    client, cache = make_client({"/private": b"x" * 200, "/small": b"{}"}, cache_control="no-store")
+    response = client.get("/private")
+    assert response.headers["content-encoding"] == "gzip" and response.content == b"x" * 200
+    assert len(cache) == 0
+    small = client.get("/small")
+    assert "content-encoding" not in small.headers and small.headers["etag"] == ETAG
+
+
+def test_first_hit_refines_the_fast_compression_once():
+    produced = []
+
+    async def produce():
+        produced.append("fast")
+        return b"f" * 20
+
+    async def refine():
+        produced.append("best")
+        return b"b" * 10
+
+    async def scenario():
+        cache = CompressedBodyCache()
+        fast = await asyncio.gather(*(cache.get(("k", "gzip"), produce, refine) for _ in range(3)))
+        assert produced == ["fast"] and fast == [b"f" * 20] * 3
+        assert await cache.get(("k", "gzip"), produce, refine) == b"f" * 20
+        await settle()
+        assert await cache.get(("k", "gzip"), produce, refine) == b"b" * 10
+        await cache.get(("k", "gzip"), produce, refine)
+        assert produced == ["fast", "best"]
+        assert (cache.refinements, cache.hits, cache.misses, cache.bytes) == (1, 3, 3, 10)
+
+    asyncio.run(scenario())
+
+
+def test_refinement_that_is_no_smaller_is_dropped():
+    async def body(data):
+        return data
+
+    async def scenario():
+        cache = CompressedBodyCache()
+        await cache.get(("k",), lambda: body(b"fast"))
+        await cache.get(("k",), lambda: body(b"fast"), refine=lambda: body(b"slower"))
+        await settle()
+        assert await cache.get(("k",), lambda: body(b"fast")) == b"fast"
+        assert cache.refinements == 0
+
+    asyncio.run(scenario())
+
+
+def test_cache_evicts_least_recently_used_bodies():
+    async def body(data):
+        return data
+
+    async def scenario():
+        cache = CompressedBodyCache(max_bytes=10)
+        await cache.get(("a",), lambda: body(b"aaaa"))
+        await cache.get(("b",), lambda: body(b"bbbb"))
+        await cache.get(("a",), lambda: body(b"aaaa"))
+        await cache.get(("c",), lambda: body(b"cccc"))
+        await cache.get(("big",), lambda: body(b"x" * 11))
+        assert (len(cache), cache.bytes, cache.evictions) == (2, 8, 1)
+        assert cache.stats()["entries"] == 2
+
+    asyncio.run(scenario())
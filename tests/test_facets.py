@@ -0,0 +1,77 @@
+import math
+from collections import Counter
+
+from facets import MAX_FACET_VALUES, PRICE_BOUNDARIES, FacetSummary, facets_from_aggregation, price_bucket
+
+PRODUCTS = [
+    {"id": "p1", "category": "crystals", "materials": ["Quartz"], "origin": "Brazil", "price": 12.0,
+     "in_stock": True},
+    {"id": "p2", "category": "crystals", "materials": ["Quartz", "Silver"], "origin": "India", "price": 25.0,
+     "in_stock": False},
+    {"id": "p3", "category": "amulets", "materials": ["Silver"], "origin": "", "price": 99.99, "in_stock": True},
+    {"id": "p4", "category": "talismans", "materials": [], "price": 250.0, "in_stock": True},
+    {"id": "p5", "category": "amulets", "materials": ["Brass", "Silver"], "origin": "Brazil", "price": 0,
+     "in_stock": True},
+]
+
+
+def aggregate(products):
+    """What facet_pipeline returns for ``products``, computed without MongoDB."""
+    def grouped(values, limit=None):
+        rows = sorted(Counter(values).items(), key=lambda item: (-item[1], item[0]))
+        return [{"_id": value, "count": count} for value, count in rows[:limit]]
+
+    prices = Counter()
+    for product in products:
+        bucket = max(lower for lower in [*PRICE_BOUNDARIES, math.inf] if product["price"] >= lower)
+        prices[bucket] += 1
+    return {
+        "total": [{"count": len(products)}] if products else [],
+        "category": grouped(product["category"] for product in products),
+        "materials": grouped((material for product in products for material in product["materials"]),
+                             MAX_FACET_VALUES),
+        "origin": grouped((product["origin"] for product in products if product.get("origin")),
+                          MAX_FACET_VALUES),
+        "price": [{"_id": lower, "count": count} for lower, count in sorted(prices.items())],
+        "in_stock": grouped(product["in_stock"] for product in products),
+    }
+
+
+def summary(products):
+    facets = FacetSummary()
+    for product in products:
+        facets.add(product)
+    return facets
+
+
+def test_summary_matches_aggregation():
+    assert summary(PRODUCTS).snapshot() == facets_from_aggregation(aggregate(PRODUCTS))
+
+
+def test_summary_matches_aggregation_after_updates_and_removals():
+    facets = summary(PRODUCTS)
+    moved = {**PRODUCTS[0], "category": "amulets", "materials": ["Brass"], "price": 60.0, "in_stock": False}
+    facets.add(moved)
+    facets.remove("p3")
+    facets.remove("missing")
+    remaining = [moved, *(product for product in PRODUCTS[1:] if product["id"] != "p3")]
+    assert facets.snapshot() == facets_from_aggregation(aggregate(remaining))
+
+
+def test_empty_catalog_matches_empty_aggregation():
+    expected = facets_from_aggregation(aggregate([]))
+    assert FacetSummary().snapshot() == expected
+    assert expected["total"] == 0
+    assert [bucket["count"] for bucket in expected["price"]] == [0] * len(PRICE_BOUNDARIES)
+
+
+def test_price_buckets():
+    assert [price_bucket(price) for price in (0, 24.99, 25, 199, 200, 10_000)] == [0, 0, 1, 3, 4, 4]
+    assert price_bucket(-1) is None
+
+
+def test_subset_matches_aggregation_over_those_products():
+    full = summary(PRODUCTS)
+    chosen = [product for product in PRODUCTS if product["id"] in {"p2", "p3", "p5"}]
+    assert full.subset(["p2", "p3", "p5", "missing"]).snapshot() == facets_from_aggregation(aggregate(chosen))
+    assert full.subset([]).snapshot() == facets_from_aggregation(aggregate([]))
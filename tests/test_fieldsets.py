@@ -0,0 +1,62 @@
+import pytest
+
+from fieldsets import PRODUCT_FIELDS, VIEWS, InvalidFieldset, parse_fields, resolve_fieldset
+
+PRODUCT = {
+    "id": "p1", "name": "Rose Quartz", "description": "x" * 150, "price": 12.5, "category": "crystals",
+    "image_url": "http://img/p1.png", "spiritual_benefits": ["Love", "Calm", "Healing"],
+    "materials": ["Quartz"], "origin": "Brazil", "featured": True, "in_stock": False,
+    "created_at": "2024-01-01T00:00:00", "updated_at": "2024-02-01T00:00:00",
+}
+
+
+def test_card_projection_trims_in_mongo():
+    projection = VIEWS["card"].projection()
+    assert projection["_id"] == 0
+    assert projection["description"] == {"$substrCP": ["$description", 0, 100]}
+    assert projection["spiritual_benefits"] == {"$slice": 2}
+    assert projection["name"] == 1
+    assert "materials" not in projection and "created_at" not in projection
+
+
+def test_required_fields_are_projected_and_stripped_again():
+    fieldset = parse_fields("name,price")
+    assert fieldset.projection("id", "created_at") == {"_id": 0, "id": 1, "created_at": 1, "name": 1, "price": 1}
+    loaded = {"id": "p1", "created_at": "2024-01-01", "name": "Rose Quartz", "price": 12.5}
+    assert fieldset.strip(loaded) == {"name": "Rose Quartz", "price": 12.5}
+
+
+def test_apply_trims_loaded_documents_like_the_projection():
+    card = VIEWS["card"].apply(PRODUCT)
+    assert list(card) == list(VIEWS["card"].names)
+    assert card["description"] == "x" * 100
+    assert card["spiritual_benefits"] == ["Love", "Calm"]
+    assert VIEWS["card"].apply({**PRODUCT, "description": None})["description"] is None
+
+
+def test_detail_view_drops_only_timestamps():
+    detail = VIEWS["detail"].apply(PRODUCT)
+    assert set(detail) == set(PRODUCT_FIELDS) - {"created_at", "updated_at"}
+    assert detail["description"] == PRODUCT["description"]
+
+
+def test_parse_fields_keeps_request_order_without_duplicates():
+    fieldset = parse_fields(" price, name ,price,, ")
+    assert fieldset.names == ("price", "name")
+    assert fieldset.name == "fields:price,name"
+
+
+@pytest.mark.parametrize("view, fields, message", [
+    (None, "name,secret", "Unknown fields: secret"),
+    (None, " , ", "at least one field"),
+    ("card", "name", "either view or fields"),
+])
+def test_invalid_requests_are_rejected(view, fields, message):
+    with pytest.raises(InvalidFieldset, match=message):
+        resolve_fieldset(view, fields)
+
+
+def test_resolve_fieldset():
+    assert resolve_fieldset(None, None) is None
+    assert resolve_fieldset("card", None) is VIEWS["card"]
+    assert resolve_fieldset(None, "id").names == ("id",)
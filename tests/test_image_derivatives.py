@@ -0,0 +1,118 @@
+import asyncio
+import io
+import os
+
+import pytest
+
+from image_derivatives import WIDTHS, DirectoryOrigin, DiskLRU, ImageDerivatives, OriginError, bucket, negotiate
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def png(width, height):
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 120, 160)).save(out, format="PNG")
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("width, expected", [(None, 1280), (1, 160), (160, 160), (161, 320), (5000, 1280)])
+def test_bucket_rounds_up_to_a_derivative_width(width, expected):
+    assert bucket(width) == expected
+    assert expected in WIDTHS
+
+
+def test_negotiate_prefers_avif_then_webp():
+    assert negotiate("image/avif,image/webp,*/*", ("avif", "webp")) == "avif"
+    assert negotiate("IMAGE/WEBP", ("avif", "webp")) == "webp"
+    assert negotiate("*/*", ("avif", "webp")) == "webp"
+    assert negotiate("image/avif", ("webp",)) == "webp"
+    assert negotiate("image/avif", ()) is None
+
+
+def test_disk_lru_evicts_least_recently_used(tmp_path):
+    async def scenario():
+        cache = DiskLRU(tmp_path, max_bytes=10)
+        await cache.put("a", b"aaaa")
+        await cache.put("b", b"bbbb")
+        assert await cache.get("a") == b"aaaa"
+        await cache.put("c", b"cccc")
+        assert await cache.get("b") is None
+        assert await cache.get("a") == b"aaaa" and await cache.get("c") == b"cccc"
+        assert (cache.bytes, cache.evictions, len(cache)) == (8, 1, 2)
+        assert not (tmp_path / "b").exists()
+
+        await cache.put("a", b"a")
+        assert cache.bytes == 5
+        await cache.discard("c")
+        assert (cache.bytes, len(cache)) == (1, 1) and not (tmp_path / "c").exists()
+        # A file removed by another worker is a miss
+        os.unlink(tmp_path / "a")
+        assert await cache.get("a") is None and cache.bytes == 0
+
+    asyncio.run(scenario())
+
+
+def test_disk_lru_reloads_directory_within_budget(tmp_path):
+    for age, name in enumerate(["old", "mid", "new"]):
+        (tmp_path / name).write_bytes(b"1234")
+        os.utime(tmp_path / name, (1000 + age, 1000 + age))
+    (tmp_path / "partial.tmp").write_bytes(b"123456789")
+    cache = DiskLRU(tmp_path, max_bytes=8)
+    assert (len(cache), cache.bytes) == (2, 8)
+    assert not (tmp_path / "old").exists()
+
+
+def test_disk_lru_keeps_one_file_over_budget(tmp_path):
+    async def scenario():
+        cache = DiskLRU(tmp_path, max_bytes=2)
+        await cache.put("big", b"123456")
+        assert await cache.get("big") == b"123456"
+
+    asyncio.run(scenario())
+
+
+def test_derivatives_are_resized_cached_and_fetched_once(tmp_path):
+    sources = tmp_path / "sources"
+    sources.mkdir()
+    (sources / "stone.png").write_bytes(png(800, 400))
+
+    async def scenario():
+        derivatives = ImageDerivatives(tmp_path / "cache", DirectoryOrigin(sources), workers=1)
+        try:
+            url = "https://images.example/catalog/stone.png"
+            (name, data), (_, again) = await asyncio.gather(
+                derivatives.get(url, 320, "webp"), derivatives.get(url, 320, "webp"))
+            assert name.endswith("-w320.webp") and data == again
+            assert Image.open(io.BytesIO(data)).size == (320, 160)
+            _, larger = await derivatives.get(url, 1280, "webp")
+            assert Image.open(io.BytesIO(larger)).size == (800, 400)
+            await derivatives.get(url, 320, "webp")
+            stats = derivatives.stats()
+            assert (stats["origin_fetches"], stats["resizes"], stats["hits"]) == (1, 2, 1)
+        finally:
+            await derivatives.close()
+
+    asyncio.run(scenario())
+
+
+def test_undecodable_source_is_an_origin_error_and_not_kept(tmp_path):
+    sources = tmp_path / "sources"
+    sources.mkdir()
+    (sources / "broken.png").write_bytes(b"not an image")
+
+    async def scenario():
+        derivatives = ImageDerivatives(tmp_path / "cache", DirectoryOrigin(sources), workers=1)
+        try:
+            url = "https://images.example/broken.png"
+            with pytest.raises(OriginError, match="could not be decoded"):
+                await derivatives.get(url, 160, "webp")
+            assert len(derivatives.cache) == 0
+            with pytest.raises(OriginError, match="No local file"):
+                await derivatives.get("https://images.example/", 160, "webp")
+            with pytest.raises(OriginError, match="failed"):
+                await derivatives.get("https://images.example/missing.png", 160, "webp")
+            assert derivatives.stats()["origin_failures"] == 2
+        finally:
+            await derivatives.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,39 @@
+from indexes import INDEXES, QUERY_SHAPES
+
+# Listings filtering on both flags are served by a single-flag index (see indexes.py)
+PARTIALLY_COVERED = {"featured", "in_stock"}
+
+
+def equality_fields(query):
+    return {name for name, value in query.items() if not isinstance(value, dict) and not name.startswith("$")}
+
+
+def serving_index(shape):
+    """The index whose equality prefix and sort keys serve ``shape``, and the filters it leaves over."""
+    sort_fields = [name for name, _ in shape.sort]
+    equalities = equality_fields(shape.filter)
+    best = None
+    for spec in INDEXES:
+        fields = [name for name, _ in spec.keys]
+        prefix, order = fields[:-len(sort_fields)], fields[-len(sort_fields):]
+        if spec.collection == shape.collection and order == sort_fields and set(prefix) <= equalities:
+            if best is None or len(prefix) > len(best[1]):
+                best = (spec, prefix)
+    return best and (best[0], equalities - set(best[1]))
+
+
+def test_every_sorted_listing_has_an_index_in_its_sort_order():
+    for shape in QUERY_SHAPES:
+        if shape.collection != "products" or not shape.sort or "$and" in shape.filter:
+            continue
+        served = serving_index(shape)
+        assert served is not None, shape.name
+        spec, unfiltered = served
+        if unfiltered:
+            assert equality_fields(shape.filter) >= PARTIALLY_COVERED, (shape.name, spec.name, unfiltered)
+            assert len(unfiltered) == 1, (shape.name, spec.name, unfiltered)
+
+
+def test_index_and_shape_names_are_unique():
+    assert len({spec.name for spec in INDEXES}) == len(INDEXES)
+    assert len({shape.name for shape in QUERY_SHAPES}) == len(QUERY_SHAPES)
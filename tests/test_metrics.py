@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from metrics import (
+    CommandMetricsListener, Registry, RequestTiming, http_request_duration, mongo_command_duration,
+    request_timing, timed,
+)
+
+
+def sample(metric, suffix=""):
+    """``{line before the value: value}`` for every sample of ``metric``."""
+    lines = [line for line in metric.render() if not line.startswith("#")]
+    return {line.rsplit(" ", 1)[0]: line.rsplit(" ", 1)[1] for line in lines if suffix in line}
+
+
+def test_counter_and_gauge_render_per_label_set():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    requests.inc(1, "/a")
+    requests.inc(2.5, "/a")
+    requests.inc(1, "/b")
+    in_flight = registry.gauge("in_flight", "In flight")
+    in_flight.inc(3)
+    in_flight.dec(1)
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/a"} 3.5' in text
+    assert 'requests_total{route="/b"} 1' in text
+    assert "in_flight 2\n" in text
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("odd_total", "Odd labels", ("value",)).inc(1, 'a"b\\c\nd')
+    assert 'odd_total{value="a\\"b\\\\c\\nd"} 1' in registry.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, "/a")
+    samples = sample(latency)
+    assert samples['latency_seconds_bucket{route="/a",le="0.1"}'] == "2"
+    assert samples['latency_seconds_bucket{route="/a",le="1"}'] == "3"
+    assert samples['latency_seconds_bucket{route="/a",le="+Inf"}'] == "4"
+    assert samples['latency_seconds_count{route="/a"}'] == "4"
+    assert float(samples['latency_seconds_sum{route="/a"}']) == pytest.approx(3.65)
+
+
+def test_callback_gauge_reads_values_at_scrape_time():
+    registry = Registry()
+    size = {"value": 1}
+    registry.callback("cache_size", "Entries", lambda: size["value"])
+    registry.callback("cache_events_total", "Lookups", lambda: {("hit",): 3, ("miss",): 1}, ("outcome",),
+                      kind="counter")
+    size["value"] = 7
+    text = registry.render()
+    assert "cache_size 7\n" in text
+    assert "# TYPE cache_events_total counter" in text
+    assert 'cache_events_total{outcome="hit"} 3' in text
+
+
+def test_timed_blocks_add_up_per_request():
+    timing = RequestTiming()
+    token = request_timing.set(timing)
+    try:
+        with timed("render"):
+            pass
+        with timed("render"):
+            pass
+    finally:
+        request_timing.reset(token)
+    with timed("outside"):
+        pass
+    assert list(timing.durations) == ["render"]
+    header = timing.header(0.002)
+    assert header.startswith("render;dur=") and header.endswith("total;dur=2.00")
+
+
+def test_command_listener_times_commands_and_charges_the_request():
+    listener = CommandMetricsListener()
+    timing = RequestTiming()
+    token = request_timing.set(timing)
+    try:
+        listener.started(SimpleNamespace(command_name="find", command={"find": "test_products"},
+                                         connection_id=("h", 1), request_id=7))
+        listener.succeeded(SimpleNamespace(command_name="find", connection_id=("h", 1), request_id=7,
+                                           duration_micros=2500))
+    finally:
+        request_timing.reset(token)
+    assert timing.durations["db"] == 0.0025
+    assert sample(mongo_command_duration, "_count")[
+        'mongodb_command_duration_seconds_count{collection="test_products",command="find",outcome="success"}'] == "1"
+
+
+def test_middleware_records_route_template_and_status():
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+    from starlette.testclient import TestClient
+
+    from metrics import MetricsMiddleware
+
+    async def item(request):
+        await asyncio.sleep(0)
+        return PlainTextResponse("ok", status_code=201)
+
+    app = Starlette(routes=[Route("/test-items/{item_id}", item)])
+    app.add_middleware(MetricsMiddleware, server_timing=True)
+    response = TestClient(app).get("/test-items/42")
+    assert response.status_code == 201
+    assert "total;dur=" in response.headers["server-timing"]
+    key = 'http_request_duration_seconds_count{method="GET",route="/test-items/{item_id}",status="201"}'
+    assert sample(http_request_duration, "_count")[key] == "1"
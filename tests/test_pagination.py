@@ -0,0 +1,75 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter
+
+
+def raw_cursor(payload: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("order, value", [
+    ("created_at", datetime(2024, 5, 1, 12, 30, 15, 250000)),
+    ("-created_at", datetime(2023, 1, 1)),
+    ("price", 19.99),
+    ("-price", 20),
+    ("name", "Rose Quartz"),
+    ("-name", ""),
+    ("relevance", 3.25),
+])
+def test_cursor_round_trips(order, value):
+    assert decode_cursor(encode_cursor(order, value, "p-1"), order) == (value, "p-1")
+
+
+def test_cursor_is_url_safe_without_padding():
+    cursor = encode_cursor("name", "Amethyst ~~~ ???", "p-1")
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+
+def test_cursor_from_another_ordering_is_rejected():
+    with pytest.raises(InvalidCursor, match="different ordering"):
+        decode_cursor(encode_cursor("price", 10.0, "p-1"), "-price")
+
+
+@pytest.mark.parametrize("order, cursor", [
+    ("price", "not base64!"),
+    ("price", base64.urlsafe_b64encode(b"not json").decode()),
+    ("price", raw_cursor({"o": "price", "v": 10})),
+    ("created_at", raw_cursor({"o": "created_at", "v": "yesterday", "i": "p-1"})),
+])
+def test_malformed_cursor_is_rejected(order, cursor):
+    with pytest.raises(InvalidCursor, match="Malformed"):
+        decode_cursor(cursor, order)
+
+
+@pytest.mark.parametrize("order, value", [
+    ("price", "10"),
+    ("price", True),
+    ("price", None),
+    ("relevance", [1]),
+    ("name", 5),
+    ("created_at", 1700000000),
+])
+def test_cursor_value_of_wrong_type_is_rejected(order, value):
+    with pytest.raises(InvalidCursor, match="Malformed"):
+        decode_cursor(raw_cursor({"o": order, "v": value, "i": "p-1"}), order)
+
+
+def test_non_finite_cursor_value_is_rejected():
+    cursor = base64.urlsafe_b64encode(b'{"o":"price","v":Infinity,"i":"p-1"}').decode()
+    with pytest.raises(InvalidCursor, match="Malformed"):
+        decode_cursor(cursor, "price")
+
+
+def test_keyset_filter_continues_after_position():
+    assert keyset_filter("price", 10.0, "p-1") == {"$or": [
+        {"price": {"$gt": 10.0}},
+        {"price": 10.0, "id": {"$gt": "p-1"}},
+    ]}
+    assert keyset_filter("name", "m", "p-1", descending=True) == {"$or": [
+        {"name": {"$lt": "m"}},
+        {"name": "m", "id": {"$lt": "p-1"}},
+    ]}
@@ -0,0 +1,173 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from pydantic import BaseModel
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from catalog_events import CatalogEvents
+from product_ingest import LineTooLong, ProductIngester, iter_csv_rows, iter_lines, iter_ndjson_rows
+
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+def parse(parser, *parts: bytes, **options):
+    return asyncio.run(collect(parser(iter_lines(chunks(*parts), **options))))
+
+
+def test_lines_are_split_across_chunk_boundaries():
+    lines = asyncio.run(collect(iter_lines(chunks(b"fir", b"st\r\nsec", b"ond\nthird"))))
+    assert lines == ["first", "second", "third"]
+
+
+def test_undecodable_line_becomes_a_row_error():
+    rows = parse(iter_ndjson_rows, b'{"name": "a"}\n\xff\xfe\n{"name": "b"}\n')
+    assert rows[0] == (1, {"name": "a"})
+    assert rows[1][0] == 2 and "UTF-8" in str(rows[1][1])
+    assert rows[2] == (3, {"name": "b"})
+
+
+def test_ndjson_reports_bad_json_and_skips_blank_lines():
+    rows = parse(iter_ndjson_rows, b'{"name": "a"}\n\n{oops\n')
+    assert rows[0] == (1, {"name": "a"})
+    assert rows[1][0] == 3 and isinstance(rows[1][1], ValueError)
+
+
+def test_line_longer_than_the_cap_stops_the_upload():
+    with pytest.raises(LineTooLong) as error:
+        parse(iter_ndjson_rows, b'{"name": "a"}\n', b"x" * 40, b"x" * 40, max_bytes=64)
+    assert error.value.line == 2
+    with pytest.raises(LineTooLong):
+        parse(iter_ndjson_rows, b"y" * 100 + b"\n", max_bytes=64)
+
+
+def test_csv_splits_list_columns_and_drops_empty_cells():
+    rows = parse(iter_csv_rows, b"name,price,materials,origin\nRose Quartz,12.5,Quartz| Silver ,\n")
+    assert rows == [(2, {"name": "Rose Quartz", "price": "12.5", "materials": ["Quartz", "Silver"]})]
+
+
+def test_csv_quoted_fields_may_span_lines():
+    rows = parse(iter_csv_rows, b'name,description\n"Heart","Polished\n""rose"" quartz"\nCoin,Brass\n')
+    assert rows == [
+        (2, {"name": "Heart", "description": 'Polished\n"rose" quartz'}),
+        (4, {"name": "Coin", "description": "Brass"}),
+    ]
+
+
+def test_csv_row_errors():
+    rows = parse(iter_csv_rows, b'name,price\nonly-one\nA,1\n"unterminated,2\n')
+    assert isinstance(rows[0][1], ValueError) and "Expected 2 columns" in str(rows[0][1])
+    assert rows[1] == (3, {"name": "A", "price": "1"})
+    assert rows[2][0] == 4 and "Unterminated" in str(rows[2][1])
+
+
+class FakeResult:
+    def __init__(self, details):
+        self.bulk_api_result = details
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents[:length]
+
+
+class FakeProducts:
+    """Applies InsertOne/UpdateOne requests the way the bulk writes use them."""
+
+    def __init__(self, duplicate_ids=()):
+        self.documents = {}
+        self.duplicate_ids = set(duplicate_ids)
+
+    async def bulk_write(self, requests, ordered=True):
+        details = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "writeErrors": []}
+        for index, request in enumerate(requests):
+            if isinstance(request, InsertOne):
+                document = request._doc
+                if document["id"] in self.duplicate_ids:
+                    details["writeErrors"].append({"index": index, "errmsg": "duplicate key"})
+                    continue
+                self.documents[document["id"]] = dict(document)
+                details["nInserted"] += 1
+            else:
+                product_id = request._filter["id"]
+                existing = self.documents.get(product_id)
+                if existing is None:
+                    existing = self.documents[product_id] = {"id": product_id, **request._doc["$setOnInsert"]}
+                    details["nUpserted"] += 1
+                else:
+                    details["nMatched"] += 1
+                existing.update(request._doc["$set"])
+        if details["writeErrors"]:
+            raise BulkWriteError(details)
+        return FakeResult(details)
+
+    def find(self, query, projection=None):
+        ids = query["id"]["$in"]
+        return FakeCursor([{name: self.documents[product_id][name] for name in ("id", "created_at")}
+                           for product_id in ids if product_id in self.documents])
+
+
+class Row(BaseModel):
+    name: str
+
+
+def validate(row):
+    Row(**row)
+    return {"id": row.get("id", row["name"]), "name": row["name"], "created_at": row["created_at"]}, "id" in row
+
+
+def ingest(collection, rows, batch_size=2):
+    events = CatalogEvents()
+    published = []
+
+    async def record(change):
+        published.append(change)
+
+    events.subscribe(record)
+    ingester = ProductIngester(collection, validate, events=events, batch_size=batch_size)
+
+    async def rows_of():
+        for number, row in enumerate(rows, start=1):
+            yield number, row
+
+    return asyncio.run(ingester.ingest(rows_of())), published
+
+
+def test_ingest_counts_writes_and_reports_bad_rows():
+    collection = FakeProducts(duplicate_ids=["dup"])
+    now = datetime(2024, 1, 1)
+    stats, published = ingest(collection, [
+        {"name": "a", "created_at": now},
+        ValueError("bad line"),
+        {"price": 1},
+        {"name": "dup", "created_at": now},
+        ["not", "a", "row"],
+        {"name": "b", "created_at": now},
+    ])
+    assert (stats.received, stats.inserted, stats.failed) == (6, 2, 4)
+    assert sorted(error["line"] for error in stats.errors) == [2, 3, 4, 5]
+    assert sorted(product["id"] for change in published for product in change.upserted) == ["a", "b"]
+
+
+def test_upsert_publishes_the_stored_created_at():
+    first, later = datetime(2024, 1, 1), datetime(2025, 6, 1)
+    collection = FakeProducts()
+    ingest(collection, [{"id": "p1", "name": "Old", "created_at": first}])
+    stats, published = ingest(collection, [{"id": "p1", "name": "New", "created_at": later},
+                                           {"id": "p2", "name": "Other", "created_at": later}])
+    assert (stats.inserted, stats.updated) == (1, 1)
+    assert collection.documents["p1"]["created_at"] == first
+    by_id = {product["id"]: product for product in published[0].upserted}
+    assert by_id["p1"]["created_at"] == first and by_id["p1"]["name"] == "New"
+    assert by_id["p2"]["created_at"] == later
@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from catalog_events import CatalogChange
+from read_routing import ReadDistributionListener, ReadRouter, read_preference
+
+
+class FakeCollection:
+    def __init__(self, options=None):
+        self.options = options or {}
+
+    def with_options(self, **options):
+        return FakeCollection(options)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_read_preference_modes():
+    assert isinstance(read_preference("primary", 90), Primary)
+    preference = read_preference("secondaryPreferred", 90)
+    assert isinstance(preference, SecondaryPreferred) and preference.max_staleness == 90
+    assert read_preference("nearest").max_staleness == -1
+    with pytest.raises(ValueError, match="Unknown read preference"):
+        read_preference("closest")
+
+
+def test_primary_preference_always_reads_the_primary():
+    collection = FakeCollection()
+    router = ReadRouter(collection, Primary())
+    assert router.collection() is collection
+    assert router.routed == {"primary": 1}
+
+
+def test_reads_go_to_secondaries_until_a_write():
+    collection, clock = FakeCollection(), FakeClock()
+    router = ReadRouter(collection, SecondaryPreferred(max_staleness=90), pin_seconds=1,
+                        heartbeat_seconds=10, clock=clock)
+    assert router.secondary.options["read_preference"].max_staleness == 90
+    assert router.collection() is router.secondary
+    asyncio.run(router.on_catalog_change(CatalogChange(upserted=[{"id": "p1"}])))
+    assert router.collection() is router.primary
+
+
+def test_pin_covers_the_staleness_bound_plus_a_heartbeat():
+    clock = FakeClock()
+    router = ReadRouter(FakeCollection(), SecondaryPreferred(max_staleness=90), pin_seconds=1,
+                        heartbeat_seconds=10, clock=clock)
+    assert router.pin_seconds == 100
+    # Writes seen from other workers pin too
+    asyncio.run(router.on_catalog_change(CatalogChange(upserted=[{"id": "p1"}], local=False)))
+    clock.now += 99.9
+    assert router.collection() is router.primary
+    clock.now += 0.1
+    assert router.collection() is router.secondary
+    assert router.routed == {"primary": 1, "secondary": 1}
+
+
+def test_unbounded_staleness_keeps_the_configured_pin():
+    router = ReadRouter(FakeCollection(), SecondaryPreferred(), pin_seconds=3)
+    assert router.pin_seconds == 3
+
+
+def test_listener_counts_reads_per_server():
+    listener = ReadDistributionListener()
+    for command, address in [("find", ("a", 27017)), ("getMore", ("a", 27017)), ("insert", ("a", 27017)),
+                             ("aggregate", ("b", 27017)), ("find", ("c", 27017))]:
+        listener.succeeded(SimpleNamespace(command_name=command, connection_id=address))
+    servers = {("a", 27017): SimpleNamespace(server_type_name="RSPrimary"),
+               ("b", 27017): SimpleNamespace(server_type_name="RSSecondary")}
+    topology = SimpleNamespace(server_descriptions=lambda: servers)
+    assert listener.samples(topology) == {
+        ("a:27017", "RSPrimary"): 2,
+        ("b:27017", "RSSecondary"): 1,
+        ("c:27017", "Unknown"): 1,
+    }
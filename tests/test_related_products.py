@@ -0,0 +1,154 @@
+import asyncio
+import math
+import random
+
+import numpy as np
+import pytest
+
+from catalog_events import CatalogChange
+from related_products import (FEATURE_WEIGHTS, PRICE_OCTAVE_ANGLE, PRICE_OCTAVES, NeighbourTable, RelatedProducts,
+                              price_angle, product_features)
+
+BENEFITS = ["Love", "Calm", "Clarity", "Protection", "Grounding", "Healing"]
+MATERIALS = ["Quartz", "Silver", "Brass", "Amethyst", "Wood"]
+CATEGORIES = ["crystals", "amulets", "talismans", "healing_stones"]
+
+
+def random_product(rng, product_id):
+    return {
+        "id": product_id,
+        "spiritual_benefits": rng.sample(BENEFITS, rng.randint(0, 3)),
+        "materials": rng.sample(MATERIALS, rng.randint(0, 2)),
+        "category": rng.choice(CATEGORIES),
+        "price": round(rng.uniform(0.5, 400), 2),
+    }
+
+
+def cosine(a, b):
+    return len(set(a) & set(b)) / math.sqrt(len(a) * len(b)) if a and b else 0.0
+
+
+def similarity(a, b):
+    """The weighted per-group similarity the table vectors encode."""
+    return (FEATURE_WEIGHTS["spiritual_benefits"] * cosine(a[0], b[0])
+            + FEATURE_WEIGHTS["materials"] * cosine(a[1], b[1])
+            + FEATURE_WEIGHTS["category"] * (a[2] == b[2])
+            + FEATURE_WEIGHTS["price"] * math.cos(price_angle(a[3]) - price_angle(b[3])))
+
+
+def assert_exact(table, features):
+    """Every list holds the best ``k`` scores, and each score belongs to its neighbour."""
+    for product_id, own in features.items():
+        row = table.rows[product_id]
+        expected = sorted((similarity(own, other) for other_id, other in features.items() if other_id != product_id),
+                          reverse=True)[:table.k]
+        neighbours = [table.row_ids[neighbour] for neighbour in table.neighbours[row] if neighbour >= 0]
+        scores = table.scores[row, :len(neighbours)]
+        assert scores.tolist() == pytest.approx(expected, abs=1e-5), product_id
+        assert [similarity(own, features[other]) for other in neighbours] == pytest.approx(scores.tolist(), abs=1e-5)
+        assert product_id not in neighbours
+
+
+def catalog(seed, size):
+    rng = random.Random(seed)
+    return {f"p{number}": product_features(random_product(rng, f"p{number}")) for number in range(size)}
+
+
+def test_price_angle_is_clamped_to_the_octave_range():
+    assert price_angle(0) == price_angle(1.0) == 0
+    assert price_angle(2.0) == pytest.approx(PRICE_OCTAVE_ANGLE)
+    assert price_angle(1e9) == pytest.approx(PRICE_OCTAVES * PRICE_OCTAVE_ANGLE)
+
+
+def test_product_features_drop_duplicates_and_default_missing_values():
+    assert product_features({"category": "amulets", "spiritual_benefits": ["Love", "Love"]}) == (
+        ("Love",), (), "amulets", 0.0)
+
+
+@pytest.mark.parametrize("batch_elements", [1 << 22, 7])
+def test_build_matches_brute_force(batch_elements):
+    features = catalog(1, 120)
+    table = NeighbourTable.build(features, 5, FEATURE_WEIGHTS, batch_elements)
+    assert len(table) == 120
+    assert_exact(table, features)
+
+
+def test_small_catalogs_list_every_other_product():
+    features = catalog(2, 3)
+    table = NeighbourTable.build(features, 5, FEATURE_WEIGHTS)
+    assert all(len(table.related(product_id, 5)) == 2 for product_id in features)
+    assert table.related("missing", 5) is None
+
+
+def test_updates_keep_lists_exact():
+    rng = random.Random(3)
+    features = catalog(3, 80)
+    table = NeighbourTable.build(features, 4, FEATURE_WEIGHTS, batch_elements=64)
+    for round_number in range(5):
+        changes = {}
+        for product_id in rng.sample(sorted(features), 6):
+            changes[product_id] = None if rng.random() < 0.4 else product_features(random_product(rng, product_id))
+        for number in range(3):
+            product_id = f"new{round_number}-{number}"
+            changes[product_id] = product_features(random_product(rng, product_id))
+        table.install(table.update(changes))
+        for product_id, changed in changes.items():
+            if changed is None:
+                features.pop(product_id, None)
+            else:
+                features[product_id] = changed
+        assert set(table.rows) == set(features)
+        assert_exact(table, features)
+    # Rows of deleted products are reused
+    assert table.size < 80 + 15
+
+
+def test_unchanged_features_compute_nothing():
+    features = catalog(4, 20)
+    table = NeighbourTable.build(features, 3, FEATURE_WEIGHTS)
+    patch = table.update({"p0": features["p0"]})
+    assert not len(patch.rows) and not patch.added and not patch.deleted
+    assert isinstance(patch.neighbours, np.ndarray)
+
+
+def test_related_products_view_lifecycle():
+    rng = random.Random(5)
+    products = [random_product(rng, f"p{number}") for number in range(60)]
+
+    async def scenario():
+        view = RelatedProducts(k=3, debounce=0)
+        assert view.related("p0", 3) == []
+        view.rebuild(products)
+        # Loaded but not computed yet
+        assert not view.ready and view.related("p0", 3) == [] and view.related("missing", 3) is None
+        await view.refresh()
+        assert view.ready and view.stats()["builds"] == 1
+        assert len(view.related("p0", 3)) == 3 and len(view.related("p0", 1)) == 1
+
+        added = random_product(rng, "fresh")
+        await view.on_catalog_change(CatalogChange(upserted=[added], deleted=["p1"]))
+        assert view.stats()["pending"] == 2
+        assert view.related("fresh", 3) == []
+        await view.refresh()
+        stats = view.stats()
+        assert (stats["updates"], stats["pending"], stats["products"], stats["computed"]) == (1, 0, 60, 60)
+        assert view.related("p1", 3) is None and len(view.related("fresh", 3)) == 3
+        assert "p1" not in view.related("fresh", 3)
+        assert view.version == 2 and view.memory_bytes() > 0
+
+    asyncio.run(scenario())
+
+
+def test_writes_touching_much_of_the_catalog_rebuild_in_full():
+    rng = random.Random(6)
+    products = [random_product(rng, f"p{number}") for number in range(40)]
+
+    async def scenario():
+        view = RelatedProducts(k=3, debounce=0)
+        view.rebuild(products)
+        await view.refresh()
+        await view.on_catalog_change(CatalogChange(deleted=[f"p{number}" for number in range(10)]))
+        await view.refresh()
+        assert (view.builds, view.updates, len(view)) == (2, 0, 30)
+
+    asyncio.run(scenario())
@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from search_index import SearchIndex, normalize_query
+
+PRODUCTS = [
+    {"id": "p1", "name": "Rose Quartz Heart", "description": "A heart of rose quartz",
+     "spiritual_benefits": ["Love"], "category": "crystals", "featured": True, "in_stock": True, "price": 30.0},
+    {"id": "p2", "name": "Rose Quartz Tumble", "description": "Tumbled stone",
+     "spiritual_benefits": ["Love"], "category": "crystals", "featured": False, "in_stock": False, "price": 8.0},
+    {"id": "p3", "name": "Quartz Pendant", "description": "Clear quartz on a chain",
+     "spiritual_benefits": ["Clarity"], "category": "spiritual_jewelry", "featured": False, "in_stock": True,
+     "price": 55.0},
+    {"id": "p4", "name": "Protection Amulet", "description": "Hand carved",
+     "spiritual_benefits": ["Protection"], "category": "amulets", "featured": True, "in_stock": True, "price": 45.0},
+]
+
+
+@pytest.fixture
+def index():
+    index = SearchIndex()
+    index.rebuild(PRODUCTS)
+    return index
+
+
+def ids(hits):
+    return [product_id for _, product_id in hits]
+
+
+def test_every_query_term_must_match(index):
+    assert set(ids(index.search("rose quartz"))) == {"p1", "p2"}
+    assert set(ids(index.search("quartz"))) == {"p1", "p2", "p3"}
+
+
+def test_last_term_matches_as_prefix(index):
+    assert set(ids(index.search("prot"))) == {"p4"}
+
+
+def test_benefits_are_searchable(index):
+    assert set(ids(index.search("love"))) == {"p1", "p2"}
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({"category": "crystals"}, {"p1", "p2"}),
+    ({"category": "spiritual_jewelry"}, {"p3"}),
+    ({"featured": True}, {"p1"}),
+    ({"in_stock": False}, {"p2"}),
+    ({"min_price": 10}, {"p1", "p3"}),
+    ({"max_price": 30}, {"p1", "p2"}),
+    ({"min_price": 10, "max_price": 50, "category": "crystals"}, {"p1"}),
+    ({"category": "amulets"}, set()),
+])
+def test_filters_apply_to_every_match(index, filters, expected):
+    assert set(index.match("quartz", **filters)) == expected
+    assert set(ids(index.search("quartz", **filters))) == expected
+
+
+def test_filters_apply_before_limit(index):
+    # The best-scoring match is filtered out, so the page must come from the rest
+    best = index.search("quartz", limit=1)
+    assert ids(best) != ["p3"]
+    assert ids(index.search("quartz", limit=1, category="spiritual_jewelry")) == ["p3"]
+
+
+def test_pages_after_a_position_cover_every_match_once(index):
+    everything = index.search("quartz")
+    seen, after = [], None
+    while True:
+        page = index.search("quartz", limit=1, after=after)
+        if not page:
+            break
+        seen.extend(page)
+        after = page[-1]
+    assert seen == everything
+    assert [score for score, _ in everything] == sorted((score for score, _ in everything), reverse=True)
+
+
+def test_query_without_tokens_matches_nothing(index):
+    assert normalize_query("!!!") == ""
+    assert index.search("!!!") == []
+
+
+def test_updates_and_removals_are_reflected(index):
+    index.add({**PRODUCTS[2], "category": "crystals"})
+    assert set(index.match("quartz", category="crystals")) == {"p1", "p2", "p3"}
+    index.remove("p1")
+    assert set(ids(index.search("rose"))) == {"p2"}
+    index.remove("p2")
+    assert index.search("rose") == []
+
+
+CREATED = datetime(2024, 1, 1)
+LARGE_CATALOG = [
+    {"id": f"p{number:05d}", "name": f"Quartz {number % 997:03d}", "description": "", "spiritual_benefits": [],
+     "category": "crystals", "featured": number % 2 == 0, "in_stock": True, "price": float(number % 101),
+     "created_at": CREATED + timedelta(minutes=number % 499)}
+    for number in range(30000)
+]
+
+
+@pytest.fixture(scope="module")
+def large_index():
+    index = SearchIndex()
+    index.rebuild(LARGE_CATALOG)
+    return index
+
+
+@pytest.mark.parametrize("sort", ["price", "name", "created_at"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_ordered_pages_follow_listing_order_over_a_large_hit_set(large_index, sort, descending):
+    expected = sorted(((product[sort], product["id"]) for product in LARGE_CATALOG if product["featured"]),
+                      reverse=descending)
+
+    pages, after = [], None
+    while True:
+        page = large_index.ordered("quartz", sort, 1000, after, descending, featured=True)
+        pages.extend(page)
+        if len(page) < 1000:
+            break
+        after = page[-1]
+    assert pages == expected
+
+
+def test_ordered_compares_aware_and_naive_creation_times():
+    index = SearchIndex()
+    index.rebuild([
+        {"id": "a", "name": "Quartz", "created_at": datetime(2024, 1, 1, 12)},
+        {"id": "b", "name": "Quartz", "created_at": datetime(2024, 1, 1, 13, tzinfo=timezone(timedelta(hours=2)))},
+    ])
+    assert ids(index.ordered("quartz", "created_at", 10)) == ["b", "a"]
+    assert ids(index.ordered("quartz", "created_at", 10, (datetime(2024, 1, 1, 11, 30), "z"))) == ["a"]
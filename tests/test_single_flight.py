@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_query():
+    flight = SingleFlight()
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ["result"]
+
+    async def main():
+        return await asyncio.gather(*(flight.run("key", query) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert results == [["result"]] * 5
+    assert results[0] is results[4]
+    assert flight.stats()["leaders"] == 1 and flight.stats()["coalesced"] == 4
+    assert len(flight) == 0
+
+
+def test_distinct_keys_and_later_calls_query_again():
+    flight = SingleFlight()
+    calls = []
+
+    async def query(key):
+        calls.append(key)
+        await asyncio.sleep(0)
+        return key
+
+    async def main():
+        first = await asyncio.gather(flight.run("a", lambda: query("a")), flight.run("b", lambda: query("b")))
+        second = await flight.run("a", lambda: query("a"))
+        return first, second
+
+    assert asyncio.run(main()) == (["a", "b"], "a")
+    assert calls == ["a", "b", "a"]
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("database down")
+
+    async def main():
+        return await asyncio.gather(*(flight.run("key", query) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert all(isinstance(result, RuntimeError) and str(result) == "database down" for result in results)
+    assert flight.stats()["failures"] == 1
+    assert len(flight) == 0
+
+
+def test_one_waiter_cancelling_does_not_cancel_the_others():
+    flight = SingleFlight()
+
+    async def query():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        leaving = asyncio.ensure_future(flight.run("key", query))
+        staying = asyncio.ensure_future(flight.run("key", query))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        return await staying
+
+    assert asyncio.run(main()) == "done"
+    assert flight.stats()["cancellations"] == 0
+
+
+def test_query_is_cancelled_once_every_waiter_is_gone():
+    flight = SingleFlight()
+
+    async def main():
+        started = asyncio.Event()
+        stopped = asyncio.Event()
+
+        async def query():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                stopped.set()
+                raise
+
+        waiter = asyncio.ensure_future(flight.run("key", query))
+        await started.wait()
+        waiter.cancel()
+        await asyncio.wait_for(stopped.wait(), 1)
+        return len(flight)
+
+    assert asyncio.run(main()) == 0
+    assert flight.stats()["cancellations"] == 1
+
+
+def test_disabled_runs_every_query():
+    flight = SingleFlight(enabled=False)
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+
+    async def main():
+        await asyncio.gather(flight.run("key", query), flight.run("key", query))
+
+    asyncio.run(main())
+    assert calls == 2
+    assert len(flight) == 0
@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from suggest_index import SuggestIndex
+
+CATEGORIES = {"crystals": "Crystals", "healing_stones": "Healing Stones"}
+
+
+def product(product_id, name, category="crystals", benefits=(), materials=(), featured=False):
+    return {"id": product_id, "name": name, "category": category, "featured": featured,
+            "spiritual_benefits": list(benefits), "materials": list(materials)}
+
+
+@pytest.fixture
+def index():
+    index = SuggestIndex(CATEGORIES)
+    index.rebuild([
+        product("p1", "Rose Quartz Heart", benefits=["Love"], materials=["Rose Quartz"]),
+        product("p2", "Clear Quartz Point", benefits=["Clarity"], materials=["Clear Quartz"]),
+        product("p3", "Lucky Coin", category="healing_stones", benefits=["Luck", "Love"], materials=["Brass"]),
+    ])
+    return index
+
+
+def texts(suggestions):
+    return [suggestion["text"] for suggestion in suggestions]
+
+
+def test_prefix_matches_the_start_of_any_word(index):
+    assert set(texts(index.suggest("qua"))) == {
+        "Rose Quartz Heart", "Rose Quartz", "Clear Quartz Point", "Clear Quartz"}
+    assert texts(index.suggest("heart")) == ["Rose Quartz Heart"]
+    assert index.suggest("uartz") == []
+
+
+def test_lookup_ignores_case_and_spacing(index):
+    assert texts(index.suggest("  ROSE   q")) == texts(index.suggest("rose q"))
+    assert set(texts(index.suggest("rose q"))) == {"Rose Quartz Heart", "Rose Quartz"}
+
+
+def test_suggestions_carry_kind_and_value(index):
+    by_text = {suggestion["text"]: suggestion for suggestion in index.suggest("l", limit=20)}
+    assert by_text["Love"] == {"text": "Love", "kind": "benefit", "value": "Love", "count": 2}
+    assert by_text["Lucky Coin"]["kind"] == "name"
+    assert index.suggest("heal")[0] == {
+        "text": "Healing Stones", "kind": "category", "value": "healing_stones", "count": 1}
+
+
+def test_more_popular_phrases_come_first(index):
+    assert texts(index.suggest("l"))[0] == "Love"
+    assert len(index.suggest("l", limit=2)) == 2
+
+
+def test_empty_categories_are_still_suggested():
+    index = SuggestIndex(CATEGORIES)
+    index.rebuild([])
+    assert texts(index.suggest("cry")) == ["Crystals"]
+
+
+def test_nothing_is_suggested_before_the_index_is_ready():
+    index = SuggestIndex(CATEGORIES)
+    index.add(product("p1", "Rose Quartz Heart"))
+    assert index.suggest("rose") == []
+    assert index.suggest("") == []
+
+
+def test_writes_after_the_build_are_suggested(index):
+    index.add(product("p4", "Quartz Cluster", featured=True))
+    assert "Quartz Cluster" in texts(index.suggest("clu"))
+    index.remove("p1")
+    assert set(texts(index.suggest("rose"))) == set()
+    index.add(product("p2", "Smoky Quartz Point", materials=["Smoky Quartz"]))
+    assert texts(index.suggest("clear")) == []
+    assert set(texts(index.suggest("smo"))) == {"Smoky Quartz Point", "Smoky Quartz"}
+
+
+def test_large_catalog_matches_brute_force():
+    rng = random.Random(7)
+    words = ["amber", "amethyst", "angel", "jade", "jasper", "moon", "moonstone", "obsidian", "onyx", "opal"]
+    products = [product(f"p{number}", " ".join(rng.sample(words, 2)).title(), featured=rng.random() < 0.1,
+                        materials=[rng.choice(words).title()])
+                for number in range(2000)]
+    index = SuggestIndex(max_limit=500)
+    index.rebuild(products[:1500])
+    for extra in products[1500:]:
+        index.add(extra)
+    phrases = {item["name"] for item in products} | {material for item in products for material in item["materials"]}
+    for prefix in ("a", "am", "moon", "o", "jas", "x"):
+        expected = {phrase for phrase in phrases
+                    if any(word.startswith(prefix) for word in phrase.lower().split())}
+        assert set(texts(index.suggest(prefix, limit=500))) == expected
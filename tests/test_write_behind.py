@@ -0,0 +1,123 @@
+import asyncio
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from write_behind import WriteBehindBuffer
+
+
+class FakeCollection:
+    name = "status_checks"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batches = []
+        self.failures = []
+
+    async def insert_many(self, documents, ordered=True):
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            raise self.failures.pop(0)
+        self.batches.append(list(documents))
+
+
+def numbered(count):
+    return [{"n": number} for number in range(count)]
+
+
+def test_flush_writes_in_batches():
+    async def main():
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, max_batch=3)
+        for document in numbered(7):
+            await buffer.add(document)
+        await buffer.flush()
+        return collection, buffer
+
+    collection, buffer = asyncio.run(main())
+    assert [len(batch) for batch in collection.batches] == [3, 3, 1]
+    assert buffer.stats() == {"pending": 0, "written": 7, "batches": 3, "failed_batches": 0, "dropped": 0}
+
+
+def test_failed_batch_is_retried_in_order():
+    async def main():
+        collection = FakeCollection()
+        collection.failures.append(AutoReconnect("down"))
+        buffer = WriteBehindBuffer(collection, max_batch=10)
+        for document in numbered(4):
+            await buffer.add(document)
+        await buffer.flush()
+        assert buffer.stats()["pending"] == 4
+        await buffer.add({"n": 4})
+        await buffer.flush()
+        return collection, buffer
+
+    collection, buffer = asyncio.run(main())
+    assert collection.batches == [numbered(5)]
+    assert buffer.stats()["failed_batches"] == 1
+
+
+def test_rejected_documents_are_dropped_and_duplicates_count_as_written():
+    async def main():
+        collection = FakeCollection()
+        collection.failures.append(BulkWriteError({"writeErrors": [
+            {"index": 0, "code": 11000, "errmsg": "duplicate key"},
+            {"index": 1, "code": 121, "errmsg": "validation failed"},
+        ]}))
+        buffer = WriteBehindBuffer(collection)
+        for document in numbered(3):
+            await buffer.add(document)
+        await buffer.flush()
+        return buffer
+
+    stats = asyncio.run(main()).stats()
+    assert (stats["written"], stats["dropped"], stats["pending"]) == (1, 1, 0)
+
+
+def test_add_waits_for_a_slow_flush_instead_of_growing():
+    async def main():
+        collection = FakeCollection(delay=0.01)
+        buffer = WriteBehindBuffer(collection, max_batch=5, max_delay=0.01, max_pending=10, max_wait=5)
+        buffer.start()
+        peak = 0
+        for document in numbered(100):
+            await buffer.add(document)
+            peak = max(peak, len(buffer._pending))
+        await buffer.close()
+        return collection, buffer, peak
+
+    collection, buffer, peak = asyncio.run(main())
+    assert peak <= 10
+    assert buffer.stats()["dropped"] == 0
+    assert [document for batch in collection.batches for document in batch] == numbered(100)
+
+
+def test_add_drops_the_oldest_document_when_mongo_stays_down():
+    async def main():
+        collection = FakeCollection()
+        collection.failures.extend(AutoReconnect("down") for _ in range(100))
+        buffer = WriteBehindBuffer(collection, max_batch=2, max_delay=0.01, max_pending=4, max_wait=0.02)
+        buffer.start()
+        for document in numbered(10):
+            await buffer.add(document)
+        stats = buffer.stats()
+        pending = list(buffer._pending)
+        buffer._task.cancel()
+        return stats, pending
+
+    stats, pending = asyncio.run(main())
+    assert stats["pending"] == 4
+    assert stats["dropped"] == 6
+    assert pending == numbered(10)[6:]
+
+
+def test_add_without_a_flusher_flushes_inline_when_full():
+    async def main():
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, max_batch=100, max_pending=3)
+        for document in numbered(5):
+            await buffer.add(document)
+        return collection, buffer
+
+    collection, buffer = asyncio.run(main())
+    assert collection.batches == [numbered(3)]
+    assert buffer.stats()["pending"] == 2